@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+
+class UserCache:
+    """
+    Bounded, thread-safe LRU of user rows with a time-to-live.
+
+    Entries are the raw field values, not model instances: every lookup
+    builds a fresh User so requests never share (and mutate) one object.
+    Saves and deletes invalidate entries in this process (accounts/signals.py);
+    the TTL bounds how stale other worker processes can be.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._field_names = None
+
+    def field_names(self):
+        if self._field_names is None:
+            self._field_names = [field.attname for field in User._meta.concrete_fields]
+        return self._field_names
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return User.from_db(DEFAULT_DB_ALIAS, self.field_names(), values)
+
+    def load(self, user_id):
+        """Return the user, from the cache or else the database (None if missing)"""
+        user = self.get(user_id)
+        if user is not None:
+            return user
+
+        values = (User.objects.filter(pk=user_id)
+                  .values_list(*self.field_names()).first())
+        if values is None:
+            return None
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return User.from_db(DEFAULT_DB_ALIAS, self.field_names(), values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    max_size=getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves users through the in-process user cache
+    instead of querying the database on every request, and rejects tokens
+    whose "ver" claim no longer matches the user's token_version.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = user_cache.load(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        # Tokens issued before the claim existed carry no version and are
+        # accepted until they expire
+        version = validated_token.get('ver')
+        if version is not None and version != user.token_version:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+        return user
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:48
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_existing_businesses(apps, schema_editor):
+    # Existing businesses become due on the scheduler's next run
+    User = apps.get_model('accounts', 'User')
+    User.objects.filter(user_type='business', next_report_at__isnull=True).update(
+        next_report_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_custom_reporting_days_user_reporting_frequency'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='next_report_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', 'next_report_at'], name='accounts_us_user_ty_c8cf2e_idx'),
+        ),
+        migrations.RunPython(schedule_existing_businesses, migrations.RunPython.noop),
+    ]
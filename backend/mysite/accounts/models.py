@@ -1,5 +1,9 @@
+from datetime import timedelta
+
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -16,6 +20,13 @@ class User(AbstractUser):
         ('custom', 'Custom'),
     )
 
+    REPORTING_INTERVAL_DAYS = {
+        'daily': 1,
+        '3days': 3,
+        'weekly': 7,
+        'monthly': 30,
+    }
+
     email = models.EmailField(unique=True)
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES)
     phone_number = models.CharField(max_length=15, blank=True)
@@ -32,6 +43,10 @@ class User(AbstractUser):
         null=True,
         help_text="Number of days for custom reporting frequency"
     )
+    # When the scheduler should next build this business's report
+    next_report_at = models.DateTimeField(null=True, blank=True)
+    # Carried in access tokens as the "ver" claim; bumping it revokes them
+    token_version = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -39,5 +54,42 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'user_type']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['user_type', 'next_report_at']),
+        ]
+
     def __str__(self):
         return self.email
+
+    def save(self, *args, **kwargs):
+        if self.user_type == 'business' and self.next_report_at is None:
+            self.next_report_at = timezone.now() + self.reporting_interval()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'password' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'token_version'}
+        super().save(*args, **kwargs)
+
+    def set_password(self, raw_password):
+        # Django also calls this to rehash an unchanged password on login
+        # (hasher upgrades); only a real change should revoke tokens
+        changed = not (raw_password is not None and self.has_usable_password()
+                       and check_password(raw_password, self.password))
+        super().set_password(raw_password)
+        if changed:
+            self.token_version += 1
+
+    def reporting_interval(self):
+        if self.reporting_frequency == 'custom':
+            return timedelta(days=self.custom_reporting_days or 7)
+        return timedelta(days=self.REPORTING_INTERVAL_DAYS.get(self.reporting_frequency, 7))
+
+    def next_report_after(self, scheduled_for, now=None):
+        """
+        The first slot after `scheduled_for` that is in the future, so a
+        scheduler that was down for a while doesn't queue up missed reports.
+        """
+        now = now or timezone.now()
+        interval = self.reporting_interval()
+        missed = max(0, (now - scheduled_for) // interval)
+        return scheduled_for + interval * (missed + 1)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -42,7 +43,22 @@ class UserLoginSerializer(serializers.Serializer):
     password = serializers.CharField(required=True, write_only=True)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class ReportScheduleMixin:
+    """
+    Restart the report schedule when the reporting frequency changes
+    """
+
+    def update(self, instance, validated_data):
+        rescheduled = (
+            'reporting_frequency' in validated_data or 'custom_reporting_days' in validated_data)
+        instance = super().update(instance, validated_data)
+        if rescheduled and instance.user_type == 'business':
+            instance.next_report_at = timezone.now() + instance.reporting_interval()
+            instance.save(update_fields=['next_report_at'])
+        return instance
+
+
+class UserSerializer(ReportScheduleMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'user_type',
@@ -51,7 +67,7 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
-class UserUpdateSerializer(serializers.ModelSerializer):
+class UserUpdateSerializer(ReportScheduleMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('reporting_frequency', 'custom_reporting_days')
@@ -0,0 +1,198 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import UserCache, user_cache
+from .models import User
+from .throttling import LoginRateThrottle, bucket_tokens, check_shared_cache
+
+PASSWORD = 'test-pass-123'
+
+
+def make_user(email, user_type='customer'):
+    return User.objects.create_user(username=email, email=email, password=PASSWORD, user_type=user_type)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = make_user('jwt@example.com')
+
+    def login(self):
+        response = APIClient().post('/api/auth/login/', {'email': self.user.email, 'password': PASSWORD},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        return client, response.json()
+
+    def test_tokens_carry_type_and_version(self):
+        _, tokens = self.login()
+        access = AccessToken(tokens['access'])
+        self.assertEqual((access['user_type'], access['ver']), ('customer', 0))
+
+        refreshed = APIClient().post('/api/auth/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(AccessToken(refreshed.json()['access'])['ver'], 0)
+
+    def test_cached_user_needs_no_queries(self):
+        client, _ = self.login()
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/auth/profile/').status_code, 200)
+
+    def test_saves_invalidate_the_cache(self):
+        client, _ = self.login()
+        client.get('/api/auth/profile/')
+        self.user.phone_number = '555-0100'
+        self.user.save()
+        self.assertEqual(client.get('/api/auth/profile/').json()['phone_number'], '555-0100')
+
+        self.user.delete()
+        self.assertIsNone(user_cache.get(self.user.pk))
+
+    def test_password_change_revokes_tokens(self):
+        client, tokens = self.login()
+        client.get('/api/auth/profile/')
+        self.user.set_password('a-new-pass-456')
+        self.user.save()
+
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 401)
+        refreshed = APIClient().post('/api/auth/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        new = APIClient()
+        new.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.json()['access']}")
+        self.assertEqual(new.get('/api/auth/profile/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        client, _ = self.login()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get('/api/auth/profile/').status_code, 401)
+
+    def test_rehashing_the_same_password_keeps_tokens(self):
+        self.user.set_password(PASSWORD)
+        self.assertEqual(self.user.token_version, 0)
+        self.user.set_password('other-pass-789')
+        self.user.save(update_fields=['password'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        self.users = [make_user(f'cache{i}@example.com') for i in range(3)]
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = UserCache(max_size=2, ttl=60)
+        for user in self.users:
+            cache.load(user.pk)
+        self.assertIsNone(cache.get(self.users[0].pk))
+        self.assertEqual(cache.get(self.users[2].pk).email, 'cache2@example.com')
+
+    def test_every_lookup_builds_a_new_instance(self):
+        cache = UserCache(max_size=2, ttl=60)
+        cache.load(self.users[0].pk)
+        self.assertIsNot(cache.get(self.users[0].pk), cache.get(self.users[0].pk))
+
+    def test_entries_expire(self):
+        cache = UserCache(max_size=2, ttl=0)
+        self.assertEqual(cache.load(self.users[0].pk), self.users[0])
+        self.assertIsNone(cache.get(self.users[0].pk))
+
+
+@override_settings(LOGIN_THROTTLE_RATES={'ip': {'capacity': 4, 'per_minute': 6},
+                                         'email': {'capacity': 3, 'per_minute': 1}})
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_user('owner@example.com', user_type='business')
+
+    def login(self, email, password=PASSWORD, url='/api/auth/login/', ip='10.0.0.1', **headers):
+        return APIClient().post(url, {'email': email, 'password': password}, format='json',
+                                REMOTE_ADDR=ip, **headers)
+
+    def test_login_endpoints_check_user_type(self):
+        self.assertEqual(self.login('owner@example.com', url='/api/auth/login/business/').status_code, 200)
+        response = self.login('owner@example.com', url='/api/auth/login/customer/', ip='10.0.0.2')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('customer users only', response.json()['error'])
+        self.assertEqual(self.login('owner@example.com', ip='10.0.0.3').status_code, 200)
+        self.assertEqual(self.login('nobody@example.com', 'wrong', ip='10.0.0.4').status_code, 401)
+
+    def test_email_bucket_stops_attempts_before_hashing(self):
+        for i in range(3):
+            self.assertEqual(self.login(' Owner@example.com', 'wrong', ip=f'10.0.1.{i}').status_code, 401)
+        with mock.patch('accounts.views.authenticate') as authenticate:
+            response = self.login('owner@example.com', ip='10.0.1.9')
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+        self.assertGreater(int(response['Retry-After']), 0)
+        # The same address may still try other accounts
+        self.assertEqual(self.login('other@example.com', 'wrong', ip='10.0.1.9').status_code, 401)
+
+    def test_ip_bucket_refills(self):
+        for i in range(4):
+            self.assertEqual(self.login(f'user{i}@example.com', 'wrong').status_code, 401)
+        self.assertEqual(self.login('user9@example.com', 'wrong').status_code, 429)
+        later = time.time() + 11
+        with mock.patch('accounts.throttling.time.time', return_value=later):
+            self.assertEqual(self.login('user10@example.com', 'wrong').status_code, 401)
+
+    def test_forwarded_for_does_not_pick_the_ip_bucket(self):
+        for i in range(4):
+            self.login(f'user{i}@example.com', 'wrong', HTTP_X_FORWARDED_FOR=f'203.0.113.{i}')
+        response = self.login('user9@example.com', 'wrong', HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, 429)
+
+    def test_rejected_attempt_spends_no_tokens(self):
+        for i in range(3):
+            self.login('owner@example.com', 'wrong', ip=f'10.0.2.{i}')
+        # Rejected for the email: the address keeps its whole allowance
+        for _ in range(3):
+            self.assertEqual(self.login('owner@example.com', ip='10.0.2.9').status_code, 429)
+        for i in range(4):
+            self.assertEqual(self.login(f'user{i}@example.com', 'wrong', ip='10.0.2.9').status_code, 401)
+
+
+@override_settings(LOGIN_THROTTLE_RATES={'ip': {'capacity': 5, 'per_minute': 1}})
+class ConcurrentLoginThrottleTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def attempt_together(self, attempts):
+        request = SimpleNamespace(data={}, META={'REMOTE_ADDR': '10.9.9.9'})
+        start = threading.Barrier(attempts)
+        allowed = []
+
+        def attempt():
+            start.wait()
+            allowed.append(LoginRateThrottle().allow_request(request, None))
+
+        threads = [threading.Thread(target=attempt) for _ in range(attempts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return allowed
+
+    def test_concurrent_attempts_share_the_capacity(self):
+        def slow_read(*args):
+            # Widen the gap between reading a bucket and writing it back
+            tokens = bucket_tokens(*args)
+            time.sleep(0.01)
+            return tokens
+
+        with mock.patch('accounts.throttling.bucket_tokens', slow_read):
+            allowed = self.attempt_together(20)
+        self.assertEqual(allowed.count(True), 5)
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['accounts.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
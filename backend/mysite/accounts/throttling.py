@@ -0,0 +1,136 @@
+import hashlib
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.checks import Error, Tags, register
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_LOGIN_THROTTLE_RATES = {
+    'ip': {'capacity': 20, 'per_minute': 10},
+    'email': {'capacity': 5, 'per_minute': 1},
+}
+# Seconds a bucket lock outlives a worker that died holding it, and the
+# longest an attempt waits for one before it is turned away
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.5
+# Backends that keep entries in the worker process, so each worker would
+# throttle on its own
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def bucket_tokens(key, capacity, per_minute, now):
+    """
+    Tokens in the bucket stored under `key` in the cache as of `now`.
+    Buckets start full and refill continuously at per_minute tokens a
+    minute.
+    """
+    tokens, updated_at = cache.get(key, (capacity, now))
+    return min(capacity, tokens + (now - updated_at) * per_minute / 60.0)
+
+
+def spend_token(key, tokens, capacity, per_minute, now):
+    """Store the bucket with one of its `tokens` taken"""
+    # Expire once the bucket would be full again, as a fresh one is
+    cache.set(key, (tokens - 1, now), int((capacity - tokens + 1) * 60.0 / per_minute) + 1)
+
+
+@contextmanager
+def bucket_locks(keys):
+    """
+    Hold a lock on every bucket in `keys` for the block, which gets True,
+    or False if one stayed locked for LOCK_WAIT seconds. cache.add() is
+    atomic on every backend, so only one attempt at a time (across all
+    workers sharing the cache) reads and writes a bucket. Locks are taken
+    in sorted order so two attempts can't each hold one the other needs.
+    """
+    held = []
+    try:
+        deadline = time.monotonic() + LOCK_WAIT
+        for key in sorted(keys):
+            while not cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+                if time.monotonic() >= deadline:
+                    yield False
+                    return
+                time.sleep(0.005)
+            held.append(f'{key}:lock')
+        yield True
+    finally:
+        cache.delete_many(held)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Login buckets must be shared between workers to limit anything"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        'Login throttling needs a cache shared between workers.',
+        hint=f'{backend} keeps a separate bucket in every worker process, so the login '
+             'limit grows with the number of workers; set REDIS_URL.',
+        id='accounts.E001',
+    )]
+
+
+class LoginRateThrottle(BaseThrottle):
+    """
+    Token buckets per client IP and per submitted email, checked before the
+    view runs, so a rejected attempt costs a cache lookup instead of a
+    password hash. Rates come from settings.LOGIN_THROTTLE_RATES.
+    """
+    scope = 'login'
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_rates(self):
+        return getattr(settings, 'LOGIN_THROTTLE_RATES', DEFAULT_LOGIN_THROTTLE_RATES)
+
+    def get_buckets(self, request):
+        # get_ident() only trusts X-Forwarded-For as far as
+        # REST_FRAMEWORK['NUM_PROXIES'] allows
+        buckets = [('ip', self.get_ident(request))]
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if isinstance(email, str) and email.strip():
+            # Hashed to keep arbitrary input out of cache keys
+            buckets.append(('email', hashlib.sha256(email.strip().lower().encode()).hexdigest()))
+        return buckets
+
+    def allow_request(self, request, view):
+        """
+        Take a token from every bucket, or from none: all buckets are
+        checked first, so an attempt rejected for its email doesn't also
+        use up its IP's allowance, nor the other way round. The buckets
+        are locked meanwhile, so concurrent attempts can't all spend the
+        same token.
+        """
+        rates = self.get_rates()
+        limits = {}
+        for kind, ident in self.get_buckets(request):
+            rate = rates.get(kind)
+            if rate:
+                limits[f'throttle:{self.scope}:{kind}:{ident}'] = rate
+
+        with bucket_locks(limits) as locked:
+            if not locked:
+                self.wait_seconds = 1
+                return False
+            now = time.time()
+            tokens = {key: bucket_tokens(key, rate['capacity'], rate['per_minute'], now)
+                      for key, rate in limits.items()}
+            waits = [(1 - tokens[key]) * 60.0 / rate['per_minute']
+                     for key, rate in limits.items() if tokens[key] < 1]
+            if waits:
+                self.wait_seconds = max(waits)
+                return False
+            for key, rate in limits.items():
+                spend_token(key, tokens[key], rate['capacity'], rate['per_minute'], now)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,17 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class UserRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's type and token version. The claims
+    are copied into every access token minted from it, so the
+    authentication class can reject tokens issued before a password change
+    without loading the user first.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['user_type'] = user.user_type
+        token['ver'] = user.token_version
+        return token
@@ -2,8 +2,9 @@ from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from .throttling import LoginRateThrottle
+from .tokens import UserRefreshToken
 from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer, UserUpdateSerializer
 import logging
 import json
@@ -33,7 +34,7 @@ class RegisterView(generics.CreateAPIView):
             logger.info(f"User created successfully: {user.email}")
 
             # Generate tokens
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
             logger.info("Tokens generated successfully")
 
             response_data = {
@@ -55,34 +56,20 @@ class RegisterView(generics.CreateAPIView):
 
 
 class LoginView(generics.CreateAPIView):
+    """
+    Email/password login. Mounted once per audience: with
+    required_user_type set, only users of that type may log in there.
+    """
     permission_classes = (AllowAny,)
     serializer_class = UserLoginSerializer
+    # Checked before any password hashing happens
+    throttle_classes = (LoginRateThrottle,)
+    required_user_type = None
 
-    def post(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-
-        user = authenticate(
-            email=serializer.validated_data['email'],
-            password=serializer.validated_data['password']
-        )
-
-        if user:
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'user': UserSerializer(user).data,
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            })
-        return Response(
-            {'error': 'Invalid credentials'},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
-
-
-class BusinessLoginView(generics.CreateAPIView):
-    permission_classes = (AllowAny,)
-    serializer_class = UserLoginSerializer
+    WRONG_LOGIN_MESSAGES = {
+        'business': 'This login is for business users only. Please use the customer login.',
+        'customer': 'This login is for customer users only. Please use the business login.',
+    }
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -94,45 +81,13 @@ class BusinessLoginView(generics.CreateAPIView):
         )
 
         if user:
-            if user.user_type != 'business':
+            if self.required_user_type and user.user_type != self.required_user_type:
                 return Response(
-                    {'error': 'This login is for business users only. Please use the customer login.'},
+                    {'error': self.WRONG_LOGIN_MESSAGES[self.required_user_type]},
                     status=status.HTTP_403_FORBIDDEN
                 )
-            
-            refresh = RefreshToken.for_user(user)
-            return Response({
-                'user': UserSerializer(user).data,
-                'refresh': str(refresh),
-                'access': str(refresh.access_token),
-            })
-        return Response(
-            {'error': 'Invalid credentials'},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
-
-
-class CustomerLoginView(generics.CreateAPIView):
-    permission_classes = (AllowAny,)
-    serializer_class = UserLoginSerializer
 
-    def post(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-
-        user = authenticate(
-            email=serializer.validated_data['email'],
-            password=serializer.validated_data['password']
-        )
-
-        if user:
-            if user.user_type != 'customer':
-                return Response(
-                    {'error': 'This login is for customer users only. Please use the business login.'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-            
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
             return Response({
                 'user': UserSerializer(user).data,
                 'refresh': str(refresh),
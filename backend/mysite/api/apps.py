@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from mysite.profiling import watch_slow_queries
+        from . import signals  # noqa: F401
+
+        connection_created.connect(watch_slow_queries)
@@ -0,0 +1,108 @@
+"""
+Versioned cache of pre-rendered catalog responses.
+
+Every store has a version number in the cache, and the store list has
+its own. Cached payloads are keyed by those versions, so bumping a
+version (from the Store/Product signals in api/signals.py) invalidates
+all of a store's entries at once without having to find and delete them.
+Stale entries simply age out.
+
+Store dashboards are cached the same way under a per-store dashboard
+version, bumped whenever the store's orders or products change.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .conditional import not_modified, not_modified_response
+
+STORE_LIST_VERSION_KEY = 'catalog:v:stores'
+
+
+def store_version_key(store_id):
+    return f'catalog:v:store:{store_id}'
+
+
+def dashboard_version_key(store_id):
+    return f'catalog:v:dashboard:{store_id}'
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600)
+
+
+def _fresh_version():
+    # Versions start from the clock, so a version key that was evicted
+    # never restarts at a number older payloads were cached under
+    return time.time_ns() // 1000
+
+
+def get_version(version_key):
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, _fresh_version(), None)
+        version = cache.get(version_key)
+    return version
+
+
+def bump_version(version_key):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.add(version_key, _fresh_version(), None)
+
+
+def bump_store(store_id, store_list=False):
+    bump_version(store_version_key(store_id))
+    if store_list:
+        bump_version(STORE_LIST_VERSION_KEY)
+
+
+def bump_dashboard(store_id):
+    bump_version(dashboard_version_key(store_id))
+
+
+def cached_json_response(request, name, version_key, build):
+    """
+    Return the cached payload for `name` at the current version of
+    `version_key`, or call build() for the response data, render it to
+    JSON once and cache the bytes.
+
+    The version doubles as the ETag, so a client that already has the
+    current version gets a 304 without the payload even being read.
+    """
+    version = get_version(version_key)
+    etag = f'W/"{name}:{version}"'
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    key = f'catalog:{name}:{version}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = JSONRenderer().render(build())
+        cache.set(key, payload, _timeout())
+    response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def store_list_response(request, build):
+    return cached_json_response(request, 'stores', STORE_LIST_VERSION_KEY, build)
+
+
+def store_detail_response(request, store_id, build):
+    return cached_json_response(
+        request, f'store:{store_id}', store_version_key(store_id), build)
+
+
+def product_list_response(request, store_id, build):
+    return cached_json_response(
+        request, f'products:{store_id}', store_version_key(store_id), build)
+
+
+def dashboard_response(request, store_id, start, end, top, build):
+    return cached_json_response(
+        request, f'dashboard:{store_id}:{start}:{end}:{top}', dashboard_version_key(store_id), build)
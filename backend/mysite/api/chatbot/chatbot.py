@@ -1,9 +1,14 @@
 import openai
 import pandas as pd
 import os
+import logging
 from dotenv import load_dotenv
 import os
 
+from mysite.metrics import time_upstream
+
+logger = logging.getLogger(__name__)
+
 
 # Load env variables from .env in the api folder
 api_env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
@@ -60,10 +65,11 @@ If the response is unclear, misspelled, or vague, provide a cleaned-up or clarif
 Otherwise, return it as-is. Respond with the corrected text only.
 """
         # Use newer OpenAI API syntax
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": correction_prompt}]
-        )
+        with time_upstream('openai', 'clarify'):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": correction_prompt}]
+            )
         return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"⚠️ Warning: Could not clarify with GPT: {e}")
@@ -111,13 +117,11 @@ def analyze_csv(file_path):
 
 
 def chat_with_gpt(user_msg, context_summary, business_profile=None):
-    print(f"🔍 Debug: chat_with_gpt called with client: {client is not None}")
     if not client:
-        print("🔍 Debug: Using fallback response (no OpenAI client)")
+        logger.debug("chat_with_gpt: no OpenAI client, using fallback response")
         # Fallback responses when OpenAI is not available
         return get_fallback_response(user_msg, context_summary, business_profile)
 
-    print("🔍 Debug: Using OpenAI API")
     try:
         # Use provided business profile or default values
         profile = business_profile or {}
@@ -147,6 +151,7 @@ Sales Summary:
 - Least Seller: {context_summary.get('low_seller', 'N/A')}
 - Consider stocking more: {context_summary.get('optimize_more', [])}
 - Consider cutting back: {context_summary.get('cut_back', [])}
+- Reorder now (item, on hand, reorder point, suggested order): {context_summary.get('reorder_suggestions', [])}
 
 
 Your goals:
@@ -161,10 +166,11 @@ Speak clearly, suggest actionable strategies, and allow follow-up questions.
             {"role": "user", "content": user_msg},
         ]
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages
-        )
+        with time_upstream('openai', 'chat'):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages
+            )
         return response.choices[0].message.content
     except Exception as e:
         return f"Sorry, there was an error connecting to the AI assistant: {str(e)}"
@@ -187,7 +193,12 @@ def get_fallback_response(user_msg, context_summary, business_profile=None):
             return f"To reduce waste in your {business_type}:\n\n• Track daily waste patterns\n• Implement portion control\n• Use FIFO inventory rotation\n• Adjust prep quantities based on demand\n• Consider donating excess food\n• Train staff on proper storage"
 
     elif any(word in user_msg_lower for word in ['reorder', 'stock', 'inventory']):
-        if context_summary and context_summary.get('top_seller'):
+        if context_summary and context_summary.get('reorder_suggestions'):
+            lines = "\n".join(
+                f"• {s['item']}: {s['on_hand']} on hand, reorder point {s['reorder_point']}, order {s['suggested_order']}"
+                for s in context_summary['reorder_suggestions'])
+            return f"Based on recent sales, {business_name} should reorder:\n\n{lines}"
+        elif context_summary and context_summary.get('top_seller'):
             return f"Your top seller is {context_summary['top_seller']}. Consider:\n\n• Stocking more of high-demand items\n• Setting up automatic reorder points\n• Monitoring seasonal trends\n• Building relationships with reliable suppliers\n• Keeping safety stock for popular items"
         else:
             return f"For {business_name} inventory management:\n\n• Set minimum stock levels for each item\n• Monitor sales trends weekly\n• Build relationships with suppliers\n• Consider bulk ordering for discounts\n• Track seasonal demand patterns"
@@ -0,0 +1,72 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+from .models import Order, OrderItem
+from .waste import _day_bounds
+
+ZERO = Decimal('0.00')
+
+
+def store_dashboard(store, start, end, top=10):
+    """
+    Sales metrics for a store's orders placed in [start, end], in three
+    aggregate queries however many orders there are: totals with counts by
+    status, revenue per day, and the best-selling products. Cancelled
+    orders count towards the status breakdown only.
+    """
+    range_start, range_end = _day_bounds(start, end)
+    orders = Order.objects.filter(
+        store=store, created_at__gte=range_start, created_at__lt=range_end)
+    sold = orders.exclude(status='cancelled')
+
+    totals = orders.aggregate(
+        revenue=Coalesce(Sum('total_amount', filter=~Q(status='cancelled')), ZERO),
+        orders=Count('id', filter=~Q(status='cancelled')),
+        customers=Count('customer', filter=~Q(status='cancelled'), distinct=True),
+        **{f'status_{value}': Count('id', filter=Q(status=value))
+           for value, _ in Order.STATUS_CHOICES}
+    )
+
+    days = {row['day']: row for row in (
+        sold.annotate(day=TruncDate('created_at'))
+        .order_by().values('day')
+        .annotate(revenue=Sum('total_amount'), orders=Count('id'))
+    )}
+
+    line_total = ExpressionWrapper(
+        F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    top_products = list(
+        OrderItem.objects.filter(order__in=sold)
+        .values('product_id', name=F('product__name'))
+        .annotate(quantity_sold=Sum('quantity'), revenue=Sum(line_total))
+        .order_by('-revenue', '-quantity_sold', 'product_id')[:top]
+    )
+
+    daily = []
+    day = start
+    while day <= end:
+        row = days.get(day)
+        daily.append({
+            'date': day,
+            'revenue': row['revenue'] if row else ZERO,
+            'orders': row['orders'] if row else 0,
+        })
+        day += timedelta(days=1)
+
+    return {
+        'period_start': start,
+        'period_end': end,
+        'summary': {
+            'revenue': totals['revenue'],
+            'orders': totals['orders'],
+            'customers': totals['customers'],
+            'average_order_value': (
+                (totals['revenue'] / totals['orders']).quantize(ZERO) if totals['orders'] else ZERO),
+        },
+        'status_counts': {value: totals[f'status_{value}'] for value, _ in Order.STATUS_CHOICES},
+        'daily': daily,
+        'top_products': top_products,
+    }
@@ -0,0 +1,220 @@
+"""
+Order events for the Server-Sent Events stream.
+
+Writers call publish() (from any thread, usually via transaction.on_commit)
+and each open stream holds a Subscription on its channels. The broker
+class comes from settings.EVENTS_BROKER. The default InProcessBroker only
+reaches streams served by the same process; with several server processes,
+point EVENTS_BROKER at a shared broker implementing the same publish(),
+subscribe() and replay() methods.
+
+Event ids are "<broker id>-<sequence>". The broker keeps the last
+EVENTS_REPLAY_BUFFER events (across all channels, so memory stays bounded)
+so a reconnecting client can resume from its Last-Event-ID; when that isn't possible (ids from another
+broker, or too old) replay() returns None and the stream sends a fresh
+snapshot instead.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+# Client reconnect delay, sent to EventSource in the "retry" field
+RECONNECT_MS = 3000
+
+
+def customer_channel(customer_id):
+    return f'customer:{customer_id}'
+
+
+def store_channel(store_id):
+    return f'store:{store_id}'
+
+
+class Subscription:
+    """
+    Events for some channels, consumed from one event loop. If the consumer
+    falls more than EVENTS_QUEUE_SIZE events behind it is dropped: get()
+    raises Overflow and the client should reconnect and resume.
+    """
+
+    class Overflow(Exception):
+        pass
+
+    def __init__(self, broker, channels, loop, max_size):
+        self.broker = broker
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(max_size)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The queue is only full while nobody is waiting on get(), so
+            # the consumer will drain it and then see the overflow
+            self.overflowed = True
+            self.broker.unsubscribe(self)
+
+    async def get(self):
+        if self.overflowed and self.queue.empty():
+            raise self.Overflow()
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self.broker_id = uuid.uuid4().hex[:8]
+        self.sequence = itertools.count(1)
+        self.queue_size = getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+        self.lock = threading.Lock()
+        # (sequence, channel, event), oldest first
+        self.recent = deque(maxlen=getattr(settings, 'EVENTS_REPLAY_BUFFER', 10000))
+        self.subscribers = {}
+
+    def publish(self, channel, event_type, data):
+        """Send an event to every subscriber of `channel`; safe from any thread"""
+        with self.lock:
+            sequence = next(self.sequence)
+            event = {'id': f'{self.broker_id}-{sequence}', 'type': event_type, 'data': data}
+            self.recent.append((sequence, channel, event))
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Its event loop has closed
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, channels):
+        """Subscribe the running event loop to `channels`"""
+        subscription = Subscription(self, tuple(channels), asyncio.get_running_loop(), self.queue_size)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[channel]
+
+    def replay(self, channels, last_event_id):
+        """
+        Events on `channels` after `last_event_id`, oldest first, or None
+        if they can't all be replayed
+        """
+        broker_id, _, sequence = last_event_id.partition('-')
+        if broker_id != self.broker_id or not sequence.isdigit():
+            return None
+        after = int(sequence)
+        channels = set(channels)
+        with self.lock:
+            # Events dropped from a full buffer might have been missed
+            if len(self.recent) == self.recent.maxlen and self.recent[0][0] > after + 1:
+                return None
+            return [event for sequence, channel, event in self.recent
+                    if sequence > after and channel in channels]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(
+                    getattr(settings, 'EVENTS_BROKER', 'api.events.InProcessBroker'))()
+    return _broker
+
+
+ORDER_EVENT_FIELDS = ('id', 'customer_id', 'store_id', 'status', 'version', 'updated_at')
+
+
+def order_event_data(row):
+    """Event payload for an Order row from values(*ORDER_EVENT_FIELDS)"""
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'version': row['version'],
+        'updated_at': row['updated_at'].isoformat(),
+    }
+
+
+def publish_order_status(rows):
+    """
+    Publish a status event for each order row to its customer's and its
+    store's channels. Call once the change has committed.
+    """
+    broker = get_broker()
+    for row in rows:
+        data = order_event_data(row)
+        broker.publish(customer_channel(row['customer_id']), 'order.status', data)
+        broker.publish(store_channel(row['store_id']), 'order.status', data)
+
+
+def format_event(event):
+    lines = []
+    if event.get('id'):
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], cls=DjangoJSONEncoder)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+async def event_stream(channels, last_event_id, load_snapshot):
+    """
+    The body of an SSE response: events missed since `last_event_id`, or
+    else a snapshot from `await load_snapshot()`, then live events, with a
+    comment line every EVENTS_HEARTBEAT_SECONDS so proxies keep an idle
+    connection open. An idle stream is just a task waiting on its queue.
+    """
+    broker = get_broker()
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    # Subscribe before reading the backlog so nothing falls in between
+    subscription = broker.subscribe(channels)
+    try:
+        yield f'retry: {RECONNECT_MS}\n\n'
+        backlog = broker.replay(channels, last_event_id) if last_event_id else None
+        if backlog is None:
+            backlog = [{'type': 'snapshot', 'data': await load_snapshot()}]
+        sent = set()
+        for event in backlog:
+            sent.add(event.get('id'))
+            yield format_event(event)
+
+        while True:
+            try:
+                async with asyncio.timeout(heartbeat):
+                    event = await subscription.get()
+            except TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+            if event['id'] not in sent:
+                yield format_event(event)
+    except Subscription.Overflow:
+        # Too far behind; the client reconnects and resumes from its last id
+        return
+    finally:
+        subscription.close()
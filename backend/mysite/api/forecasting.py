@@ -0,0 +1,163 @@
+"""
+Demand forecasting and reorder points.
+
+A business's sales history is loaded from the daily rollup into one
+items x days NumPy matrix, and every statistic below is computed for all
+items at once with array operations (no per-item Python loops).
+"""
+import math
+from datetime import timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.utils import timezone
+
+from .inventory_buffer import with_pending_sales
+from .models import DailyItemSales, InventoryItem
+
+
+DEFAULTS = {
+    'history_days': 90,
+    'window': 7,
+    'alpha': 0.3,
+    'lead_time_days': 3,
+    'review_days': 7,
+    'service_level': 0.95,
+}
+
+
+def build_matrix(item_ids, start, n_days, rows):
+    """
+    Scatter (item_id, day, qty) rows into an items x days matrix.
+    Rows for unknown items or days outside the window are dropped.
+    """
+    n_items = len(item_ids)
+    if not rows or not n_items:
+        return np.zeros((n_items, n_days), dtype=np.float64)
+
+    count = len(rows)
+    row_items = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+    row_days = np.fromiter((r[1].toordinal() for r in rows), dtype=np.int64, count=count)
+    row_qty = np.fromiter((r[2] for r in rows), dtype=np.float64, count=count)
+
+    ids = np.asarray(item_ids, dtype=np.int64)
+    order = np.argsort(ids)
+    pos = np.searchsorted(ids, row_items, sorter=order)
+    pos = np.minimum(pos, n_items - 1)
+    item_idx = order[pos]
+    day_idx = row_days - start.toordinal()
+    keep = (ids[item_idx] == row_items) & (day_idx >= 0) & (day_idx < n_days)
+
+    flat = item_idx[keep] * n_days + day_idx[keep]
+    matrix = np.bincount(flat, weights=row_qty[keep], minlength=n_items * n_days)
+    return matrix.reshape(n_items, n_days)
+
+
+def load_sales_matrix(business, history_days=DEFAULTS['history_days'], end=None):
+    """
+    Return (items, matrix) where items is a list of (id, name, current_quantity)
+    and matrix[i, d] is the quantity of items[i] sold on day d of the window
+    ending at `end` (today by default).
+    """
+    end = end or timezone.localdate()
+    start = end - timedelta(days=history_days - 1)
+
+    items = list(with_pending_sales(InventoryItem.objects.filter(business=business))
+                 .order_by('id')
+                 .values_list('id', 'name', 'available'))
+    rows = list(DailyItemSales.objects.filter(
+        business=business, day__gte=start, day__lte=end
+    ).values_list('item_id', 'day', 'qty'))
+
+    matrix = build_matrix([item[0] for item in items], start, history_days, rows)
+    return items, matrix
+
+
+def smoothing_weights(n_days, alpha):
+    """
+    Weights w such that matrix @ w equals simple exponential smoothing
+    (s_0 = x_0, s_t = alpha * x_t + (1 - alpha) * s_{t-1}) at the last day.
+    """
+    exponents = np.arange(n_days - 1, -1, -1, dtype=np.float64)
+    weights = alpha * np.power(1.0 - alpha, exponents)
+    weights[0] = (1.0 - alpha) ** (n_days - 1)
+    return weights
+
+
+def forecast(matrix, on_hand, window=DEFAULTS['window'], alpha=DEFAULTS['alpha'],
+             lead_time_days=DEFAULTS['lead_time_days'],
+             review_days=DEFAULTS['review_days'],
+             service_level=DEFAULTS['service_level']):
+    """
+    Vectorized forecast for every row of `matrix` (items x days).
+    Returns a dict of 1-D arrays, one entry per item.
+    """
+    n_items, n_days = matrix.shape
+    on_hand = np.asarray(on_hand, dtype=np.float64)
+    if n_days == 0:
+        matrix = np.zeros((n_items, 1))
+        n_days = 1
+
+    window = max(1, min(window, n_days))
+    moving_average = matrix[:, -window:].mean(axis=1)
+    smoothed = matrix @ smoothing_weights(n_days, alpha)
+    if n_days > 1:
+        std_dev = matrix.std(axis=1, ddof=1)
+    else:
+        std_dev = np.zeros(n_items)
+
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * std_dev * math.sqrt(lead_time_days)
+    reorder_point = smoothed * lead_time_days + safety_stock
+    target_level = reorder_point + smoothed * review_days
+    needs_reorder = (on_hand <= reorder_point) & (smoothed > 0)
+    suggested_order = np.where(
+        needs_reorder, np.ceil(np.maximum(target_level - on_hand, 0.0)), 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(smoothed > 0, on_hand / smoothed, np.inf)
+
+    return {
+        'moving_average': moving_average,
+        'smoothed_demand': smoothed,
+        'std_dev': std_dev,
+        'safety_stock': safety_stock,
+        'reorder_point': reorder_point,
+        'suggested_order': suggested_order,
+        'needs_reorder': needs_reorder,
+        'days_of_cover': days_of_cover,
+    }
+
+
+def reorder_suggestions(business, **params):
+    """
+    Forecast every inventory item of a business. Returns one dict per item,
+    items that need reordering first, lowest days of cover first.
+    """
+    options = {**DEFAULTS, **params}
+    items, matrix = load_sales_matrix(business, options.pop('history_days'))
+    if not items:
+        return []
+
+    result = forecast(matrix, [item[2] for item in items], **options)
+
+    suggestions = []
+    for i, (item_id, name, on_hand) in enumerate(items):
+        cover = result['days_of_cover'][i]
+        suggestions.append({
+            'item_id': item_id,
+            'item': name,
+            'on_hand': on_hand,
+            'moving_average': round(float(result['moving_average'][i]), 2),
+            'smoothed_demand': round(float(result['smoothed_demand'][i]), 2),
+            'safety_stock': round(float(result['safety_stock'][i]), 2),
+            'reorder_point': round(float(result['reorder_point'][i]), 2),
+            'suggested_order': int(result['suggested_order'][i]),
+            'needs_reorder': bool(result['needs_reorder'][i]),
+            'days_of_cover': None if math.isinf(cover) else round(float(cover), 1),
+        })
+
+    suggestions.sort(key=lambda s: (
+        not s['needs_reorder'],
+        s['days_of_cover'] if s['days_of_cover'] is not None else float('inf')))
+    return suggestions
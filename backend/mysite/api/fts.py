@@ -0,0 +1,105 @@
+"""
+Schema of the SQLite full-text index over products (api_product_fts).
+
+The index covers product name/description and store name, and is kept
+in sync by triggers so every write path (ORM, bulk_create, raw SQL) is
+covered. Migrations import this module, so it must not import models;
+changing the trigger SQL needs a migration that recreates the triggers.
+"""
+from django.db import migrations
+
+FTS_TABLE = """
+    CREATE VIRTUAL TABLE api_product_fts USING fts5(
+        name, description, store_name,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+FTS_BACKFILL = """
+    INSERT INTO api_product_fts (rowid, name, description, store_name)
+    SELECT p.id, p.name, p.description, s.name
+    FROM api_product p JOIN api_store s ON s.id = p.store_id
+"""
+
+FTS_TRIGGERS = {
+    'api_product_fts_insert': """
+        CREATE TRIGGER api_product_fts_insert AFTER INSERT ON api_product BEGIN
+            INSERT INTO api_product_fts (rowid, name, description, store_name)
+            SELECT new.id, new.name, new.description, s.name
+            FROM api_store s WHERE s.id = new.store_id;
+        END
+    """,
+    'api_product_fts_delete': """
+        CREATE TRIGGER api_product_fts_delete AFTER DELETE ON api_product BEGIN
+            DELETE FROM api_product_fts WHERE rowid = old.id;
+        END
+    """,
+    'api_product_fts_update': """
+        CREATE TRIGGER api_product_fts_update AFTER UPDATE ON api_product
+        WHEN old.name IS NOT new.name
+            OR old.description IS NOT new.description
+            OR old.store_id IS NOT new.store_id
+        BEGIN
+            DELETE FROM api_product_fts WHERE rowid = old.id;
+            INSERT INTO api_product_fts (rowid, name, description, store_name)
+            SELECT new.id, new.name, new.description, s.name
+            FROM api_store s WHERE s.id = new.store_id;
+        END
+    """,
+    'api_product_fts_store_update': """
+        CREATE TRIGGER api_product_fts_store_update AFTER UPDATE ON api_store
+        WHEN old.name IS NOT new.name
+        BEGIN
+            UPDATE api_product_fts SET store_name = new.name
+            WHERE rowid IN (SELECT id FROM api_product WHERE store_id = new.id);
+        END
+    """,
+}
+
+
+# Other databases have no index and fall back to a LIKE search in
+# api/search.py, so every operation below is a no-op there
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(FTS_TABLE)
+    create_fts_triggers(apps, schema_editor)
+    schema_editor.execute(FTS_BACKFILL)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    drop_fts_triggers(apps, schema_editor)
+    schema_editor.execute("DROP TABLE IF EXISTS api_product_fts")
+
+
+def drop_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in FTS_TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def create_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name, sql in FTS_TRIGGERS.items():
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        schema_editor.execute(sql)
+
+
+def without_fts_triggers(*operations):
+    """
+    Wrap migration operations that alter api_product or api_store. SQLite
+    applies most schema changes by rebuilding the table, which fails while
+    triggers on the other table still reference it, so the triggers are
+    dropped first and recreated afterwards (in both directions).
+    """
+    return [
+        migrations.RunPython(drop_fts_triggers, create_fts_triggers),
+        *operations,
+        migrations.RunPython(create_fts_triggers, drop_fts_triggers),
+    ]
@@ -0,0 +1,159 @@
+"""
+Geohash indexing for nearest-store lookups.
+
+Every located store carries a geohash of its coordinates in an indexed
+column. A radius search takes the geohash cell around the point (at the
+finest precision whose cells are still at least as large as the radius)
+plus its 8 neighbours; any store within the radius must lie in one of
+those 9 cells, and each cell is a single index range scan on the geohash
+column. Exact haversine distances are only computed for the candidates
+that also fall inside the circle's bounding box.
+"""
+import math
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Precision stored on Store.geohash (~5m cells)
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            rng, coord = lon_range, longitude
+        else:
+            rng, coord = lat_range, latitude
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat_degrees, lon_degrees) spanned by one cell at `precision`"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def radius_degrees(latitude, radius_km):
+    """
+    Half-extents (lat_degrees, lon_degrees) of the bounding box of a
+    circle of `radius_km` around a point at `latitude`. lon_degrees is 360
+    when the circle contains a pole.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    sin_radius = math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi / 2))
+    cos_lat = math.cos(math.radians(latitude))
+    if sin_radius >= cos_lat:
+        return dlat, 360.0
+    return dlat, math.degrees(math.asin(sin_radius / cos_lat))
+
+
+def precision_for_radius(latitude, radius_km):
+    """
+    Finest precision whose cells are at least radius_km across in both
+    directions, so the 3x3 block around the point covers the whole
+    circle. 0 means the radius is too large to prune with geohashes.
+    """
+    dlat, dlon = radius_degrees(latitude, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_cell, lon_cell = cell_size(precision)
+        if lat_cell >= dlat and lon_cell >= dlon:
+            return precision
+    return 0
+
+
+def _wrap_longitude(longitude):
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def covering_cells(latitude, longitude, precision):
+    """The cell containing the point and its (up to) 8 neighbours"""
+    lat_cell, lon_cell = cell_size(precision)
+    cells = set()
+    for dy in (-1, 0, 1):
+        lat = latitude + dy * lat_cell
+        if lat < -90.0 or lat > 90.0:
+            continue
+        for dx in (-1, 0, 1):
+            cells.add(encode(lat, _wrap_longitude(longitude + dx * lon_cell), precision))
+    return sorted(cells)
+
+
+def cells_filter(cells, field='geohash', using=DEFAULT_DB_ALIAS):
+    """
+    Q matching any geohash under one of `cells`, in a form the column's
+    index serves on the database `using`.
+
+    SQLite's LIKE is case-insensitive and can't use the (BINARY) index, so
+    there each cell is a range ('~' sorts after every geohash character
+    in byte order). Elsewhere the collation may be a locale one in which
+    that doesn't hold, so startswith is used; on PostgreSQL it is served
+    by the varchar_pattern_ops index Django adds for indexed CharFields.
+    """
+    by_range = connections[using].vendor == 'sqlite'
+    condition = Q()
+    for cell in cells:
+        if by_range:
+            condition |= Q(**{f'{field}__gte': cell, f'{field}__lt': cell + '~'})
+        else:
+            condition |= Q(**{f'{field}__startswith': cell})
+    return condition
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def nearby(queryset, latitude, longitude, radius_km, limit=None):
+    """
+    Objects of `queryset` (which must have latitude, longitude and geohash
+    fields) within radius_km of the point, as (distance_km, obj) pairs,
+    nearest first.
+    """
+    queryset = queryset.exclude(latitude=None).exclude(longitude=None)
+    precision = precision_for_radius(latitude, radius_km)
+    if precision:
+        queryset = queryset.filter(
+            cells_filter(covering_cells(latitude, longitude, precision), using=queryset.db))
+
+    # The 3x3 block is wider than the circle; the bounding box is checked
+    # on the rows the index found so only those inside it become objects
+    dlat, dlon = radius_degrees(latitude, radius_km)
+    queryset = queryset.filter(
+        latitude__gte=latitude - dlat, latitude__lte=latitude + dlat)
+    if -180.0 <= longitude - dlon and longitude + dlon <= 180.0:
+        queryset = queryset.filter(
+            longitude__gte=longitude - dlon, longitude__lte=longitude + dlon)
+
+    matches = []
+    for obj in queryset:
+        distance = haversine_km(latitude, longitude, obj.latitude, obj.longitude)
+        if distance <= radius_km:
+            matches.append((distance, obj))
+    matches.sort(key=lambda match: match[0])
+    return matches[:limit] if limit else matches
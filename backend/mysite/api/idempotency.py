@@ -0,0 +1,149 @@
+"""
+Idempotency-Key support for create endpoints.
+
+The first request with a given key claims it by inserting an
+IdempotencyKey row, committed straight away so duplicates can see it.
+Its work and the stored response then commit in one transaction, so a key
+is never marked done for work that rolled back. Retries with the same key
+replay the stored response without running the view. Duplicates arriving
+while the first request is still running wait for it (up to
+IDEMPOTENCY_WAIT_SECONDS) instead of racing it. A key left claimed by a
+crashed request is taken over after IDEMPOTENCY_LOCK_SECONDS.
+
+Keys expire after IDEMPOTENCY_KEY_TTL_HOURS; the sweep_idempotency_keys
+command deletes expired rows.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+class _Superseded(Exception):
+    # Our claim was taken over while the view ran
+    pass
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _error(message, status_code, **headers):
+    return Response({'error': message}, status=status_code, headers=headers or None)
+
+
+def _replay(record):
+    return Response(json.loads(record.response_body) if record.response_body else None,
+                    status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+
+def claim_key(user, key, fingerprint):
+    """
+    Claim `key` for a new request. Returns (record, None) when the caller
+    should run the request, or (None, response) to send instead: the
+    stored response, or an error if the key belongs to a different request
+    or the first request is still running after the wait.
+    """
+    ttl = timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    lock_timeout = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60))
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+    delay = 0.05
+
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, request_hash=fingerprint, locked_at=now, expires_at=now + ttl)
+            return record, None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        # None means the row was released or swept since the insert failed
+        if record is not None:
+            if record.expires_at <= now:
+                IdempotencyKey.objects.filter(pk=record.pk, expires_at=record.expires_at).delete()
+                continue
+            if record.request_hash != fingerprint:
+                return None, _error(f'{HEADER} has already been used for a different request',
+                                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if record.response_status is not None:
+                return None, _replay(record)
+            if record.locked_at <= now - lock_timeout:
+                # The first request died without finishing; take it over
+                taken = IdempotencyKey.objects.filter(
+                    pk=record.pk, response_status__isnull=True, locked_at=record.locked_at
+                ).update(locked_at=now)
+                if taken:
+                    record.locked_at = now
+                    return record, None
+
+        if time.monotonic() >= deadline:
+            return None, _error('A request with this Idempotency-Key is still in progress',
+                                status.HTTP_409_CONFLICT, **{'Retry-After': '1'})
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def complete_key(record, response):
+    """Store the response for replay; call in the transaction that did the work"""
+    stored = IdempotencyKey.objects.filter(
+        pk=record.pk, response_status__isnull=True, locked_at=record.locked_at
+    ).update(
+        response_status=response.status_code,
+        response_body=json.dumps(response.data, cls=JSONEncoder) if response.data is not None else ''
+    )
+    if not stored:
+        raise _Superseded()
+
+
+def release_key(record):
+    """Give up a claim so the request can be retried, unless it was taken over"""
+    IdempotencyKey.objects.filter(
+        pk=record.pk, response_status__isnull=True, locked_at=record.locked_at).delete()
+
+
+class IdempotentCreateMixin:
+    """
+    Honour an Idempotency-Key header on create (POST) for generic views.
+    Requests without the header are unaffected. With it, the create runs
+    in one transaction with storing its response; if the view raises, the
+    key is released for a retry.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        key = key.strip()
+        if not key or len(key) > 255:
+            return _error(f'{HEADER} must be 1 to 255 characters', status.HTTP_400_BAD_REQUEST)
+
+        record, response = claim_key(request.user, key, request_fingerprint(request))
+        if response is not None:
+            return response
+
+        try:
+            with transaction.atomic():
+                response = super().create(request, *args, **kwargs)
+                complete_key(record, response)
+        except _Superseded:
+            return _error('A request with this Idempotency-Key is still in progress',
+                          status.HTTP_409_CONFLICT, **{'Retry-After': '1'})
+        except BaseException:
+            release_key(record)
+            raise
+        return response
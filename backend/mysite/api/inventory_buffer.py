@@ -0,0 +1,131 @@
+"""
+Write-behind buffering of the sale counters on InventoryItem.
+
+Normally a sale updates its item's total_sold and current_quantity
+straight away, so every sale of a popular item queues on that one row.
+With INVENTORY_WRITE_BEHIND on, a sale appends a PendingSaleDelta instead
+and the flush_sale_deltas command folds the log into the counters in
+batches, one UPDATE per batch.
+
+Reads that show the counters go through with_pending_sales(), which
+subtracts the deltas not flushed yet, so they are accurate in either mode
+(and while a log left behind by switching the setting off drains).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .ledger import record_movement
+from .models import InventoryItem, PendingSaleDelta
+
+
+class InsufficientInventory(Exception):
+    def __init__(self, available, requested):
+        super().__init__(f'Insufficient inventory. Available: {available}, Requested: {requested}')
+        self.available = available
+        self.requested = requested
+
+
+def write_behind_enabled():
+    return getattr(settings, 'INVENTORY_WRITE_BEHIND', False)
+
+
+def with_pending_sales(queryset):
+    """
+    Annotate InventoryItems with pending_sold (units sold but not flushed
+    yet) and available (current_quantity less those units).
+    """
+    pending = (PendingSaleDelta.objects
+               .filter(item=OuterRef('pk'))
+               .order_by().values('item')
+               .annotate(total=Sum('quantity')).values('total'))
+    return queryset.annotate(
+        pending_sold=Coalesce(Subquery(pending, output_field=IntegerField()), 0),
+        available=F('current_quantity') - F('pending_sold'),
+    )
+
+
+def available_quantities(item_ids):
+    """Map item id -> units available, pending sales included"""
+    return dict(with_pending_sales(InventoryItem.objects.filter(id__in=item_ids))
+                .values_list('id', 'available'))
+
+
+def pending_validators(business):
+    """
+    Conditional GET validators for the business's pending deltas, which
+    change its items' counters without touching updated_at. Returns
+    (strings for the ETag, newest delta time for Last-Modified).
+    """
+    stats = PendingSaleDelta.objects.filter(item__business=business).aggregate(
+        last_id=Max('id'), count=Count('id'), last_at=Max('created_at'))
+    return [str(stats['last_id'] or ''), str(stats['count'])], stats['last_at']
+
+
+def take_sold_stock(item, quantity):
+    """
+    Count `quantity` units of `item` as sold. Call inside the transaction
+    inserting the sale; raises InsufficientInventory, changing nothing, if
+    fewer units are available.
+
+    Directly, this is one UPDATE that only matches while enough stock is
+    left. In write-behind mode the item row is only read: a new delta is
+    appended first and then checked against the stock, pending deltas
+    included. On SQLite that insert takes the database write lock before
+    the check reads anything, so the check is exact in any transaction
+    mode; on PostgreSQL two sales of an item's last units may both pass
+    it, which is the price of not locking the row. Either way the sale is
+    recorded in the inventory ledger.
+    """
+    if not write_behind_enabled():
+        updated = InventoryItem.objects.filter(pk=item.pk, current_quantity__gte=quantity).update(
+            total_sold=F('total_sold') + quantity,
+            current_quantity=F('current_quantity') - quantity,
+            updated_at=timezone.now()
+        )
+        if not updated:
+            raise InsufficientInventory(available_quantities([item.pk]).get(item.pk, 0), quantity)
+    else:
+        # The savepoint takes the delta back out if the stock isn't there
+        with transaction.atomic():
+            PendingSaleDelta.objects.create(item_id=item.pk, quantity=quantity)
+            available = available_quantities([item.pk]).get(item.pk, 0)
+            if available < 0:
+                raise InsufficientInventory(available + quantity, quantity)
+    # The ledger takes the sale straight away in both modes
+    record_movement(item, 'sold', -quantity)
+
+
+def flush_sale_deltas(batch_size=1000):
+    """
+    Fold up to `batch_size` of the oldest pending deltas into their items'
+    counters, in one transaction that also deletes them, so readers never
+    count a sale twice or miss it. Returns the number of deltas flushed.
+    """
+    with transaction.atomic():
+        # skip_locked lets several flushers run on PostgreSQL; SQLite
+        # ignores it and serializes them on the write lock instead
+        deltas = list(PendingSaleDelta.objects
+                      .select_for_update(skip_locked=True)
+                      .order_by('id')
+                      .values_list('id', 'item_id', 'quantity')[:batch_size])
+        if not deltas:
+            return 0
+
+        totals = {}
+        for _, item_id, quantity in deltas:
+            totals[item_id] = totals.get(item_id, 0) + quantity
+        sold = Case(
+            *[When(id=item_id, then=Value(quantity)) for item_id, quantity in totals.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        InventoryItem.objects.filter(id__in=totals).update(
+            total_sold=F('total_sold') + sold,
+            current_quantity=F('current_quantity') - sold,
+            updated_at=timezone.now()
+        )
+        PendingSaleDelta.objects.filter(id__in=[delta_id for delta_id, _, _ in deltas]).delete()
+    return len(deltas)
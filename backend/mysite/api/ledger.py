@@ -0,0 +1,166 @@
+"""
+Inventory ledger.
+
+Every change to an item's stock (additions, sales, waste, manual
+adjustments) appends an InventoryMovement; rows are never changed
+afterwards. The inventory API shows quantities on hand from the ledger;
+the counters on InventoryItem are still kept up to date for the paths
+that check stock with a conditional UPDATE, and are checked against it.
+
+A balance is the item's latest InventorySnapshot at or before the instant
+asked for, plus the movements recorded after it, so it costs one indexed
+range sum over a short tail however long the history is. The
+snapshot_inventory command takes snapshots of items that moved since
+their last one; reconcile_inventory compares the counters with the
+ledger. Movements are dated when recorded, so a balance replays the
+ledger in the order it was written. Items that existed before the ledger
+got an opening movement dated when it was introduced (migration 0015);
+their earlier history is not available.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import InventoryItem, InventoryMovement, InventorySnapshot
+
+# Stands in for "no snapshot yet": every movement is after it
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def record_movement(item, kind, quantity, at=None):
+    """Append one movement for `item`; a zero quantity is not recorded"""
+    if quantity:
+        InventoryMovement.objects.create(
+            business_id=item.business_id, item_id=item.pk, kind=kind, quantity=quantity,
+            recorded_at=at or timezone.now())
+
+
+def receive_stock(business, name, count):
+    """
+    Add `count` units to the business's item called `name`, creating it if
+    needed. The counters change through F() expressions, so concurrent
+    sales or waste aren't overwritten. Returns the refreshed item.
+    """
+    with transaction.atomic():
+        item, created = InventoryItem.objects.get_or_create(
+            business=business, name=name,
+            defaults={'total_added': count, 'current_quantity': count})
+        if not created:
+            InventoryItem.objects.filter(pk=item.pk).update(
+                total_added=F('total_added') + count,
+                current_quantity=F('current_quantity') + count,
+                updated_at=timezone.now()
+            )
+            item.refresh_from_db()
+        record_movement(item, 'added', count)
+    return item
+
+
+def with_balances(queryset, at=None):
+    """
+    Annotate InventoryItems with balance: their on-hand quantity per the
+    ledger as of `at` (default: everything recorded so far). The snapshot
+    it starts from and the movement tail after it are aliases, so they can
+    be filtered on (take_snapshots uses tail__isnull) but aren't selected.
+    """
+    snapshots = InventorySnapshot.objects.filter(item=OuterRef('pk')).order_by('-taken_at')
+    tail = InventoryMovement.objects.filter(item=OuterRef('pk'), recorded_at__gt=OuterRef('snapshot_at'))
+    if at is not None:
+        snapshots = snapshots.filter(taken_at__lte=at)
+        tail = tail.filter(recorded_at__lte=at)
+    tail = tail.order_by().values('item').annotate(total=Sum('quantity')).values('total')
+
+    # Views build this per request: the intermediates go in one alias() call
+    # (each may use the earlier ones) and only balance is selected, so the
+    # SQL doesn't repeat their subqueries as columns of their own
+    return queryset.alias(
+        snapshot_at=Coalesce(Subquery(snapshots.values('taken_at')[:1]), Value(_EPOCH)),
+        snapshot_quantity=Coalesce(Subquery(snapshots.values('quantity')[:1]), 0),
+        tail=Subquery(tail, output_field=IntegerField()),
+    ).annotate(balance=F('snapshot_quantity') + Coalesce(F('tail'), 0))
+
+
+def balances(items, at=None):
+    """Map item id -> on-hand quantity as of `at` for a queryset of InventoryItems"""
+    return dict(with_balances(items, at).values_list('id', 'balance'))
+
+
+def movement_totals(business, start, end):
+    """
+    Map item id -> {kind: total quantity} over movements recorded in
+    (start, end], read through the (business, recorded_at) index
+    """
+    totals = {}
+    for item_id, kind, total in (InventoryMovement.objects
+                                 .filter(business=business, recorded_at__gt=start, recorded_at__lte=end)
+                                 .order_by().values('item', 'kind')
+                                 .annotate(total=Sum('quantity'))
+                                 .values_list('item', 'kind', 'total')):
+        totals.setdefault(item_id, {})[kind] = total
+    return totals
+
+
+def take_snapshots(at=None, batch_size=1000):
+    """
+    Snapshot every item with movements since its last snapshot, as of
+    `at`. The default is INVENTORY_SNAPSHOT_LAG_SECONDS ago rather than
+    now, so a movement whose transaction commits a little after it was
+    timestamped can't end up behind a snapshot that missed it. Returns
+    the number of snapshots written.
+    """
+    if at is None:
+        at = timezone.now() - timedelta(seconds=getattr(settings, 'INVENTORY_SNAPSHOT_LAG_SECONDS', 60))
+    moved = (with_balances(InventoryItem.objects.all(), at)
+             .filter(tail__isnull=False)
+             .order_by()
+             .values_list('id', 'balance'))
+
+    written = 0
+    batch = []
+    for item_id, balance in moved.iterator(chunk_size=batch_size):
+        batch.append(InventorySnapshot(item_id=item_id, taken_at=at, quantity=balance))
+        if len(batch) >= batch_size:
+            written += len(InventorySnapshot.objects.bulk_create(batch, ignore_conflicts=True))
+            batch = []
+    if batch:
+        written += len(InventorySnapshot.objects.bulk_create(batch, ignore_conflicts=True))
+    return written
+
+
+def reconcile(business=None, fix=False):
+    """
+    Compare each item's current_quantity (less sales still buffered by
+    INVENTORY_WRITE_BEHIND) with its ledger balance. Returns a list of
+    (item id, name, counter, ledger) for the items that differ; with
+    fix=True their counters are reset to the ledger in the same
+    transaction.
+    """
+    # Imported here as inventory_buffer records sales through this module
+    from .inventory_buffer import with_pending_sales
+
+    items = InventoryItem.objects.all()
+    if business is not None:
+        items = items.filter(business=business)
+
+    with transaction.atomic():
+        drift = [row for row in (with_balances(with_pending_sales(items))
+                                 .order_by('id')
+                                 .values_list('id', 'name', 'available', 'balance'))
+                 if row[2] != row[3]]
+        if fix and drift:
+            correction = Case(
+                *[When(id=item_id, then=Value(ledger - counter)) for item_id, _, counter, ledger in drift],
+                default=Value(0),
+                output_field=IntegerField()
+            )
+            InventoryItem.objects.filter(id__in=[row[0] for row in drift]).update(
+                current_quantity=F('current_quantity') + correction,
+                updated_at=timezone.now()
+            )
+    return drift
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.inventory_buffer import flush_sale_deltas
+
+
+class Command(BaseCommand):
+    help = ('Fold sales buffered by INVENTORY_WRITE_BEHIND into the total_sold and '
+            'current_quantity counters of their inventory items')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Deltas folded in per transaction, to keep write locks short')
+        parser.add_argument('--interval', type=float,
+                            help='Keep flushing every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = 0
+            while True:
+                batch = flush_sale_deltas(options['batch_size'])
+                flushed += batch
+                if batch < options['batch_size']:
+                    break
+            self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} pending sales'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
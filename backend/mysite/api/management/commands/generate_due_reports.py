@@ -0,0 +1,80 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from api.reports import claim_due_run, execute_run
+
+User = get_user_model()
+
+
+def _init_worker():
+    # Needed when workers are spawned rather than forked
+    django.setup()
+
+
+def _result_of(run_id, func, *args):
+    """
+    Call func(*args) for a run, turning anything it raises (a lost worker,
+    a database error before the run could be marked) into a failed result
+    so the rest of the pass still goes ahead
+    """
+    try:
+        return func(*args)
+    except Exception as e:
+        return run_id, False, str(e) or type(e).__name__
+
+
+class Command(BaseCommand):
+    help = 'Generate inventory reports for every business whose report is due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of worker processes (1 runs inline)')
+        parser.add_argument('--stale-after', type=int, default=30,
+                            help='Minutes before a run left "running" by a crashed worker is retried')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum number of reports to generate this pass')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Served by the (user_type, next_report_at) index
+        due = User.objects.filter(
+            user_type='business', next_report_at__lte=now
+        ).order_by('next_report_at').values_list('id', 'next_report_at')
+        if options['limit']:
+            due = due[:options['limit']]
+
+        stale_after = timedelta(minutes=options['stale_after'])
+        run_ids = []
+        for business_id, scheduled_for in due:
+            run_id = claim_due_run(business_id, scheduled_for, now, stale_after)
+            if run_id is not None:
+                run_ids.append(run_id)
+
+        if not run_ids:
+            self.stdout.write('No reports due')
+            return
+
+        concurrency = max(1, options['concurrency'])
+        results = []
+        if concurrency == 1:
+            for run_id in run_ids:
+                results.append(_result_of(run_id, execute_run, run_id))
+        else:
+            # Workers must not inherit the parent's open database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=concurrency, initializer=_init_worker) as pool:
+                futures = {pool.submit(execute_run, run_id): run_id for run_id in run_ids}
+                for future in as_completed(futures):
+                    results.append(_result_of(futures[future], future.result))
+
+        failed = [(run_id, error) for run_id, ok, error in results if not ok]
+        for run_id, error in failed:
+            self.stdout.write(self.style.ERROR(f'Run {run_id} failed: {error}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(results) - len(failed)} reports ({len(failed)} failed)'))
@@ -0,0 +1,360 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from api import catalog_cache, geo
+from api.models import (DailyItemSales, InventoryItem, InventoryMovement, Order, OrderItem, Product,
+                        Sale, Store, WasteEvent)
+
+User = get_user_model()
+
+CITIES = [(40.73, -73.95), (34.05, -118.25), (41.88, -87.63), (29.76, -95.37), (47.61, -122.33)]
+STYLES = ['Classic', 'Spicy', 'Veggie', 'Deluxe', 'Grilled', 'Crispy', 'Garlic', 'Smoky',
+          'Truffle', 'Lemon', 'Honey', 'BBQ', 'Teriyaki', 'Margherita', 'Pepperoni']
+DISHES = ['Pizza', 'Burger', 'Salad', 'Pasta', 'Taco', 'Burrito', 'Sushi', 'Ramen', 'Curry',
+          'Sandwich', 'Soup', 'Wrap', 'Bagel', 'Muffin', 'Cake', 'Pie', 'Noodles', 'Dumplings',
+          'Kebab', 'Falafel', 'Pho', 'Bibimbap', 'Paella']
+INGREDIENTS = ['Flour', 'Tomatoes', 'Mozzarella', 'Lettuce', 'Chicken', 'Beef', 'Rice', 'Tofu',
+               'Onions', 'Garlic', 'Basil', 'Eggs', 'Milk', 'Butter', 'Buns', 'Tortillas',
+               'Noodles', 'Salmon', 'Avocado', 'Peppers', 'Mushrooms', 'Cheddar', 'Spinach']
+# Relative demand Monday..Sunday
+WEEKDAY_FACTORS = np.array([0.85, 0.9, 0.95, 1.0, 1.15, 1.35, 1.25])
+# Order hours: a lunch and a dinner peak
+ORDER_HOUR_WEIGHTS = np.array([0, 0, 0, 0, 0, 0, 1, 2, 3, 3, 4, 8, 12, 10, 5, 4, 5, 9,
+                               13, 12, 8, 5, 3, 1], dtype=np.float64)
+LOCK_RETRIES = 8
+
+
+def _init_worker():
+    # Needed when workers are spawned rather than forked
+    django.setup()
+
+
+@contextmanager
+def _explicit_timestamps(*fields):
+    # Keep the generated timestamps instead of letting auto_now(_add)
+    # stamp every row with the time of the insert
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _bulk_insert(model, objects, batch_size):
+    """
+    bulk_create in batches, each in its own short transaction so workers
+    take turns on SQLite's single write lock; retries while it's busy.
+    """
+    for start in range(0, len(objects), batch_size):
+        batch = objects[start:start + batch_size]
+        for attempt in range(LOCK_RETRIES):
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch, batch_size=batch_size)
+                break
+            except OperationalError as e:
+                if 'locked' not in str(e) or attempt == LOCK_RETRIES - 1:
+                    raise
+                time.sleep(min(0.05 * 2 ** attempt, 2.0))
+    return objects
+
+
+def _price(value):
+    # Menu-style prices: x.49 or x.99
+    return Decimal(f'{max(int(value), 1) + (0.49 if value % 1 < 0.5 else 0.99):.2f}')
+
+
+def _timestamps(rng, days, end):
+    """Datetimes on the given day offsets before `end`, at order-like hours"""
+    hours = rng.choice(24, size=len(days), p=ORDER_HOUR_WEIGHTS / ORDER_HOUR_WEIGHTS.sum())
+    seconds = rng.integers(0, 3600, size=len(days))
+    start_of_today = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Today's rows can't be later than now
+    return [min(end, start_of_today - timedelta(days=int(day)) + timedelta(hours=int(hour), seconds=int(second)))
+            for day, hour, second in zip(days, hours, seconds)]
+
+
+def generate_businesses(first, count, options):
+    """
+    Businesses first..first+count-1, each with a store, products, inventory
+    items and a year of daily sales and waste. Returns row counts.
+    """
+    rng = np.random.default_rng([options['seed'], 1, first])
+    prefix = options['prefix']
+    batch_size = options['batch_size']
+    n_days = options['days']
+    now = timezone.localtime()
+    today = timezone.localdate()
+    counts = {}
+
+    businesses = _bulk_insert(User, [
+        User(username=f'{prefix}-biz{i}', email=f'{prefix}-biz{i}@example.com',
+             password=options['password'], user_type='business',
+             reporting_frequency=rng.choice(['daily', 'weekly', 'weekly', 'monthly']),
+             next_report_at=now + timedelta(days=int(rng.integers(1, 8))))
+        for i in range(first, first + count)
+    ], batch_size)
+    counts['businesses'] = len(businesses)
+
+    stores = []
+    for business in businesses:
+        city = CITIES[int(rng.integers(len(CITIES)))]
+        lat = city[0] + rng.normal(0, 0.08)
+        lon = city[1] + rng.normal(0, 0.08)
+        stores.append(Store(
+            business_id=business.pk, name=f'{rng.choice(STYLES)} {rng.choice(DISHES)} House',
+            description='Generated load-test store', address=f'{rng.integers(1, 9999)} Main St',
+            latitude=lat, longitude=lon, geohash=geo.encode(lat, lon),
+            is_active=bool(rng.random() < 0.95)))
+    _bulk_insert(Store, stores, batch_size)
+    counts['stores'] = len(stores)
+
+    products = []
+    for store in stores:
+        n_products = max(5, int(rng.poisson(options['products_per_store'])))
+        prices = rng.lognormal(np.log(11), 0.45, size=n_products)
+        in_stock = rng.random(n_products) < 0.9
+        for price, stocked in zip(prices, in_stock):
+            # bulk_create skips Product.save(), which keeps in_stock in step
+            quantity = int(rng.integers(1, 200)) if stocked else 0
+            products.append(Product(
+                store_id=store.pk, name=f'{rng.choice(STYLES)} {rng.choice(DISHES)}',
+                description='Freshly made to order', price=_price(price),
+                in_stock=quantity > 0, stock_quantity=quantity))
+    _bulk_insert(Product, products, batch_size)
+    counts['products'] = len(products)
+
+    # Demand: per-item base rate x weekday pattern x yearly season x growth
+    day_offsets = np.arange(n_days - 1, -1, -1)
+    dates = [today - timedelta(days=int(offset)) for offset in day_offsets]
+    weekday = np.array([date.weekday() for date in dates])
+    day_of_year = np.array([date.timetuple().tm_yday for date in dates])
+    daily_factor = (WEEKDAY_FACTORS[weekday]
+                    * (1 + 0.15 * np.sin(2 * np.pi * day_of_year / 365.0))
+                    * np.linspace(0.9, 1.1, n_days))
+
+    counts.update(inventory_items=0, sales=0, daily_item_sales=0, waste_events=0, inventory_movements=0)
+    # All of an item's stock arrives at the start of the window
+    stocked_at = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=n_days - 1)
+    with _explicit_timestamps(Sale._meta.get_field('sold_at')):
+        for business in businesses:
+            n_items = options['items_per_business']
+            base = rng.gamma(2.0, 4.0, size=n_items)
+            sold = rng.poisson(np.outer(base, daily_factor))
+            wasted = rng.binomial(np.maximum(sold // 4, 0), 0.08)
+            on_hand = rng.integers(0, np.maximum(base * 14, 2).astype(np.int64))
+            cost = rng.lognormal(np.log(2.5), 0.6, size=n_items)
+            names = rng.choice(INGREDIENTS, size=n_items)
+
+            items = _bulk_insert(InventoryItem, [
+                InventoryItem(
+                    business_id=business.pk, name=f'{names[i]} {i}',
+                    total_added=int(sold[i].sum() + wasted[i].sum() + on_hand[i]),
+                    total_sold=int(sold[i].sum()), total_wasted=int(wasted[i].sum()),
+                    current_quantity=int(on_hand[i]),
+                    unit_cost=Decimal(f'{cost[i]:.2f}'),
+                    unit_price=Decimal(f'{cost[i] * rng.uniform(2.5, 4.0):.2f}'))
+                for i in range(n_items)
+            ], batch_size)
+            counts['inventory_items'] += len(items)
+            movements = [
+                InventoryMovement(business_id=business.pk, item_id=item.pk, kind='added',
+                                  quantity=item.total_added, recorded_at=stocked_at)
+                for item in items
+            ]
+
+            item_idx, day_idx = np.nonzero(sold)
+            sold_at = _timestamps(rng, day_offsets[day_idx], now)
+            _bulk_insert(Sale, [
+                Sale(business_id=business.pk, item_id=items[i].pk, quantity=int(sold[i, d]), sold_at=at)
+                for i, d, at in zip(item_idx, day_idx, sold_at)
+            ], batch_size)
+            movements += [
+                InventoryMovement(business_id=business.pk, item_id=items[i].pk, kind='sold',
+                                  quantity=-int(sold[i, d]), recorded_at=at)
+                for i, d, at in zip(item_idx, day_idx, sold_at)
+            ]
+            # One sale row per item and day, so the rollup mirrors it
+            _bulk_insert(DailyItemSales, [
+                DailyItemSales(business_id=business.pk, item_id=items[i].pk, day=dates[d], qty=int(sold[i, d]))
+                for i, d in zip(item_idx, day_idx)
+            ], batch_size)
+            counts['sales'] += len(item_idx)
+            counts['daily_item_sales'] += len(item_idx)
+
+            item_idx, day_idx = np.nonzero(wasted)
+            wasted_at = _timestamps(rng, day_offsets[day_idx], now)
+            reasons = rng.choice(['expired', 'spoiled', 'damaged'], size=len(item_idx), p=[0.6, 0.3, 0.1])
+            _bulk_insert(WasteEvent, [
+                WasteEvent(business_id=business.pk, item_id=items[i].pk, quantity=int(wasted[i, d]),
+                           reason=str(reason), wasted_at=at)
+                for i, d, at, reason in zip(item_idx, day_idx, wasted_at, reasons)
+            ], batch_size)
+            counts['waste_events'] += len(item_idx)
+            movements += [
+                InventoryMovement(business_id=business.pk, item_id=items[i].pk, kind='wasted',
+                                  quantity=-int(wasted[i, d]), recorded_at=at)
+                for i, d, at in zip(item_idx, day_idx, wasted_at)
+            ]
+            _bulk_insert(InventoryMovement, movements, batch_size)
+            counts['inventory_movements'] += len(movements)
+
+    connections.close_all()
+    return counts
+
+
+def generate_customers(first, count, options):
+    """
+    Customers first..first+count-1 and their order history, spread over
+    stores with a long-tailed popularity. Returns row counts.
+    """
+    rng = np.random.default_rng([options['seed'], 2, first])
+    prefix = options['prefix']
+    batch_size = options['batch_size']
+    now = timezone.localtime()
+
+    store_ids = list(Store.objects.filter(business__email__startswith=f'{prefix}-biz')
+                     .order_by('id').values_list('id', flat=True))
+    menus = {}
+    for product_id, store_id, price in (Product.objects.filter(store_id__in=store_ids, in_stock=True)
+                                        .order_by('id').values_list('id', 'store_id', 'price')):
+        menus.setdefault(store_id, []).append((product_id, price))
+    store_ids = [store_id for store_id in store_ids if store_id in menus]
+    # Same popularity ranking in every worker: a few stores get most orders
+    ranking = np.random.default_rng(options['seed']).permutation(len(store_ids))
+    popularity = 1.0 / (ranking + 1) ** 1.1
+    popularity /= popularity.sum()
+
+    customers = _bulk_insert(User, [
+        User(username=f'{prefix}-cust{i}', email=f'{prefix}-cust{i}@example.com',
+             password=options['password'], user_type='customer')
+        for i in range(first, first + count)
+    ], batch_size)
+
+    orders = []
+    order_lines = []
+    for customer in customers:
+        n_orders = int(rng.poisson(options['orders_per_customer']))
+        if not n_orders:
+            continue
+        # Recent days are busier as the business grows
+        days = options['days'] - 1 - np.minimum(
+            (rng.power(1.3, size=n_orders) * options['days']).astype(np.int64), options['days'] - 1)
+        created = _timestamps(rng, days, now)
+        chosen = rng.choice(len(store_ids), size=n_orders, p=popularity)
+        for store_index, created_at, day in zip(chosen, created, days):
+            menu = menus[store_ids[store_index]]
+            n_lines = min(len(menu), 1 + int(rng.poisson(1.2)))
+            lines = [(menu[j][0], 1 + int(rng.poisson(0.3)), menu[j][1])
+                     for j in rng.choice(len(menu), size=n_lines, replace=False)]
+            if day > 0:
+                status = 'cancelled' if rng.random() < 0.08 else 'completed'
+            else:
+                status = rng.choice(['pending', 'confirmed', 'preparing', 'ready', 'completed'])
+            orders.append(Order(
+                customer_id=customer.pk, store_id=store_ids[store_index], status=status,
+                total_amount=sum(price * quantity for _, quantity, price in lines),
+                delivery_address=f'{rng.integers(1, 9999)} Elm St',
+                created_at=created_at, updated_at=created_at))
+            order_lines.append(lines)
+
+    with _explicit_timestamps(Order._meta.get_field('created_at'),
+                              Order._meta.get_field('updated_at')):
+        _bulk_insert(Order, orders, batch_size)
+    items = [OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity, price=price)
+             for order, lines in zip(orders, order_lines)
+             for product_id, quantity, price in lines]
+    _bulk_insert(OrderItem, items, batch_size)
+
+    connections.close_all()
+    return {'customers': len(customers), 'orders': len(orders), 'order_items': len(items)}
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic dataset (businesses, stores, products, inventory, a year of sales, customers and orders) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=100)
+        parser.add_argument('--customers', type=int, default=None,
+                            help='Defaults to 20 per business')
+        parser.add_argument('--products-per-store', type=int, default=40)
+        parser.add_argument('--items-per-business', type=int, default=60)
+        parser.add_argument('--orders-per-customer', type=float, default=12)
+        parser.add_argument('--days', type=int, default=365, help='Days of sales history')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of worker processes (1 runs inline)')
+        parser.add_argument('--business-chunk', type=int, default=5,
+                            help='Businesses per worker task')
+        parser.add_argument('--customer-chunk', type=int, default=1000,
+                            help='Customers per worker task')
+        parser.add_argument('--prefix', default='load',
+                            help='Username/email prefix, so several datasets can coexist')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['businesses'] < 1:
+            raise CommandError('--days and --businesses must be at least 1')
+        if User.objects.filter(email__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"Data with prefix {options['prefix']!r} already exists; "
+                               'pass a different --prefix')
+        if options['customers'] is None:
+            options['customers'] = options['businesses'] * 20
+        # Hashing is deliberately slow; every generated user shares one hash
+        options['password'] = make_password('load-test-pass')
+
+        started = time.perf_counter()
+        totals = {}
+        business_tasks = [
+            (generate_businesses, first, min(options['business_chunk'], options['businesses'] - first))
+            for first in range(0, options['businesses'], options['business_chunk'])
+        ]
+        customer_tasks = [
+            (generate_customers, first, min(options['customer_chunk'], options['customers'] - first))
+            for first in range(0, options['customers'], options['customer_chunk'])
+        ]
+        # Customers order from stores, so businesses must be complete first
+        for label, tasks in (('businesses', business_tasks), ('customers', customer_tasks)):
+            for counts in self.run_tasks(tasks, options):
+                for key, value in counts.items():
+                    totals[key] = totals.get(key, 0) + value
+            self.stdout.write(f'Finished {label} after {time.perf_counter() - started:.1f}s')
+
+        # Bulk inserts skip the signals that invalidate the catalog cache
+        catalog_cache.bump_version(catalog_cache.STORE_LIST_VERSION_KEY)
+
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        summary = ', '.join(f'{value} {key}' for key, value in totals.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s): {summary}'))
+
+    def run_tasks(self, tasks, options):
+        workers = max(1, options['workers'])
+        if workers == 1:
+            for func, first, count in tasks:
+                yield func(first, count, options)
+            return
+
+        # Workers must not inherit the parent's open database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(func, first, count, options) for func, first, count in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                yield future.result()
+                if done % max(1, len(futures) // 10) == 0:
+                    self.stdout.write(f'  {done}/{len(futures)} tasks done')
@@ -0,0 +1,17 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.reports import enforce_report_retention
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Apply report retention and per-business disk quotas'
+
+    def handle(self, *args, **options):
+        removed = 0
+        businesses = User.objects.filter(inventory_reports__isnull=False).distinct()
+        for business in businesses.iterator():
+            removed += enforce_report_retention(business)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} reports'))
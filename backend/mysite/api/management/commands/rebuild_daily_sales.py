@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.utils.dateparse import parse_date
+
+from api.rollups import rebuild_daily_sales
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily item sales rollup from raw sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', help='Only rebuild for this business email')
+        parser.add_argument('--since', help='Only rebuild days on or after YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        business = None
+        if options['business']:
+            try:
+                business = User.objects.get(email=options['business'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {options['business']}")
+
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError('--since must be in YYYY-MM-DD format')
+
+        written = rebuild_daily_sales(
+            business=business, since=since, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} daily rollup rows'))
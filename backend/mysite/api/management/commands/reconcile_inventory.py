@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ledger import reconcile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Compare inventory items' current_quantity with their ledger balance and "
+            "list the items that drifted")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', help='Only check this business email')
+        parser.add_argument('--fix', action='store_true',
+                            help='Reset drifted counters to the ledger balance')
+
+    def handle(self, *args, **options):
+        business = None
+        if options['business']:
+            try:
+                business = User.objects.get(email=options['business'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user with email {options['business']}")
+
+        drift = reconcile(business=business, fix=options['fix'])
+        for item_id, name, counter, ledger in drift:
+            self.stdout.write(f'{item_id} {name}: counter {counter}, ledger {ledger}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All inventory counters match the ledger'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Reset {len(drift)} items to their ledger balance'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} items differ from the ledger'))
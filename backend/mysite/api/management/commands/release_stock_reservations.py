@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.stock import expire_pending_orders, sweep_reservations
+
+
+class Command(BaseCommand):
+    help = ('Cancel orders left pending past STOCK_RESERVATION_MINUTES and give the stock '
+            'held for cancelled orders back to their products')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep sweeping every INTERVAL seconds')
+        parser.add_argument('--no-expire', action='store_true',
+                            help='Only release stock of orders that are already cancelled')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = [] if options['no_expire'] else expire_pending_orders()
+            released = sweep_reservations()
+            self.stdout.write(self.style.SUCCESS(
+                f'Expired {len(expired)} pending orders, released {released} reservations'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = ('Snapshot the ledger balance of every inventory item that moved since its last '
+            'snapshot, so balances only sum a short tail of movements')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Snapshots written per insert')
+        parser.add_argument('--interval', type=float,
+                            help='Keep snapshotting every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            written = take_snapshots(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} inventory snapshots'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows deleted per statement, to keep write locks short')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        removed = 0
+        while True:
+            # Served by the expires_at index
+            batch = list(IdempotencyKey.objects.filter(expires_at__lte=now)
+                         .values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            removed += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database into the replica files (DB_REPLICAS), '
+            'standing in for replication when testing read routing locally')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep copying every INTERVAL seconds, simulating replication lag')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('sync_replicas only copies SQLite databases; '
+                               'use the database server\'s own replication')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured; set DB_REPLICAS')
+
+        while True:
+            self.sync(str(primary['NAME']))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary_path):
+        # The backup API copies a consistent snapshot even while the
+        # primary is being written to
+        source = sqlite3.connect(primary_path)
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'Copied primary to {alias}'))
+        finally:
+            source.close()
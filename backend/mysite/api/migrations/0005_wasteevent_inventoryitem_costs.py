@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_dailyitemsales'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='total_wasted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='WasteEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('reason', models.CharField(blank=True, max_length=50)),
+                ('wasted_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waste_events', to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waste_events', to='api.inventoryitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['business', 'wasted_at'], name='api_wasteev_busines_7f28ca_idx'), models.Index(fields=['item', 'wasted_at'], name='api_wasteev_item_id_6547eb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_inventoryreport_content_addressed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryReportLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_name', models.CharField(max_length=255)),
+                ('opening', models.IntegerField(default=0)),
+                ('added', models.IntegerField(default=0)),
+                ('sold', models.IntegerField(default=0)),
+                ('wasted', models.IntegerField(default=0)),
+                ('closing', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventoryreport',
+            name='closing_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['business', 'sold_at'], name='api_sale_busines_75ce4e_idx'),
+        ),
+        migrations.AddField(
+            model_name='inventoryreportline',
+            name='item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_lines', to='api.inventoryitem'),
+        ),
+        migrations.AddField(
+            model_name='inventoryreportline',
+            name='report',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='api.inventoryreport'),
+        ),
+    ]
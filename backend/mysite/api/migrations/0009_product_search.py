@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from api.fts import create_fts_index, drop_fts_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_period_reports'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
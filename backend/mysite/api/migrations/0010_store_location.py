@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:57
+
+from django.db import migrations, models
+
+from api.fts import without_fts_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_product_search'),
+    ]
+
+    operations = without_fts_triggers(
+        migrations.AddField(
+            model_name='store',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    )
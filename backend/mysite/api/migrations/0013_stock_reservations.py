@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+from api.fts import without_fts_triggers
+
+
+def derive_in_stock(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    Product.objects.filter(stock_quantity__lt=0).update(stock_quantity=0)
+    Product.objects.filter(stock_quantity__gt=0).update(in_stock=True)
+    Product.objects.filter(stock_quantity=0).update(in_stock=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(derive_in_stock, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('released', 'Released')], default='held', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        *without_fts_triggers(
+            migrations.AlterField(
+                model_name='product',
+                name='in_stock',
+                field=models.BooleanField(default=True, editable=False),
+            ),
+            migrations.AddConstraint(
+                model_name='product',
+                constraint=models.CheckConstraint(condition=models.Q(('stock_quantity__gte', 0)), name='product_stock_not_negative'),
+            ),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.order'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='api.product'),
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(condition=models.Q(('status', 'held')), fields=['order'], name='api_reservation_held_idx'),
+        ),
+    ]
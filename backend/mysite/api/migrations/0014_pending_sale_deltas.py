@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSaleDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_sale_deltas', to='api.inventoryitem')),
+            ],
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def open_ledger(apps, schema_editor):
+    # Carry each item's current quantity (less sales still buffered in
+    # PendingSaleDelta) into the ledger as of now. That quantity is only
+    # known now: dating it at the item's creation would misstate every
+    # earlier balance, so the ledger has no history before this migration
+    # and balances and period reports for earlier instants are 0
+    now = timezone.now()
+    InventoryItem = apps.get_model('api', 'InventoryItem')
+    InventoryMovement = apps.get_model('api', 'InventoryMovement')
+    PendingSaleDelta = apps.get_model('api', 'PendingSaleDelta')
+    pending = dict(PendingSaleDelta.objects.values('item')
+                   .annotate(total=Sum('quantity')).values_list('item', 'total'))
+    batch = []
+    for item_id, business_id, quantity in (
+            InventoryItem.objects.values_list('id', 'business_id', 'current_quantity')
+            .iterator(chunk_size=2000)):
+        quantity -= pending.get(item_id, 0)
+        if quantity:
+            batch.append(InventoryMovement(item_id=item_id, business_id=business_id, kind='opening',
+                                           quantity=quantity, recorded_at=now))
+        if len(batch) >= 2000:
+            InventoryMovement.objects.bulk_create(batch)
+            batch = []
+    InventoryMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_pending_sale_deltas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('added', 'Added'), ('sold', 'Sold'), ('wasted', 'Wasted'), ('adjusted', 'Adjusted')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to=settings.AUTH_USER_MODEL)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='api.inventoryitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'recorded_at'], name='api_invento_item_id_ba2e01_idx'), models.Index(fields=['business', 'recorded_at'], name='api_invento_busines_737c0d_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='api.inventoryitem')),
+            ],
+            options={
+                'unique_together': {('item', 'taken_at')},
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_inventory_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='order',
+            name='stripe_payment_intent_id',
+        ),
+    ]
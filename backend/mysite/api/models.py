@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from . import geo
 
 User = get_user_model()
 
@@ -21,7 +24,10 @@ class InventoryItem(models.Model):
     name = models.CharField(max_length=255)
     total_added = models.IntegerField(default=0)
     total_sold = models.IntegerField(default=0)
+    total_wasted = models.IntegerField(default=0)
     current_quantity = models.IntegerField(default=0)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -44,24 +50,124 @@ class Sale(models.Model):
     quantity = models.IntegerField()
     sold_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'sold_at']),
+        ]
+
     def __str__(self):
         return f"{self.business.email} - {self.item.name} x{self.quantity}"
 
 
+class DailyItemSales(models.Model):
+    # Rollup of Sale rows per item per day, kept in step with each sale insert
+    business = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='daily_item_sales')
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.CASCADE, related_name='daily_sales')
+    day = models.DateField()
+    qty = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['item', 'day']
+        indexes = [
+            models.Index(fields=['business', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.business.email} - {self.item.name} {self.day}: {self.qty}"
+
+
+class WasteEvent(models.Model):
+    business = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='waste_events')
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.CASCADE, related_name='waste_events')
+    quantity = models.IntegerField()
+    # e.g. expired, spoiled, damaged
+    reason = models.CharField(max_length=50, blank=True)
+    wasted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'wasted_at']),
+            models.Index(fields=['item', 'wasted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.business.email} - {self.item.name} wasted x{self.quantity}"
+
+
 class InventoryReport(models.Model):
     business = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='inventory_reports')
     # daily, weekly, monthly, custom
     report_type = models.CharField(max_length=20)
     file_path = models.CharField(max_length=500)
+    # Download name; file_path itself is content-addressed by content_hash
+    filename = models.CharField(max_length=255, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    file_size = models.BigIntegerField(default=0)
     generated_at = models.DateTimeField(auto_now_add=True)
+    last_accessed_at = models.DateTimeField(null=True, blank=True)
     period_start = models.DateField()
     period_end = models.DateField()
+    # Instant the closing balances were taken; the next report starts here
+    closing_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'generated_at']),
+        ]
 
     def __str__(self):
         return f"{self.business.email} - {self.report_type} report ({self.period_start} to {self.period_end})"
 
 
+class InventoryReportLine(models.Model):
+    # Per-item movement over a report's period
+    report = models.ForeignKey(
+        InventoryReport, on_delete=models.CASCADE, related_name='lines')
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.SET_NULL, null=True, related_name='report_lines')
+    item_name = models.CharField(max_length=255)
+    opening = models.IntegerField(default=0)
+    added = models.IntegerField(default=0)
+    sold = models.IntegerField(default=0)
+    wasted = models.IntegerField(default=0)
+    closing = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.item_name}: {self.opening} -> {self.closing} (report {self.report_id})"
+
+
+class ReportRun(models.Model):
+    # One row per scheduled report slot, so the scheduler never builds the
+    # same slot twice across crashes or restarts
+    STATUS_CHOICES = (
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    business = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='report_runs')
+    scheduled_for = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    report = models.ForeignKey(
+        InventoryReport, on_delete=models.SET_NULL, null=True, blank=True, related_name='runs')
+    attempts = models.IntegerField(default=1)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['business', 'scheduled_for']
+
+    def __str__(self):
+        return f"{self.business.email} - report run {self.scheduled_for} ({self.status})"
+
+
 class Store(models.Model):
     business = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name='store', limit_choices_to={'user_type': 'business'})
@@ -69,6 +175,10 @@ class Store(models.Model):
     description = models.TextField(blank=True)
     address = models.TextField()
     phone = models.CharField(max_length=15, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Derived from latitude/longitude on save; indexed for nearby searches
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -76,6 +186,16 @@ class Store(models.Model):
     def __str__(self):
         return f"{self.name} - {self.business.email}"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
 
 class Product(models.Model):
     store = models.ForeignKey(
@@ -84,14 +204,28 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image_url = models.URLField(blank=True)
-    in_stock = models.BooleanField(default=True)
+    # Derived from stock_quantity on save and by stock reservations
+    in_stock = models.BooleanField(default=True, editable=False)
     stock_quantity = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(stock_quantity__gte=0),
+                                   name='product_stock_not_negative'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.store.name}"
 
+    def save(self, *args, **kwargs):
+        self.in_stock = self.stock_quantity > 0
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'stock_quantity' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'in_stock'}
+        super().save(*args, **kwargs)
+
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -111,9 +245,18 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     # Stripe payment intent field removed
     delivery_address = models.TextField()
+    # Bumped on every status change; writers send the version they last
+    # saw so concurrent updates can't silently overwrite each other
+    version = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # The business order queue: a store's orders in a status, oldest first
+            models.Index(fields=['store', 'status', 'created_at']),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.customer.email}"
 
@@ -128,3 +271,110 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} x{self.quantity} - Order {self.order.id}"
+
+
+class StockReservation(models.Model):
+    # Stock taken off a product for an order. Released (given back) if the
+    # order is cancelled; otherwise it stays held as the stock was sold
+    STATUS_CHOICES = (
+        ('held', 'Held'),
+        ('released', 'Released'),
+    )
+
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='held')
+    created_at = models.DateTimeField(default=timezone.now)
+    released_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The sweeper only looks at held reservations
+            models.Index(fields=['order'], condition=models.Q(status='held'),
+                         name='api_reservation_held_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} x{self.quantity} for Order {self.order_id} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    # One row per Idempotency-Key a user has sent, holding the response to
+    # replay to retries of that request until it expires
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 of the method, path and body, to reject a key reused for a different request
+    request_hash = models.CharField(max_length=64)
+    # Null while the first request is still being processed
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    locked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+
+    def __str__(self):
+        return f"{self.user.email} - {self.key}"
+
+
+class PendingSaleDelta(models.Model):
+    # A sale not yet folded into its item's total_sold/current_quantity.
+    # Only written with INVENTORY_WRITE_BEHIND on; see api/inventory_buffer.py
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.CASCADE, related_name='pending_sale_deltas')
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.item.name} -{self.quantity} (pending)"
+
+
+class InventoryMovement(models.Model):
+    # Append-only ledger of an item's stock: rows are never updated or
+    # deleted. quantity is the signed change to the on-hand quantity
+    KIND_CHOICES = (
+        # Balance carried over from before the ledger existed
+        ('opening', 'Opening balance'),
+        ('added', 'Added'),
+        ('sold', 'Sold'),
+        ('wasted', 'Wasted'),
+        # Quantity set by hand, recorded as the difference
+        ('adjusted', 'Adjusted'),
+    )
+
+    business = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='inventory_movements')
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'recorded_at']),
+            models.Index(fields=['business', 'recorded_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.item.name} {self.kind} {self.quantity:+d}"
+
+
+class InventorySnapshot(models.Model):
+    # An item's on-hand quantity per the ledger as of taken_at, so balances
+    # are summed from the latest snapshot instead of the first movement
+    item = models.ForeignKey(
+        InventoryItem, on_delete=models.CASCADE, related_name='snapshots')
+    taken_at = models.DateTimeField()
+    quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = ['item', 'taken_at']
+
+    def __str__(self):
+        return f"{self.item.name} @ {self.taken_at}: {self.quantity}"
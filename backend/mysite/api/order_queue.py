@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import catalog_cache
+from .events import ORDER_EVENT_FIELDS, publish_order_status
+from .models import Order
+from .stock import release_reservations
+
+# Allowed status changes; completed and cancelled are final
+ORDER_TRANSITIONS = {
+    'pending': ('confirmed', 'cancelled'),
+    'confirmed': ('preparing', 'cancelled'),
+    'preparing': ('ready', 'cancelled'),
+    'ready': ('completed',),
+    'completed': (),
+    'cancelled': (),
+}
+ACTIVE_STATUSES = ('pending', 'confirmed', 'preparing', 'ready')
+
+
+class _Conflict(Exception):
+    pass
+
+
+def order_queue(store, statuses=ACTIVE_STATUSES):
+    """A store's orders in the given statuses, oldest first"""
+    return (Order.objects
+            .filter(store=store, status__in=statuses)
+            .select_related('store', 'customer')
+            .prefetch_related('items__product')
+            .order_by('created_at', 'id'))
+
+
+def transition_orders(store, versions, to_status):
+    """
+    Move a store's orders to `to_status` in one conditional UPDATE.
+
+    `versions` maps order id -> the version the caller last saw. An order
+    only changes if it still has that version and its current status may
+    move to `to_status`, so a concurrent change is never overwritten. The
+    batch is all-or-nothing: if any order fails either check nothing is
+    changed. Cancelling gives the orders' reserved stock back. Subscribers
+    to the orders' event channels are notified once the change commits.
+
+    Returns (updated order ids, conflicts); conflicts is a list of dicts
+    describing each order that blocked the batch, empty on success.
+    """
+    from_statuses = [status for status, targets in ORDER_TRANSITIONS.items()
+                     if to_status in targets]
+    matches = Q()
+    for order_id, version in versions.items():
+        matches |= Q(id=order_id, version=version)
+
+    try:
+        with transaction.atomic():
+            updated = Order.objects.filter(
+                matches, store=store, status__in=from_statuses
+            ).update(
+                status=to_status,
+                version=F('version') + 1,
+                updated_at=timezone.now()
+            )
+            if updated != len(versions):
+                raise _Conflict()
+            if to_status == 'cancelled':
+                release_reservations(list(versions))
+            rows = list(Order.objects.filter(id__in=versions).values(*ORDER_EVENT_FIELDS))
+            transaction.on_commit(lambda: publish_order_status(rows))
+            # Bulk updates skip the Order signals
+            transaction.on_commit(lambda: catalog_cache.bump_dashboard(store.id))
+    except _Conflict:
+        return [], _conflicts(store, versions, to_status)
+    return list(versions), []
+
+
+def _conflicts(store, versions, to_status):
+    current = {order.id: order for order in
+               Order.objects.filter(store=store, id__in=versions).only('id', 'status', 'version')}
+    conflicts = []
+    for order_id, version in versions.items():
+        order = current.get(order_id)
+        if order is None:
+            conflicts.append({'id': order_id, 'reason': 'not_found'})
+        elif order.version != version:
+            conflicts.append({'id': order_id, 'reason': 'stale_version',
+                              'status': order.status, 'version': order.version})
+        elif to_status not in ORDER_TRANSITIONS[order.status]:
+            conflicts.append({'id': order_id, 'reason': 'invalid_transition',
+                              'status': order.status, 'version': order.version})
+    return conflicts
@@ -0,0 +1,359 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import openpyxl
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl.styles import Font, PatternFill
+
+from . import ledger
+from .models import InventoryItem, InventoryReport, InventoryReportLine, ReportRun
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+INVENTORY_HEADERS = ['Item Name', 'Total Added', 'Total Sold', 'Current Quantity']
+PERIOD_HEADERS = ['Item Name', 'Opening', 'Added', 'Sold', 'Wasted', 'Closing']
+
+
+def reports_dir(business_id=None):
+    # Create inventory_reports directory if it doesn't exist
+    path = os.path.join(settings.BASE_DIR, 'inventory_reports')
+    if business_id is not None:
+        path = os.path.join(path, str(business_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def render_inventory_workbook(title, headers, rows):
+    """
+    Render a one-sheet workbook with a bold grey header row and
+    auto-sized columns. Returns the .xlsx bytes (already a deflated zip).
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = title
+
+    # Add headers
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(
+            start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+
+    # Add data
+    for row, values in enumerate(rows, 2):
+        for col, value in enumerate(values, 1):
+            ws.cell(row=row, column=col, value=value)
+
+    # Auto-adjust column widths
+    for column in ws.columns:
+        max_length = 0
+        column_letter = column[0].column_letter
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            except:
+                pass
+        adjusted_width = min(max_length + 2, 50)
+        ws.column_dimensions[column_letter].width = adjusted_width
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def store_report_file(business_id, content):
+    """
+    Store report bytes under a content-addressed name,
+    inventory_reports/<business_id>/<sha256>.xlsx. Identical content is
+    stored once. Returns (file_path, sha256, size).
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    directory = reports_dir(business_id)
+    file_path = os.path.join(directory, f"{digest}.xlsx")
+    if not os.path.exists(file_path):
+        # Write then rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return file_path, digest, len(content)
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def report_filename(user, today):
+    # Generate filename based on frequency
+    if user.reporting_frequency == 'daily':
+        return f"inventory_daily_{today.strftime('%Y-%m-%d')}.xlsx"
+    elif user.reporting_frequency == '3days':
+        return f"inventory_3days_{today.strftime('%Y-%m-%d')}.xlsx"
+    elif user.reporting_frequency == 'weekly':
+        week_num = today.isocalendar()[1]
+        return f"inventory_weekly_W{week_num:02d}.xlsx"
+    elif user.reporting_frequency == 'monthly':
+        return f"inventory_monthly_{today.strftime('%Y-%m')}.xlsx"
+    elif user.reporting_frequency == 'custom':
+        days = user.custom_reporting_days or 7
+        return f"inventory_custom_{days}_days_{today.strftime('%Y-%m-%d')}.xlsx"
+    return f"inventory_{today.strftime('%Y-%m-%d_%H-%M-%S')}.xlsx"
+
+
+def period_movements(user, now=None):
+    """
+    Per-item movement since the business's last period report, read from
+    the inventory ledger.
+
+    Opening and closing quantities are ledger balances at the window's
+    ends (each the latest snapshot plus a short tail of movements), and
+    sales and waste are summed from the movements inside the window
+    through the (business, recorded_at) index. Anything else that changed
+    the balance, additions and manual adjustments, is reported as added.
+    Without a previous report the window is the nominal reporting
+    interval ending now.
+
+    Returns (start, end, lines) with unsaved InventoryReportLine objects.
+    """
+    end = now or timezone.now()
+    # One transaction so balances and movements come from the same snapshot
+    with transaction.atomic():
+        previous = (InventoryReport.objects
+                    .filter(business=user, closing_at__isnull=False, closing_at__lt=end)
+                    .order_by('-closing_at')
+                    .first())
+        if previous:
+            start = previous.closing_at
+        else:
+            first_day = timezone.localdate(end) - (user.reporting_interval() - timedelta(days=1))
+            start = datetime.combine(first_day, datetime.min.time(),
+                                     tzinfo=timezone.get_current_timezone())
+
+        items = InventoryItem.objects.filter(business=user)
+        names = list(items.order_by('name').values_list('id', 'name'))
+        opening = ledger.balances(items, start)
+        closing = ledger.balances(items, end)
+        moved = ledger.movement_totals(user, start, end)
+
+    lines = []
+    for item_id, name in names:
+        item_sold = -moved.get(item_id, {}).get('sold', 0)
+        item_wasted = -moved.get(item_id, {}).get('wasted', 0)
+        lines.append(InventoryReportLine(
+            item_id=item_id,
+            item_name=name,
+            opening=opening[item_id],
+            added=closing[item_id] - opening[item_id] + item_sold + item_wasted,
+            sold=item_sold,
+            wasted=item_wasted,
+            closing=closing[item_id]
+        ))
+    return start, end, lines
+
+
+def build_inventory_report(user):
+    """
+    Write the period workbook for a business and return its unsaved
+    InventoryReport and lines. Only reads from the database.
+    """
+    start, end, lines = period_movements(user)
+    rows = [
+        (line.item_name, line.opening, line.added, line.sold, line.wasted, line.closing)
+        for line in lines
+    ]
+
+    today = datetime.now()
+    content = render_inventory_workbook("Inventory Summary", PERIOD_HEADERS, rows)
+    file_path, digest, size = store_report_file(user.id, content)
+
+    report = InventoryReport(
+        business=user,
+        report_type=user.reporting_frequency,
+        file_path=file_path,
+        filename=report_filename(user, today),
+        content_hash=digest,
+        file_size=size,
+        period_start=timezone.localdate(start),
+        period_end=timezone.localdate(end),
+        closing_at=end
+    )
+    return report, lines
+
+
+def save_report(report, lines):
+    report.save()
+    for line in lines:
+        line.report = report
+    InventoryReportLine.objects.bulk_create(lines)
+
+
+def generate_inventory_report(user):
+    """
+    Build the inventory workbook for a business and record it
+    """
+    report, lines = build_inventory_report(user)
+    with transaction.atomic():
+        save_report(report, lines)
+    enforce_report_retention(user)
+    return report
+
+
+def touch_report(report, now=None):
+    """
+    Record a download for LRU eviction. At most one write per report per
+    hour so repeat downloads stay cheap.
+    """
+    now = now or timezone.now()
+    if report.last_accessed_at and report.last_accessed_at > now - timedelta(hours=1):
+        return
+    InventoryReport.objects.filter(pk=report.pk).update(last_accessed_at=now)
+    report.last_accessed_at = now
+
+
+def enforce_report_retention(business, now=None):
+    """
+    Apply the retention policy to one business's reports: drop reports
+    older than REPORT_RETENTION_DAYS, then evict the least recently used
+    ones until the business's files fit in REPORT_DISK_QUOTA_BYTES.
+    Returns the number of reports removed.
+    """
+    now = now or timezone.now()
+    reports = InventoryReport.objects.filter(business=business)
+    removed = []
+
+    retention_days = getattr(settings, 'REPORT_RETENTION_DAYS', None)
+    # The newest report, and the newest period report whose closing
+    # balances open the next period, are never removed
+    protected = {
+        reports.aggregate(newest=Max('id'))['newest'],
+        reports.filter(closing_at__isnull=False).order_by('-closing_at')
+        .values_list('id', flat=True).first(),
+    }
+
+    if retention_days:
+        expired = reports.filter(generated_at__lt=now - timedelta(days=retention_days))
+        removed += list(expired.exclude(id__in=protected).values_list('id', 'file_path'))
+
+    quota = getattr(settings, 'REPORT_DISK_QUOTA_BYTES', None)
+    if quota:
+        removed_ids = {report_id for report_id, _ in removed}
+        # Identical content shares one file, so count each hash once
+        candidates = list(reports
+                          .exclude(id__in=removed_ids)
+                          .annotate(last_used=Coalesce('last_accessed_at', 'generated_at'))
+                          .order_by('-last_used', '-id')
+                          .values_list('id', 'file_path', 'content_hash', 'file_size'))
+        used, seen = 0, set()
+        for report_id, file_path, digest, size in candidates:
+            key = digest or file_path
+            if key in seen:
+                continue
+            if used + size > quota and report_id not in protected:
+                removed.append((report_id, file_path))
+                continue
+            seen.add(key)
+            used += size
+
+    if not removed:
+        return 0
+
+    InventoryReport.objects.filter(id__in=[report_id for report_id, _ in removed]).delete()
+    still_used = set(reports.values_list('file_path', flat=True))
+    for file_path in {path for _, path in removed} - still_used:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+    return len(removed)
+
+
+def claim_due_run(business_id, scheduled_for, now=None, stale_after=None):
+    """
+    Claim the report run for one business's scheduled slot.
+
+    Every slot has exactly one ReportRun row (unique on business and
+    scheduled_for), so a crashed or restarted scheduler finds the slot it
+    already worked on instead of starting it again. Returns the run id to
+    work on, or None if the slot is finished or owned by a live worker.
+    """
+    now = now or timezone.now()
+    run, created = ReportRun.objects.get_or_create(
+        business_id=business_id,
+        scheduled_for=scheduled_for,
+        defaults={'status': 'running', 'started_at': now}
+    )
+    if created:
+        return run.id
+
+    if run.status == 'done':
+        # The report was built but the schedule never moved on
+        _advance_schedule(run, now)
+        return None
+
+    stale = stale_after is not None and run.started_at < now - stale_after
+    if run.status == 'failed' or (run.status == 'running' and stale):
+        reclaimed = ReportRun.objects.filter(
+            pk=run.pk, status=run.status, started_at=run.started_at
+        ).update(status='running', started_at=now, attempts=F('attempts') + 1, error='')
+        if reclaimed:
+            return run.id
+    return None
+
+
+def execute_run(run_id):
+    """
+    Build the report for a claimed run and move the business's schedule on.
+    Runs in scheduler worker processes, so it only takes a primary key.
+    """
+    run = None
+    try:
+        run = ReportRun.objects.select_related('business').get(pk=run_id)
+        report, lines = build_inventory_report(run.business)
+        # Only writes inside the transaction: on SQLite a read-then-write
+        # transaction can't wait for the lock and fails as "locked"
+        with transaction.atomic():
+            save_report(report, lines)
+            run.report = report
+            run.status = 'done'
+            run.finished_at = timezone.now()
+            run.save(update_fields=['report', 'status', 'finished_at'])
+            _advance_schedule(run, run.finished_at)
+    except Exception as e:
+        owner = run.business.email if run else f'run {run_id}'
+        logger.error(f"Scheduled report for {owner} failed: {str(e)}")
+        ReportRun.objects.filter(pk=run_id).update(
+            status='failed', error=str(e), finished_at=timezone.now())
+        return run_id, False, str(e)
+
+    # As after an on-demand report; the run is done even if this fails
+    try:
+        enforce_report_retention(run.business)
+    except Exception as e:
+        logger.error(f"Report retention for {run.business.email} failed: {str(e)}")
+    return run_id, True, ''
+
+
+def _advance_schedule(run, now):
+    business = run.business
+    # Conditional so a frequency change made meanwhile is not overwritten
+    User.objects.filter(pk=business.pk, next_report_at=run.scheduled_for).update(
+        next_report_at=business.next_report_after(run.scheduled_for, now))
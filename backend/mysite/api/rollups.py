@@ -0,0 +1,82 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyItemSales, Sale
+
+
+def record_sale(sale):
+    """
+    Add a sale to the daily rollup. Call inside the transaction that
+    inserts the sale so both rows commit (or roll back) together.
+    """
+    day = timezone.localdate(sale.sold_at)
+    updated = DailyItemSales.objects.filter(item_id=sale.item_id, day=day).update(
+        qty=F('qty') + sale.quantity)
+    if updated:
+        return
+
+    try:
+        # Savepoint so a concurrent insert of the same (item, day) doesn't
+        # break the caller's transaction
+        with transaction.atomic():
+            DailyItemSales.objects.create(
+                business_id=sale.business_id,
+                item_id=sale.item_id,
+                day=day,
+                qty=sale.quantity
+            )
+    except IntegrityError:
+        DailyItemSales.objects.filter(item_id=sale.item_id, day=day).update(
+            qty=F('qty') + sale.quantity)
+
+
+def rebuild_daily_sales(business=None, since=None, batch_size=1000):
+    """
+    Recompute the rollup from raw Sale rows. Optionally limited to one
+    business and/or to days on or after `since`. Returns the number of
+    rollup rows written.
+    """
+    sales = Sale.objects.all()
+    rollups = DailyItemSales.objects.all()
+    if business is not None:
+        sales = sales.filter(business=business)
+        rollups = rollups.filter(business=business)
+    if since is not None:
+        sales = sales.filter(sold_at__date__gte=since)
+        rollups = rollups.filter(day__gte=since)
+
+    totals = (sales
+              .annotate(day=TruncDate('sold_at'))
+              .values('business_id', 'item_id', 'day')
+              .annotate(qty=Sum('quantity'))
+              .order_by())
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in totals.iterator():
+            batch.append(DailyItemSales(**row))
+            if len(batch) >= batch_size:
+                DailyItemSales.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            DailyItemSales.objects.bulk_create(batch)
+            written += len(batch)
+
+    return written
+
+
+def daily_sales(business, start=None, end=None):
+    """
+    Per-item daily sales for a business, read from the rollup.
+    """
+    queryset = DailyItemSales.objects.filter(business=business)
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lte=end)
+    return queryset.select_related('item').order_by('day', 'item__name')
@@ -0,0 +1,63 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# bm25 column weights of api_product_fts (see api/fts.py): name, description, store_name
+RANK_SQL = "bm25(api_product_fts, 10.0, 2.0, 5.0)"
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, each as a
+    prefix ("piz marg" -> "piz"* "marg"*). Quoting keeps user input from
+    being read as FTS5 syntax.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_product_ids(text, limit=20, store_id=None):
+    """
+    Ids of matching in-stock products of active stores, best match first
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+
+    if connection.vendor != 'sqlite':
+        return _search_product_ids_like(text, limit, store_id)
+
+    sql = f"""
+        SELECT p.id
+        FROM api_product_fts
+        JOIN api_product p ON p.id = api_product_fts.rowid
+        JOIN api_store s ON s.id = p.store_id
+        WHERE api_product_fts MATCH %s AND p.in_stock AND s.is_active
+        {'AND p.store_id = %s' if store_id is not None else ''}
+        ORDER BY {RANK_SQL}
+        LIMIT %s
+    """
+    params = [query] + ([store_id] if store_id is not None else []) + [limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_product_ids_like(text, limit, store_id):
+    queryset = Product.objects.filter(in_stock=True, store__is_active=True)
+    if store_id is not None:
+        queryset = queryset.filter(store_id=store_id)
+    for token in TOKEN_RE.findall(text):
+        queryset = queryset.filter(
+            Q(name__icontains=token) | Q(description__icontains=token) | Q(store__name__icontains=token))
+    return list(queryset.order_by('name').values_list('id', flat=True)[:limit])
+
+
+def search_products(text, limit=20, store_id=None):
+    ids = search_product_ids(text, limit, store_id)
+    products = Product.objects.select_related('store').in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
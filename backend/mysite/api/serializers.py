@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Customer, InventoryItem, Sale, InventoryReport, Store, Product, Order, OrderItem
+from .models import Customer, InventoryItem, Sale, DailyItemSales, WasteEvent, InventoryReport, Store, Product, Order, OrderItem
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -11,9 +11,39 @@ class CustomerSerializer(serializers.ModelSerializer):
 class InventoryItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = InventoryItem
-        fields = ['id', 'name', 'total_added', 'total_sold',
-                  'current_quantity', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'name', 'total_added', 'total_sold', 'total_wasted',
+                  'current_quantity', 'unit_cost', 'unit_price', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'total_wasted', 'created_at', 'updated_at']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sales buffered by INVENTORY_WRITE_BEHIND but not flushed yet
+        pending = getattr(instance, 'pending_sold', 0)
+        if pending:
+            data['total_sold'] += pending
+            data['current_quantity'] -= pending
+        # Items read through ledger.with_balances show the quantity on hand
+        # per the ledger (latest snapshot plus the movements since), which
+        # already counts buffered sales
+        balance = getattr(instance, 'balance', None)
+        if balance is not None:
+            data['current_quantity'] = balance
+        return data
+
+    def update(self, instance, validated_data):
+        # Counters are shown with pending sales applied; store them without,
+        # as flush_sale_deltas will apply those sales again
+        pending = getattr(instance, 'pending_sold', 0)
+        if 'total_sold' in validated_data:
+            validated_data['total_sold'] -= pending
+        if 'current_quantity' in validated_data:
+            validated_data['current_quantity'] += pending
+        # Save only the submitted fields, so counters changed meanwhile by
+        # a sale, waste or flush_sale_deltas aren't overwritten
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
 
 
 class SaleSerializer(serializers.ModelSerializer):
@@ -25,10 +55,39 @@ class SaleSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'sold_at']
 
 
+class DailyItemSalesSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.name', read_only=True)
+
+    class Meta:
+        model = DailyItemSales
+        fields = ['item', 'item_name', 'day', 'qty']
+        read_only_fields = fields
+
+
+class WasteEventSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.name', read_only=True)
+
+    class Meta:
+        model = WasteEvent
+        fields = ['id', 'item', 'item_name', 'quantity', 'reason', 'wasted_at']
+        read_only_fields = ['id']
+
+    def validate_item(self, item):
+        request = self.context.get('request')
+        if request and item.business_id != request.user.id:
+            raise serializers.ValidationError("Unknown inventory item")
+        return item
+
+    def validate_quantity(self, quantity):
+        if quantity <= 0:
+            raise serializers.ValidationError("Quantity must be positive")
+        return quantity
+
+
 class InventoryReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = InventoryReport
-        fields = ['id', 'report_type', 'file_path',
+        fields = ['id', 'report_type', 'file_path', 'filename', 'file_size',
                   'generated_at', 'period_start', 'period_end']
         read_only_fields = ['id', 'generated_at']
 
@@ -36,9 +95,29 @@ class InventoryReportSerializer(serializers.ModelSerializer):
 class StoreSerializer(serializers.ModelSerializer):
     class Meta:
         model = Store
-        fields = ['id', 'name', 'description', 'address', 'phone', 'is_active', 'created_at']
+        fields = ['id', 'name', 'description', 'address', 'phone', 'latitude', 'longitude', 'is_active', 'created_at']
         read_only_fields = ['id', 'created_at']
 
+    def validate_latitude(self, value):
+        if value is not None and not -90 <= value <= 90:
+            raise serializers.ValidationError("Latitude must be between -90 and 90")
+        return value
+
+    def validate_longitude(self, value):
+        if value is not None and not -180 <= value <= 180:
+            raise serializers.ValidationError("Longitude must be between -180 and 180")
+        return value
+
+
+class NearbyStoreSerializer(StoreSerializer):
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta(StoreSerializer.Meta):
+        fields = StoreSerializer.Meta.fields + ['distance_km']
+
+    def get_distance_km(self, obj):
+        return round(obj.distance_km, 3)
+
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -47,6 +126,13 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class ProductSearchSerializer(ProductSerializer):
+    store_name = serializers.CharField(source='store.name', read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['store', 'store_name']
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
@@ -65,5 +151,7 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'customer', 'customer_email', 'store', 'store_name', 'status', 'total_amount', 
-                  'delivery_address', 'items', 'created_at']
-        read_only_fields = ['id', 'total_amount', 'created_at']
+                  'delivery_address', 'items', 'version', 'created_at', 'updated_at']
+        # Orders belong to the requesting customer and start pending; the
+        # store moves them on through the order queue
+        read_only_fields = ['id', 'customer', 'status', 'total_amount', 'version', 'created_at', 'updated_at']
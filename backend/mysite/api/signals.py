@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog_cache
+from .models import Order, Product, Store
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store_catalog(sender, instance, **kwargs):
+    catalog_cache.bump_store(instance.pk, store_list=True)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_catalog(sender, instance, **kwargs):
+    catalog_cache.bump_store(instance.store_id)
+    # Dashboards show product names
+    catalog_cache.bump_dashboard(instance.store_id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_store_dashboard(sender, instance, **kwargs):
+    catalog_cache.bump_dashboard(instance.store_id)
@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import catalog_cache
+from .events import ORDER_EVENT_FIELDS, publish_order_status
+from .models import Order, Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f'Not enough stock for product {product_id} (requested {requested})')
+        self.product_id = product_id
+        self.requested = requested
+
+
+def reserve_stock(order, quantities):
+    """
+    Take stock for a new order. `quantities` maps product id -> quantity.
+    Each product's stock is decremented by a conditional UPDATE that only
+    matches while enough stock is left, so concurrent orders can never
+    oversell, and in_stock is recomputed in the same statement.
+
+    Call inside the transaction creating the order: raises
+    InsufficientStock (so the order rolls back) if any product is short.
+    """
+    now = timezone.now()
+    # A fixed lock order keeps concurrent orders from deadlocking
+    for product_id, quantity in sorted(quantities.items()):
+        updated = Product.objects.filter(id=product_id, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity,
+            in_stock=Case(When(stock_quantity__gt=quantity, then=Value(True)), default=Value(False)),
+            updated_at=now
+        )
+        if not updated:
+            raise InsufficientStock(product_id, quantity)
+
+    reservations = StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, created_at=now)
+        for product_id, quantity in quantities.items()
+    ])
+    transaction.on_commit(lambda: catalog_cache.bump_store(order.store_id))
+    return reservations
+
+
+def release_reservations(order_ids):
+    """
+    Give the stock held for these (cancelled) orders back to their
+    products. Each reservation is released by a conditional UPDATE, so
+    running this twice, or concurrently, never restocks twice. Returns the
+    number of reservations released.
+    """
+    now = timezone.now()
+    held = list(StockReservation.objects.filter(order_id__in=order_ids, status='held')
+                .values_list('id', 'product_id', 'quantity', 'product__store_id'))
+    released = 0
+    restock = {}
+    stores = set()
+    with transaction.atomic():
+        for reservation_id, product_id, quantity, store_id in held:
+            if StockReservation.objects.filter(id=reservation_id, status='held').update(
+                    status='released', released_at=now):
+                released += 1
+                restock[product_id] = restock.get(product_id, 0) + quantity
+                stores.add(store_id)
+        if not restock:
+            return 0
+
+        returned = Case(
+            *[When(id=product_id, then=Value(quantity)) for product_id, quantity in restock.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        Product.objects.filter(id__in=restock).update(
+            stock_quantity=F('stock_quantity') + returned,
+            in_stock=True,
+            updated_at=now
+        )
+        for store_id in stores:
+            transaction.on_commit(lambda store_id=store_id: catalog_cache.bump_store(store_id))
+    return released
+
+
+def expire_pending_orders(now=None, limit=1000):
+    """
+    Cancel orders still pending STOCK_RESERVATION_MINUTES after they were
+    placed, so their stock can be released. Returns the ids cancelled.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 30))
+    candidates = list(Order.objects.filter(status='pending', created_at__lt=cutoff)
+                      .order_by('created_at').values_list('id', flat=True)[:limit])
+    if not candidates:
+        return []
+
+    with transaction.atomic():
+        # Lock the ones still pending, so an order the store confirmed
+        # meanwhile is left alone and only orders this call cancels are
+        # published. SQLite ignores the lock, but a write committed
+        # between the two statements makes the UPDATE fail there instead
+        order_ids = list(Order.objects.select_for_update(skip_locked=True)
+                         .filter(id__in=candidates, status='pending')
+                         .values_list('id', flat=True))
+        if not order_ids:
+            return []
+        Order.objects.filter(id__in=order_ids, status='pending').update(
+            status='cancelled', version=F('version') + 1, updated_at=now)
+        rows = list(Order.objects.filter(id__in=order_ids).values(*ORDER_EVENT_FIELDS))
+        transaction.on_commit(lambda: publish_order_status(rows))
+        for store_id in {row['store_id'] for row in rows}:
+            transaction.on_commit(lambda store_id=store_id: catalog_cache.bump_dashboard(store_id))
+    return [row['id'] for row in rows]
+
+
+def sweep_reservations(limit=1000):
+    """Release held stock of cancelled orders. Returns the number of reservations released."""
+    order_ids = list(StockReservation.objects.filter(status='held', order__status='cancelled')
+                     .values_list('order_id', flat=True).distinct()[:limit])
+    return release_reservations(order_ids) if order_ids else 0
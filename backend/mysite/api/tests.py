@@ -1,3 +1,1344 @@
-from django.test import TestCase
+import asyncio
+import math
+import os
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from accounts.tokens import UserRefreshToken
+
+from . import events, geo
+from .conditional import etag_matches
+from .forecasting import forecast, smoothing_weights
+from .inventory_buffer import InsufficientInventory, available_quantities, flush_sale_deltas, take_sold_stock
+from .ledger import balances, movement_totals, receive_stock, reconcile, record_movement, take_snapshots
+from .models import (
+    DailyItemSales, IdempotencyKey, InventoryItem, InventoryMovement, InventoryReport, InventoryReportLine,
+    InventorySnapshot, Order, OrderItem, PendingSaleDelta, Product, ReportRun, Sale, StockReservation, Store,
+    WasteEvent,
+)
+from .order_queue import transition_orders
+from .reports import claim_due_run, enforce_report_retention, execute_run
+from .rollups import rebuild_daily_sales, record_sale
+from .stock import expire_pending_orders, release_reservations
+from .waste import WasteExceedsStock, log_waste
+
+
+def make_user(email, user_type='business'):
+    return User.objects.create_user(
+        username=email, email=email, password='test-pass-123', user_type=user_type)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class DailySalesRollupTests(TestCase):
+    def setUp(self):
+        self.business = make_user('rollup@example.com')
+        self.client = client_for(self.business)
+        self.item = InventoryItem.objects.create(
+            business=self.business, name='Bread', total_added=50, current_quantity=50)
+
+    def test_sale_updates_rollup(self):
+        for quantity in (3, 4):
+            response = self.client.post('/api/sales/', {'item': self.item.id, 'quantity': quantity},
+                                        format='json')
+            self.assertEqual(response.status_code, 201)
+
+        rollup = DailyItemSales.objects.get(item=self.item)
+        self.assertEqual(rollup.day, timezone.localdate())
+        self.assertEqual(rollup.qty, 7)
+
+    def test_rollup_rolls_back_with_sale(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                sale = Sale.objects.create(business=self.business, item=self.item, quantity=2)
+                record_sale(sale)
+                raise RuntimeError('sale failed')
+
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(DailyItemSales.objects.exists())
+
+    def test_rebuild_matches_incremental_rollup(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        for quantity, sold_at in ((2, yesterday), (5, yesterday), (1, timezone.now())):
+            with transaction.atomic():
+                sale = Sale.objects.create(business=self.business, item=self.item, quantity=quantity)
+                Sale.objects.filter(pk=sale.pk).update(sold_at=sold_at)
+                sale.refresh_from_db()
+                record_sale(sale)
+        incremental = set(DailyItemSales.objects.values_list('item_id', 'day', 'qty'))
+
+        DailyItemSales.objects.update(qty=0)
+        self.assertEqual(rebuild_daily_sales(self.business), 2)
+        self.assertEqual(set(DailyItemSales.objects.values_list('item_id', 'day', 'qty')), incremental)
+        self.assertEqual({qty for _, _, qty in incremental}, {7, 1})
+
+    def test_daily_sales_endpoint_filters_by_date(self):
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 2}, format='json')
+        today = timezone.localdate().isoformat()
+
+        rows = self.client.get(f'/api/sales/daily/?start={today}&end={today}').json()
+        self.assertEqual([(row['item_name'], row['qty']) for row in rows], [('Bread', 2)])
+        self.assertEqual(self.client.get('/api/sales/daily/?start=2000-01-01&end=2000-01-02').json(), [])
+        self.assertEqual(self.client.get('/api/sales/daily/?start=bad').status_code, 400)
+        self.assertEqual(self.client.get('/api/sales/daily/?start=2024-02-30').status_code, 400)
+
+
+class ForecastTests(TestCase):
+    def test_smoothing_weights_match_recursive_smoothing(self):
+        series = np.array([4.0, 0.0, 7.0, 3.0, 5.0])
+        smoothed = series[0]
+        for value in series[1:]:
+            smoothed = 0.3 * value + 0.7 * smoothed
+        self.assertAlmostEqual(float(series @ smoothing_weights(len(series), 0.3)), smoothed)
+
+    def test_forecast_flags_items_below_reorder_point(self):
+        matrix = np.array([[10.0] * 14, [0.0] * 14])
+        result = forecast(matrix, [5, 5], window=7, alpha=0.5, lead_time_days=2,
+                          review_days=7, service_level=0.95)
+
+        # Constant demand: no safety stock, reorder point is two days of demand
+        self.assertAlmostEqual(result['reorder_point'][0], 20.0)
+        self.assertTrue(result['needs_reorder'][0])
+        self.assertEqual(result['suggested_order'][0], 85)
+        self.assertAlmostEqual(result['days_of_cover'][0], 0.5)
+        # No demand: never reordered, infinite cover
+        self.assertFalse(result['needs_reorder'][1])
+        self.assertTrue(math.isinf(result['days_of_cover'][1]))
+
+    def test_endpoint_orders_items_needing_reorder_first(self):
+        business = make_user('forecast@example.com')
+        client = client_for(business)
+        busy = InventoryItem.objects.create(business=business, name='Busy', current_quantity=1)
+        InventoryItem.objects.create(business=business, name='Idle', current_quantity=100)
+        today = timezone.localdate()
+        DailyItemSales.objects.bulk_create([
+            DailyItemSales(business=business, item=busy, day=today - timedelta(days=d), qty=5)
+            for d in range(10)
+        ])
+
+        response = client.get('/api/forecast/?history_days=30&lead_time_days=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['parameters']['lead_time_days'], 2)
+        items = response.json()['items']
+        self.assertEqual([item['item'] for item in items], ['Busy', 'Idle'])
+        self.assertTrue(items[0]['needs_reorder'])
+        self.assertGreater(items[0]['suggested_order'], 0)
+
+    def test_endpoint_rejects_out_of_range_parameters(self):
+        client = client_for(make_user('forecast-params@example.com'))
+        for query in ('lead_time_days=-1', 'lead_time_days=0', 'window=0', 'review_days=-1',
+                      'alpha=0', 'service_level=1', 'history_days=0', 'window=abc'):
+            with self.subTest(query=query):
+                self.assertEqual(client.get(f'/api/forecast/?{query}').status_code, 400)
+        self.assertEqual(client.get('/api/forecast/?review_days=0').status_code, 200)
+
+
+class WasteTests(TestCase):
+    def setUp(self):
+        self.business = make_user('waste@example.com')
+        self.client = client_for(self.business)
+        self.milk = InventoryItem.objects.create(
+            business=self.business, name='Milk', total_added=10, current_quantity=10,
+            unit_cost='1.00', unit_price='3.00')
+        self.eggs = InventoryItem.objects.create(
+            business=self.business, name='Eggs', total_added=5, current_quantity=5,
+            unit_cost='0.50', unit_price='1.00')
+
+    def test_bulk_waste_takes_stock_off_each_item(self):
+        response = self.client.post('/api/waste/', [
+            {'item': self.milk.id, 'quantity': 2, 'reason': 'expired'},
+            {'item': self.milk.id, 'quantity': 1},
+            {'item': self.eggs.id, 'quantity': 4, 'reason': 'damaged'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 3)
+
+        self.milk.refresh_from_db()
+        self.eggs.refresh_from_db()
+        self.assertEqual((self.milk.current_quantity, self.milk.total_wasted), (7, 3))
+        self.assertEqual((self.eggs.current_quantity, self.eggs.total_wasted), (1, 4))
+
+    def test_waste_beyond_stock_changes_nothing(self):
+        response = self.client.post('/api/waste/', [
+            {'item': self.milk.id, 'quantity': 2},
+            {'item': self.eggs.id, 'quantity': 6},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient inventory for Eggs. Available: 5, Wasted: 6', response.content.decode())
+        self.assertFalse(WasteEvent.objects.exists())
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.current_quantity, 10)
+
+    def test_stock_taken_since_validation_is_respected(self):
+        # A concurrent sale took the stock after the request was validated
+        entries = [{'item': self.eggs, 'quantity': 4}]
+        InventoryItem.objects.filter(pk=self.eggs.pk).update(current_quantity=3)
+
+        with self.assertRaises(WasteExceedsStock) as raised:
+            log_waste(self.business, entries)
+        self.assertEqual((raised.exception.available, raised.exception.wasted), (3, 4))
+        self.eggs.refresh_from_db()
+        self.assertEqual((self.eggs.current_quantity, self.eggs.total_wasted), (3, 0))
+        self.assertFalse(WasteEvent.objects.exists())
+
+    def test_analytics_weighs_waste_against_gain(self):
+        self.client.post('/api/sales/', {'item': self.milk.id, 'quantity': 4}, format='json')
+        self.client.post('/api/waste/', {'item': self.eggs.id, 'quantity': 2}, format='json')
+
+        response = self.client.get('/api/waste/analytics/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['name']: row for row in response.json()['items']}
+        self.assertEqual((rows['Milk']['sold'], float(rows['Milk']['net_gain'])), (4, 8.0))
+        self.assertEqual((rows['Eggs']['wasted'], float(rows['Eggs']['waste_loss'])), (2, 1.0))
+        summary = response.json()['summary']
+        self.assertEqual((summary['optimize_more'], summary['cut_back']), (['Milk'], ['Eggs']))
+
+    def test_analytics_rejects_bad_dates(self):
+        for query in ('start=soon', 'end=2024-02-30', 'start=2024-03-02&end=2024-03-01'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/waste/analytics/?{query}').status_code, 400)
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class ScheduledReportTests(TestCase):
+    def setUp(self):
+        self.business = make_user('scheduled@example.com')
+        InventoryItem.objects.create(business=self.business, name='Milk', total_added=10, current_quantity=10)
+
+    def schedule_at(self, when):
+        User.objects.filter(pk=self.business.pk).update(next_report_at=when)
+
+    def generate_due_reports(self):
+        call_command('generate_due_reports', concurrency=1, stdout=StringIO())
+
+    def test_new_business_is_scheduled_one_interval_ahead(self):
+        self.assertGreater(self.business.next_report_at, timezone.now())
+        self.assertIsNone(make_user('customer@example.com', user_type='customer').next_report_at)
+
+    def test_due_report_is_generated_and_schedule_moves_on(self):
+        self.generate_due_reports()
+        self.assertFalse(InventoryReport.objects.exists())
+
+        ten_days_ago = timezone.now() - timedelta(days=10)
+        self.schedule_at(ten_days_ago)
+        self.generate_due_reports()
+
+        run = ReportRun.objects.get()
+        self.assertEqual((run.status, run.scheduled_for), ('done', ten_days_ago))
+        self.assertEqual(InventoryReport.objects.get(), run.report)
+        self.business.refresh_from_db()
+        # Missed weekly slots are skipped rather than queued up
+        self.assertGreater(self.business.next_report_at, timezone.now())
+        self.assertLessEqual(self.business.next_report_at, timezone.now() + timedelta(days=7))
+
+    def test_finished_slot_only_moves_schedule_on(self):
+        # The report was built but the scheduler died before moving on
+        slot = timezone.now() - timedelta(days=1)
+        self.schedule_at(slot)
+        self.generate_due_reports()
+        self.schedule_at(slot)
+
+        self.generate_due_reports()
+        self.assertEqual(InventoryReport.objects.count(), 1)
+        self.business.refresh_from_db()
+        self.assertGreater(self.business.next_report_at, timezone.now())
+
+    def test_stale_running_slot_is_reclaimed(self):
+        slot = timezone.now() - timedelta(days=1)
+        self.schedule_at(slot)
+        ReportRun.objects.create(business=self.business, scheduled_for=slot,
+                                 started_at=timezone.now() - timedelta(hours=2))
+
+        self.generate_due_reports()
+        run = ReportRun.objects.get()
+        self.assertEqual((run.status, run.attempts), ('done', 2))
+        self.assertEqual(InventoryReport.objects.count(), 1)
+
+    def test_live_running_slot_is_left_alone(self):
+        slot = timezone.now() - timedelta(days=1)
+        ReportRun.objects.create(business=self.business, scheduled_for=slot, started_at=timezone.now())
+        self.assertIsNone(claim_due_run(self.business.id, slot, stale_after=timedelta(minutes=30)))
+
+    def test_failed_slot_is_retried(self):
+        slot = timezone.now() - timedelta(days=1)
+        run = ReportRun.objects.create(business=self.business, scheduled_for=slot, status='failed',
+                                       started_at=timezone.now(), error='disk full')
+        self.assertEqual(claim_due_run(self.business.id, slot), run.id)
+        run.refresh_from_db()
+        self.assertEqual((run.status, run.attempts, run.error), ('running', 2, ''))
+
+    def test_one_failing_run_does_not_stop_the_pass(self):
+        other = make_user('scheduled-too@example.com')
+        slot = timezone.now() - timedelta(days=1)
+        User.objects.filter(pk__in=[self.business.pk, other.pk]).update(next_report_at=slot)
+
+        def flaky(run_id):
+            if ReportRun.objects.get(pk=run_id).business_id == self.business.id:
+                raise RuntimeError('database went away')
+            return execute_run(run_id)
+
+        out = StringIO()
+        with mock.patch('api.management.commands.generate_due_reports.execute_run', flaky):
+            call_command('generate_due_reports', concurrency=1, stdout=out)
+        self.assertIn('database went away', out.getvalue())
+        self.assertIn('Generated 1 reports (1 failed)', out.getvalue())
+        self.assertEqual(InventoryReport.objects.get().business, other)
+
+    def test_missing_run_fails_without_raising(self):
+        run_id, ok, error = execute_run(10 ** 6)
+        self.assertEqual((run_id, ok), (10 ** 6, False))
+        self.assertIn('does not exist', error)
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class ReportDownloadTests(TestCase):
+    def setUp(self):
+        self.business = make_user('reports@example.com')
+        self.client = client_for(self.business)
+        InventoryItem.objects.create(business=self.business, name='Milk', total_added=10, current_quantity=10)
+
+    def generate(self):
+        response = self.client.post('/api/reports/generate/')
+        self.assertEqual(response.status_code, 201)
+        return InventoryReport.objects.get(pk=response.json()['report_id'])
+
+    def download(self, report, **headers):
+        return self.client.get(f'/api/reports/{report.id}/download/', headers=headers)
+
+    def test_download_is_validated_by_content_hash(self):
+        report = self.generate()
+        response = self.download(report)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)), report.file_size)
+        self.assertEqual(response['ETag'], f'"{report.content_hash}"')
+
+        response = self.download(report, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        report = self.generate()
+        body = b''.join(self.download(report).streaming_content)
+        etag = f'"{report.content_hash}"'
+
+        response = self.download(report, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, body[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(body)}')
+        self.assertEqual(self.download(report, range='bytes=-5').content, body[-5:])
+        self.assertEqual(self.download(report, range='bytes=0-4', if_range=etag).status_code, 206)
+
+        response = self.download(report, range=f'bytes={len(body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(body)}')
+        # A stale If-Range gets the whole file
+        self.assertEqual(self.download(report, range='bytes=0-4', if_range='"other"').status_code, 200)
+
+    def test_identical_reports_share_one_file(self):
+        first, second = self.generate(), self.generate()
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(first.file_path, second.file_path)
+
+    def test_quota_evicts_least_recently_used_reports(self):
+        generated = []
+        for i in range(3):
+            InventoryItem.objects.create(business=self.business, name=f'Item {i}',
+                                         total_added=1, current_quantity=1)
+            generated.append(self.generate())
+        first, second, newest = generated
+        InventoryReport.objects.filter(pk__in=[first.pk, second.pk]).update(
+            generated_at=timezone.now() - timedelta(days=1))
+        # Downloading the first report makes the second the least recently used
+        self.download(first)
+
+        with self.settings(REPORT_DISK_QUOTA_BYTES=first.file_size + newest.file_size):
+            self.assertEqual(enforce_report_retention(self.business), 1)
+        self.assertEqual(set(InventoryReport.objects.values_list('id', flat=True)), {first.id, newest.id})
+        self.assertFalse(os.path.exists(second.file_path))
+        self.assertTrue(os.path.exists(first.file_path))
+
+    def test_scheduled_run_applies_retention(self):
+        old = self.generate()
+        InventoryReport.objects.filter(pk=old.pk).update(generated_at=timezone.now() - timedelta(days=5))
+        InventoryItem.objects.create(business=self.business, name='Eggs', total_added=1, current_quantity=1)
+        User.objects.filter(pk=self.business.pk).update(next_report_at=timezone.now() - timedelta(hours=1))
+
+        with self.settings(REPORT_RETENTION_DAYS=1):
+            call_command('generate_due_reports', concurrency=1, stdout=StringIO())
+        self.assertEqual(list(InventoryReport.objects.values_list('id', flat=True)),
+                         [ReportRun.objects.get().report_id])
+
+    def test_legacy_report_is_hashed_on_first_download(self):
+        report = self.generate()
+        InventoryReport.objects.filter(pk=report.pk).update(content_hash='')
+        self.assertEqual(self.download(report).status_code, 200)
+        report.refresh_from_db()
+        self.assertTrue(report.content_hash)
+
+    def test_other_business_cannot_download(self):
+        report = self.generate()
+        other = client_for(make_user('other-reports@example.com'))
+        self.assertEqual(other.get(f'/api/reports/{report.id}/download/').status_code, 404)
+
+
+@override_settings(BASE_DIR=tempfile.mkdtemp())
+class PeriodReportTests(TestCase):
+    def setUp(self):
+        self.business = make_user('period@example.com')
+        self.client = client_for(self.business)
+        self.milk = receive_stock(self.business, 'Milk', 20)
+        # Stock on hand from before the first reporting period
+        InventoryMovement.objects.filter(item=self.milk).update(recorded_at=timezone.now() - timedelta(days=30))
+
+    def report_lines(self):
+        response = self.client.post('/api/reports/generate/')
+        self.assertEqual(response.status_code, 201)
+        return {line.item_name: (line.opening, line.added, line.sold, line.wasted, line.closing)
+                for line in InventoryReportLine.objects.filter(report_id=response.json()['report_id'])}
+
+    def test_first_report_covers_the_reporting_interval(self):
+        self.client.post('/api/sales/', {'item': self.milk.id, 'quantity': 3}, format='json')
+        self.client.post('/api/waste/', {'item': self.milk.id, 'quantity': 2}, format='json')
+
+        self.assertEqual(self.report_lines(), {'Milk': (20, 0, 3, 2, 15)})
+        report = InventoryReport.objects.get()
+        self.assertEqual(report.period_end, timezone.localdate())
+        self.assertEqual(report.period_end - report.period_start, timedelta(days=6))
+
+    def test_next_report_opens_at_previous_closing(self):
+        self.client.post('/api/sales/', {'item': self.milk.id, 'quantity': 3}, format='json')
+        self.report_lines()
+
+        receive_stock(self.business, 'Milk', 10)
+        self.client.post('/api/sales/', {'item': self.milk.id, 'quantity': 4}, format='json')
+        self.client.post('/api/inventory/', {'name': 'Eggs', 'total_added': 5, 'current_quantity': 5},
+                         format='json')
+        self.assertEqual(self.report_lines(), {'Milk': (17, 10, 4, 0, 23), 'Eggs': (0, 5, 0, 0, 5)})
+
+    def test_snapshots_do_not_change_the_report(self):
+        self.client.post('/api/sales/', {'item': self.milk.id, 'quantity': 3}, format='json')
+        self.assertEqual(take_snapshots(at=timezone.now()), 1)
+        self.client.post('/api/sales/', {'item': self.milk.id, 'quantity': 1}, format='json')
+
+        self.assertEqual(self.report_lines(), {'Milk': (20, 0, 4, 0, 16)})
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = Store.objects.create(business=make_user('catalog@example.com'),
+                                          name='Pizza Place', address='1 Main St')
+        self.product = Product.objects.create(store=self.store, name='Margherita', price='9.99',
+                                              stock_quantity=5)
+        self.client = client_for(make_user('catalog-customer@example.com', user_type='customer'))
+
+    def test_repeat_reads_are_served_from_cache(self):
+        urls = ['/api/stores/', f'/api/stores/{self.store.id}/', f'/api/stores/{self.store.id}/products/']
+        first = [self.client.get(url).json() for url in urls]
+        with self.assertNumQueries(0):
+            cached = [self.client.get(url).json() for url in urls]
+        self.assertEqual(cached, first)
+
+    def test_product_changes_invalidate_the_store_catalog(self):
+        url = f'/api/stores/{self.store.id}/products/'
+        self.client.get(url)
+        self.product.name = 'Marinara'
+        self.product.save()
+        self.assertEqual(self.client.get(url).json()[0]['name'], 'Marinara')
+
+        self.product.delete()
+        self.assertEqual(self.client.get(url).json(), [])
+
+    def test_store_changes_invalidate_list_and_detail(self):
+        self.client.get('/api/stores/')
+        self.client.get(f'/api/stores/{self.store.id}/')
+        self.store.name = 'Pasta Place'
+        self.store.save()
+
+        self.assertEqual(self.client.get('/api/stores/').json()[0]['name'], 'Pasta Place')
+        self.assertEqual(self.client.get(f'/api/stores/{self.store.id}/').json()['name'], 'Pasta Place')
+
+    def test_missing_store_is_not_found(self):
+        self.assertEqual(self.client.get('/api/stores/999/').status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.business = make_user('conditional@example.com')
+        self.client = client_for(self.business)
+        self.milk = InventoryItem.objects.create(business=self.business, name='Milk',
+                                                 total_added=10, current_quantity=10)
+
+    def test_etag_matching_is_weak(self):
+        self.assertTrue(etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"x", "abc"', 'W/"abc"'))
+        self.assertTrue(etag_matches('*', '"abc"'))
+        self.assertFalse(etag_matches('"abcd"', '"abc"'))
+        self.assertFalse(etag_matches('', '"abc"'))
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/inventory/')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/inventory/', headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/inventory/', headers={'if-modified-since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_a_new_etag(self):
+        etag = self.client.get('/api/inventory/')['ETag']
+        eggs = InventoryItem.objects.create(business=self.business, name='Eggs', total_added=1, current_quantity=1)
+        response = self.client.get('/api/inventory/', headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # A deletion doesn't move updated_at forwards, but changes the count
+        etag = response['ETag']
+        eggs.delete()
+        self.assertEqual(self.client.get('/api/inventory/', headers={'if-none-match': etag}).status_code, 200)
+
+    def test_detail_validators(self):
+        url = f'/api/inventory/{self.milk.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+        self.assertEqual(self.client.get('/api/inventory/9999/').status_code, 404)
+
+    def test_etag_is_per_user(self):
+        etag = self.client.get('/api/inventory/')['ETag']
+        other = client_for(make_user('conditional-other@example.com'))
+        self.assertEqual(other.get('/api/inventory/', headers={'if-none-match': etag}).status_code, 200)
+
+    def test_cached_catalog_answers_304_without_queries(self):
+        store = Store.objects.create(business=self.business, name='Corner Shop', address='2 Main St')
+        customer = client_for(make_user('conditional-customer@example.com', user_type='customer'))
+        url = f'/api/stores/{store.id}/products/'
+        etag = customer.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(customer.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+        Product.objects.create(store=store, name='Apples', price='1.00', stock_quantity=10)
+        self.assertEqual(customer.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.pizza = Store.objects.create(business=make_user('pizza@example.com'), name='Pizza Place',
+                                          address='1 Main St')
+        self.bakery = Store.objects.create(business=make_user('bakery@example.com'), name='Corner Bakery',
+                                           address='2 Main St')
+        self.margherita = Product.objects.create(store=self.pizza, name='Margherita Pizza', price='9.99',
+                                                 description='Tomato and mozzarella', stock_quantity=5)
+        self.focaccia = Product.objects.create(store=self.bakery, name='Focaccia', price='4.50',
+                                               description='Tomato focaccia', stock_quantity=5)
+        self.client = client_for(make_user('searcher@example.com', user_type='customer'))
+
+    def search(self, query):
+        response = self.client.get(f'/api/products/search/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()]
+
+    def test_words_match_as_prefixes_across_fields(self):
+        self.assertEqual(self.search('q=marg'), ['Margherita Pizza'])
+        self.assertEqual(self.search('q=pizza mozz'), ['Margherita Pizza'])
+        # Store names are indexed too
+        self.assertEqual(self.search('q=bakery'), ['Focaccia'])
+
+    def test_name_matches_rank_first(self):
+        Product.objects.create(store=self.bakery, name='Tomato Bread', price='3.00', stock_quantity=5)
+        self.assertEqual(self.search('q=tomato')[0], 'Tomato Bread')
+        self.assertEqual(self.search('q=tomato&limit=1'), ['Tomato Bread'])
+        self.assertEqual(self.search(f'q=tomato&store={self.pizza.id}'), ['Margherita Pizza'])
+
+    def test_index_follows_writes(self):
+        self.focaccia.name = 'Ciabatta'
+        self.focaccia.save()
+        self.assertEqual(self.search('q=ciab'), ['Ciabatta'])
+        self.assertEqual(self.search('q=focaccia tomato'), ['Ciabatta'])
+
+        self.bakery.name = 'Bread Shop'
+        self.bakery.save()
+        self.assertEqual(self.search('q=shop'), ['Ciabatta'])
+
+        self.focaccia.delete()
+        self.assertEqual(self.search('q=ciab'), [])
+
+    def test_out_of_stock_products_and_inactive_stores_are_hidden(self):
+        self.focaccia.stock_quantity = 0
+        self.focaccia.save()
+        Store.objects.filter(pk=self.pizza.pk).update(is_active=False)
+        self.assertEqual(self.search('q=tomato'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('q=tomato OR "NEAR(x'), [])
+        self.assertEqual(self.search('q=%2A'), [])
+
+    def test_missing_or_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/search/?q=x&limit=abc').status_code, 400)
+
+
+class NearbyStoreTests(TestCase):
+    def make_stores(self, points):
+        first = User.objects.count()
+        users = User.objects.bulk_create([
+            User(username=f'nearby{i}@example.com', email=f'nearby{i}@example.com', user_type='business')
+            for i in range(first, first + len(points))
+        ])
+        return [Store.objects.create(business=user, name=f'Store {i}', address='Somewhere',
+                                     latitude=latitude, longitude=longitude)
+                for i, (user, (latitude, longitude)) in enumerate(zip(users, points))]
+
+    def brute_force(self, stores, latitude, longitude, radius):
+        distances = [(geo.haversine_km(latitude, longitude, store.latitude, store.longitude), store.id)
+                     for store in stores]
+        return [store_id for distance, store_id in sorted(distances) if distance <= radius]
+
+    def test_geohash_encoding(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_matches_brute_force(self):
+        rng = random.Random(1)
+        stores = self.make_stores([(40.7 + rng.uniform(-0.5, 0.5), -74.0 + rng.uniform(-0.5, 0.5))
+                                   for _ in range(200)])
+        for radius in (0.5, 2, 7, 25, 80, 400):
+            for _ in range(5):
+                latitude, longitude = 40.7 + rng.uniform(-0.6, 0.6), -74.0 + rng.uniform(-0.6, 0.6)
+                with self.subTest(radius=radius, latitude=latitude, longitude=longitude):
+                    found = [store.id for _, store in geo.nearby(Store.objects.all(), latitude, longitude, radius)]
+                    self.assertEqual(found, self.brute_force(stores, latitude, longitude, radius))
+
+    def test_high_latitudes_and_antimeridian(self):
+        rng = random.Random(3)
+        stores = self.make_stores([(rng.uniform(80, 90), rng.uniform(-180, 180)) for _ in range(100)])
+        for radius in (50, 150, 400):
+            latitude, longitude = rng.uniform(80, 90), rng.uniform(-180, 180)
+            found = [store.id for _, store in geo.nearby(Store.objects.all(), latitude, longitude, radius)]
+            self.assertEqual(found, self.brute_force(stores, latitude, longitude, radius))
+
+        fiji = self.make_stores([(-17.0, 179.99)])[0]
+        found = geo.nearby(Store.objects.filter(pk=fiji.pk), -17.0, -179.99, 5)
+        self.assertEqual([store.id for _, store in found], [fiji.id])
+
+    def test_cells_filter_by_backend(self):
+        stores = self.make_stores([(51.5, -0.12), (51.6, -0.12), (48.85, 2.35)])
+        cells = geo.covering_cells(51.5, -0.12, 5)
+        by_range = set(Store.objects.filter(geo.cells_filter(cells)).values_list('id', flat=True))
+        self.assertIn('geohash__lt', str(geo.cells_filter(cells)))
+        # Other backends may compare with a locale collation, so get prefixes
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            condition = geo.cells_filter(cells)
+        self.assertNotIn('geohash__lt', str(condition))
+        self.assertEqual(set(Store.objects.filter(condition).values_list('id', flat=True)), by_range)
+        self.assertIn(stores[0].id, by_range)
+        self.assertNotIn(stores[2].id, by_range)
+
+    def test_geohash_follows_location_updates(self):
+        store = Store.objects.create(business=make_user('moving@example.com'), name='Shop', address='1 High St')
+        self.assertEqual(store.geohash, '')
+        store.latitude, store.longitude = 51.5, -0.12
+        store.save(update_fields=['latitude', 'longitude'])
+        store.refresh_from_db()
+        self.assertTrue(store.geohash.startswith('gcpu'))
+
+    def test_endpoint(self):
+        store, far = self.make_stores([(51.5, -0.12), (48.85, 2.35)])
+        client = client_for(make_user('nearby-customer@example.com', user_type='customer'))
+
+        response = client.get('/api/stores/nearby/', {'lat': 51.501, 'lon': -0.121, 'radius': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()], [store.id])
+        self.assertLess(response.json()[0]['distance_km'], 1)
+        rows = client.get('/api/stores/nearby/', {'lat': 51.5, 'lon': -0.12, 'radius': 500}).json()
+        self.assertEqual([row['id'] for row in rows], [store.id, far.id])
+
+        for params in ({'lat': 1}, {'lat': 100, 'lon': 0}, {'lat': 0, 'lon': 0, 'radius': 0},
+                       {'lat': 'x', 'lon': 0}):
+            with self.subTest(params=params):
+                self.assertEqual(client.get('/api/stores/nearby/', params).status_code, 400)
+
+
+class OrderQueueTests(TestCase):
+    def setUp(self):
+        self.business = make_user('kitchen@example.com')
+        self.store = Store.objects.create(business=self.business, name='Kitchen', address='3 Main St')
+        self.soup = Product.objects.create(store=self.store, name='Soup', price='5.00', stock_quantity=10)
+        self.customer = make_user('diner@example.com', user_type='customer')
+        self.kitchen = client_for(self.business)
+
+    def place_order(self, quantity=1, **extra):
+        response = client_for(self.customer).post('/api/orders/', {
+            'store': self.store.id, 'delivery_address': '4 Side St',
+            'items': [{'product_id': self.soup.id, 'quantity': quantity}], **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def transition(self, to_status, *orders):
+        return self.kitchen.post('/api/orders/queue/transition/', {
+            'status': to_status,
+            'orders': [{'id': order['id'], 'version': order['version']} for order in orders],
+        }, format='json')
+
+    def test_new_orders_start_pending(self):
+        order = self.place_order(status='completed')
+        self.assertEqual((order['status'], order['version']), ('pending', 0))
+        self.assertEqual(order['total_amount'], '5.00')
+
+    def test_queue_lists_active_orders_oldest_first(self):
+        first, second = self.place_order(), self.place_order()
+        self.transition('cancelled', second)
+
+        queue = self.kitchen.get('/api/orders/queue/').json()
+        self.assertEqual([order['id'] for order in queue], [first['id']])
+        cancelled = self.kitchen.get('/api/orders/queue/?status=cancelled').json()
+        self.assertEqual([order['id'] for order in cancelled], [second['id']])
+        self.assertEqual(self.kitchen.get('/api/orders/queue/?status=lost').status_code, 400)
+        self.assertEqual(client_for(self.customer).get('/api/orders/queue/').status_code, 403)
+
+    def test_bulk_transition_bumps_versions(self):
+        orders = [self.place_order(), self.place_order()]
+        response = self.transition('confirmed', *orders)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({(order['status'], order['version']) for order in response.json()}, {('confirmed', 1)})
+
+    def test_stale_version_is_a_conflict(self):
+        order = self.place_order()
+        self.transition('confirmed', order)
+
+        response = self.transition('preparing', order)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicts'],
+                         [{'id': order['id'], 'reason': 'stale_version', 'status': 'confirmed', 'version': 1}])
+
+    def test_conflicts_block_the_whole_batch(self):
+        pending, done = self.place_order(), self.place_order()
+        self.transition('cancelled', done)
+        done['version'] = 1
+
+        response = self.transition('confirmed', pending, done)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicts'],
+                         [{'id': done['id'], 'reason': 'invalid_transition', 'status': 'cancelled', 'version': 1}])
+        self.assertEqual(Order.objects.get(pk=pending['id']).status, 'pending')
+
+    def test_other_stores_orders_are_not_found(self):
+        other = make_user('other-kitchen@example.com')
+        Store.objects.create(business=other, name='Other', address='5 Main St')
+        order = self.place_order()
+        response = client_for(other).post('/api/orders/queue/transition/', {
+            'status': 'confirmed', 'orders': [{'id': order['id'], 'version': 0}]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['conflicts'], [{'id': order['id'], 'reason': 'not_found'}])
+
+    def test_cancelling_returns_reserved_stock(self):
+        order = self.place_order(quantity=4)
+        self.soup.refresh_from_db()
+        self.assertEqual(self.soup.stock_quantity, 6)
+
+        self.assertEqual(self.transition('cancelled', order).status_code, 200)
+        self.soup.refresh_from_db()
+        self.assertEqual(self.soup.stock_quantity, 10)
+
+    def test_invalid_requests(self):
+        order = self.place_order()
+        for body in ({'status': 'lost', 'orders': [{'id': order['id'], 'version': 0}]},
+                     {'status': 'confirmed', 'orders': []},
+                     {'status': 'confirmed', 'orders': [{'id': order['id']}]},
+                     {'status': 'confirmed', 'orders': [{'id': order['id'], 'version': 0}] * 2}):
+            with self.subTest(body=body):
+                response = self.kitchen.post('/api/orders/queue/transition/', body, format='json')
+                self.assertEqual(response.status_code, 400)
+
+
+class EventBrokerTests(SimpleTestCase):
+    def test_replay_from_the_buffer(self):
+        with self.settings(EVENTS_REPLAY_BUFFER=3):
+            broker = events.InProcessBroker()
+        for i in range(5):
+            broker.publish('customer:1', 'order.status', i)
+        broker.publish('customer:2', 'order.status', 'other')
+
+        self.assertIsNone(broker.replay(['customer:1'], f'{broker.broker_id}-1'))
+        self.assertEqual([event['data'] for event in broker.replay(['customer:1'], f'{broker.broker_id}-3')],
+                         [3, 4])
+        self.assertIsNone(broker.replay(['customer:1'], 'another-broker-3'))
+
+    def test_slow_subscriber_is_dropped(self):
+        with self.settings(EVENTS_QUEUE_SIZE=2):
+            broker = events.InProcessBroker()
+
+        async def consume():
+            subscription = broker.subscribe(['customer:1'])
+            for i in range(3):
+                broker.publish('customer:1', 'order.status', i)
+            await asyncio.sleep(0.01)
+            received = [await subscription.get(), await subscription.get()]
+            with self.assertRaises(events.Subscription.Overflow):
+                await subscription.get()
+            return [event['data'] for event in received]
+
+        self.assertEqual(asyncio.run(consume()), [0, 1])
+        self.assertEqual(broker.subscribers, {})
+
+
+@override_settings(EVENTS_HEARTBEAT_SECONDS=1)
+class OrderEventStreamTests(TransactionTestCase):
+    def setUp(self):
+        events._broker = None
+        self.business = make_user('stream-kitchen@example.com')
+        self.store = Store.objects.create(business=self.business, name='Kitchen', address='3 Main St')
+        self.customer = make_user('stream-diner@example.com', user_type='customer')
+        self.order = Order.objects.create(customer=self.customer, store=self.store, total_amount=5,
+                                          delivery_address='4 Side St')
+
+    def tearDown(self):
+        events._broker = None
+
+    async def open_stream(self, user, **params):
+        token = str(UserRefreshToken.for_user(user).access_token)
+        response = await self.async_client.get('/api/orders/events/', {'token': token, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content.__aiter__()
+
+    async def read(self, stream, count):
+        chunks = []
+        async with asyncio.timeout(5):
+            while len(chunks) < count:
+                chunk = await stream.__anext__()
+                chunks.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+        return chunks
+
+    async def test_stream_requires_a_valid_token(self):
+        self.assertEqual((await self.async_client.get('/api/orders/events/')).status_code, 401)
+        response = await self.async_client.get('/api/orders/events/', {'token': 'not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_snapshot_then_live_events(self):
+        stream = await self.open_stream(self.customer)
+        retry, snapshot = await self.read(stream, 2)
+        self.assertTrue(retry.startswith('retry:'))
+        self.assertIn('event: snapshot', snapshot)
+        self.assertIn(f'"id": {self.order.id}', snapshot)
+
+        await sync_to_async(transition_orders)(self.store, {self.order.id: 0}, 'confirmed')
+        event, = await self.read(stream, 1)
+        self.assertIn('event: order.status', event)
+        self.assertIn('"confirmed"', event)
+        self.assertEqual(await self.read(stream, 1), [': heartbeat\n\n'])
+        await stream.aclose()
+
+    async def test_disconnect_unsubscribes(self):
+        async def no_orders():
+            return []
+
+        stream = events.event_stream(['customer:0'], None, no_orders)
+        await self.read(stream, 2)
+        self.assertIn('customer:0', events.get_broker().subscribers)
+        # The ASGI handler cancels the response task when the client goes
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(events.get_broker().subscribers, {})
+
+    async def test_reconnect_resumes_from_last_event_id(self):
+        stream = await self.open_stream(self.customer)
+        await self.read(stream, 2)
+        await sync_to_async(transition_orders)(self.store, {self.order.id: 0}, 'confirmed')
+        event, = await self.read(stream, 1)
+        await stream.aclose()
+        last_event_id = event.split('\n')[0].removeprefix('id: ')
+
+        await sync_to_async(transition_orders)(self.store, {self.order.id: 1}, 'preparing')
+        stream = await self.open_stream(self.customer, last_event_id=last_event_id)
+        _, missed = await self.read(stream, 2)
+        self.assertIn('"preparing"', missed)
+        await stream.aclose()
+
+        # An id the broker doesn't know gets a fresh snapshot
+        stream = await self.open_stream(self.customer, last_event_id='unknown-3')
+        _, snapshot = await self.read(stream, 2)
+        self.assertIn('event: snapshot', snapshot)
+        await stream.aclose()
+
+    async def test_store_stream_sees_new_orders(self):
+        product = await sync_to_async(Product.objects.create)(
+            store=self.store, name='Soup', price='3.00', stock_quantity=10)
+        stream = await self.open_stream(self.business)
+        await self.read(stream, 2)
+
+        response = await sync_to_async(client_for(self.customer).post)('/api/orders/', {
+            'store': self.store.id, 'delivery_address': '4 Side St',
+            'items': [{'product_id': product.id, 'quantity': 2}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        event, = await self.read(stream, 1)
+        self.assertIn('"pending"', event)
+        self.assertIn(f'"id": {response.json()["id"]}', event)
+        await stream.aclose()
+
+
+class StoreDashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.business = make_user('dashboard@example.com')
+        self.store = Store.objects.create(business=self.business, name='Diner', address='6 Main St')
+        self.pizza = Product.objects.create(store=self.store, name='Pizza', price=Decimal('10.00'), stock_quantity=100)
+        self.soda = Product.objects.create(store=self.store, name='Soda', price=Decimal('2.00'), stock_quantity=100)
+        self.alice = make_user('alice@example.com', user_type='customer')
+        self.bob = make_user('bob@example.com', user_type='customer')
+        self.client = client_for(self.business)
+
+    def order(self, customer, items, status='completed', days_ago=0):
+        order = Order.objects.create(customer=customer, store=self.store, status=status, delivery_address='x',
+                                     total_amount=sum(product.price * quantity for product, quantity in items))
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=quantity,
+                                                 price=product.price) for product, quantity in items])
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_metrics_over_the_default_period(self):
+        self.order(self.alice, [(self.pizza, 2), (self.soda, 1)])
+        self.order(self.bob, [(self.soda, 5)], days_ago=2)
+        self.order(self.bob, [(self.pizza, 1)], status='cancelled', days_ago=1)
+        self.order(self.alice, [(self.pizza, 1)], days_ago=40)
+
+        dashboard = self.client.get('/api/dashboard/').json()
+        summary = dashboard['summary']
+        self.assertEqual((summary['orders'], summary['customers']), (2, 2))
+        self.assertEqual((Decimal(summary['revenue']), Decimal(summary['average_order_value'])),
+                         (Decimal('32'), Decimal('16')))
+        self.assertEqual((dashboard['status_counts']['completed'], dashboard['status_counts']['cancelled']), (2, 1))
+        self.assertEqual(len(dashboard['daily']), 30)
+        self.assertEqual([Decimal(day['revenue']) for day in dashboard['daily'][-3:]],
+                         [Decimal('10'), Decimal('0'), Decimal('22')])
+        self.assertEqual([(product['name'], product['quantity_sold']) for product in dashboard['top_products']],
+                         [('Pizza', 2), ('Soda', 6)])
+
+    def test_cached_until_orders_change(self):
+        order = self.order(self.alice, [(self.soda, 1)], status='pending')
+        response = self.client.get('/api/dashboard/')
+        with self.assertNumQueries(1):
+            # Only the store lookup; the payload comes from the cache
+            self.assertEqual(self.client.get('/api/dashboard/').json(), response.json())
+        self.assertEqual(self.client.get('/api/dashboard/', headers={'if-none-match': response['ETag']}).status_code,
+                         304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_orders(self.store, {order.id: 0}, 'confirmed')
+        self.assertEqual(self.client.get('/api/dashboard/').json()['status_counts']['confirmed'], 1)
+
+    def test_date_range_and_access(self):
+        start = timezone.localdate() - timedelta(days=60)
+        self.assertEqual(len(self.client.get('/api/dashboard/', {'start': str(start)}).json()['daily']), 61)
+        self.assertEqual(self.client.get('/api/dashboard/', {'start': '2020-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/dashboard/', {'top': 'many'}).status_code, 400)
+        self.assertEqual(client_for(self.alice).get('/api/dashboard/').status_code, 403)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.business = make_user('idempotent@example.com')
+        self.item = InventoryItem.objects.create(business=self.business, name='Flour',
+                                                 total_added=10, current_quantity=10)
+        self.client = client_for(self.business)
+
+    def sell(self, quantity, key, client=None, item=None):
+        return (client or self.client).post('/api/sales/', {'item': (item or self.item).id, 'quantity': quantity},
+                                            format='json', headers={'idempotency-key': key})
+
+    def test_retry_replays_the_response(self):
+        first = self.sell(2, 'sale-1')
+        retry = self.sell(2, 'sale-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        self.assertEqual(Sale.objects.count(), 1)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_quantity, 8)
+
+    def test_key_reused_for_another_request(self):
+        self.sell(2, 'sale-1')
+        self.assertEqual(self.sell(3, 'sale-1').status_code, 422)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self.sell(300, 'sale-1').status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.sell(300, 'sale-1').status_code, 400)
+
+    def test_keys_are_per_user(self):
+        self.sell(1, 'shared')
+        other = make_user('idempotent-other@example.com')
+        item = InventoryItem.objects.create(business=other, name='Sugar', total_added=5, current_quantity=5)
+        response = self.sell(1, 'shared', client=client_for(other), item=item)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_header_is_optional_but_must_not_be_empty(self):
+        response = self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.sell(1, ' ').status_code, 400)
+        self.assertEqual(self.sell(1, 'k' * 256).status_code, 400)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0.1, IDEMPOTENCY_LOCK_SECONDS=60)
+    def test_request_in_progress(self):
+        self.sell(1, 'sale-1')
+        # As if the first request were still running
+        IdempotencyKey.objects.update(response_status=None, locked_at=timezone.now())
+        response = self.sell(1, 'sale-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # A claim older than IDEMPOTENCY_LOCK_SECONDS was left by a crash
+        IdempotencyKey.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        response = self.sell(1, 'sale-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_order_retry_and_sweep(self):
+        store = Store.objects.create(business=self.business, name='Bakery', address='7 Main St')
+        bread = Product.objects.create(store=store, name='Bread', price='3.00', stock_quantity=10)
+        customer = client_for(make_user('idempotent-diner@example.com', user_type='customer'))
+        body = {'store': store.id, 'delivery_address': '8 Side St', 'items': [{'product_id': bread.id, 'quantity': 2}]}
+        for _ in range(2):
+            response = customer.post('/api/orders/', body, format='json', headers={'idempotency-key': 'order-1'})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+        bread.refresh_from_db()
+        self.assertEqual(bread.stock_quantity, 8)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('sweep_idempotency_keys', stdout=out)
+        self.assertIn('Removed 1', out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        business = make_user('pantry@example.com')
+        self.store = Store.objects.create(business=business, name='Pantry', address='9 Main St')
+        self.pie = Product.objects.create(store=self.store, name='Pie', price='4.00', stock_quantity=5)
+        self.tart = Product.objects.create(store=self.store, name='Tart', price='2.00', stock_quantity=2)
+        self.customer = client_for(make_user('hungry@example.com', user_type='customer'))
+
+    def order(self, *items):
+        return self.customer.post('/api/orders/', {
+            'store': self.store.id, 'delivery_address': '10 Side St',
+            'items': [{'product_id': product.id, 'quantity': quantity} for product, quantity in items],
+        }, format='json')
+
+    def test_in_stock_follows_the_quantity(self):
+        self.assertTrue(self.pie.in_stock)
+        self.assertFalse(Product.objects.create(store=self.store, name='Scone', price='1.00').in_stock)
+
+    def test_order_reserves_stock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.order((self.pie, 2), (self.tart, 2), (self.pie, 1))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['items']), 2)
+
+        self.pie.refresh_from_db()
+        self.tart.refresh_from_db()
+        self.assertEqual((self.pie.stock_quantity, self.pie.in_stock), (2, True))
+        self.assertEqual((self.tart.stock_quantity, self.tart.in_stock), (0, False))
+        self.assertEqual(StockReservation.objects.filter(status='held').count(), 2)
+        # The catalog stops listing what has sold out
+        products = self.customer.get(f'/api/stores/{self.store.id}/products/').json()
+        self.assertEqual([product['name'] for product in products], ['Pie'])
+
+    def test_orders_cannot_oversell(self):
+        self.order((self.tart, 2))
+        response = self.order((self.pie, 1), (self.tart, 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient stock', response.content.decode())
+        self.assertEqual(Order.objects.count(), 1)
+        # Nothing of the rejected order is held
+        self.pie.refresh_from_db()
+        self.assertEqual(self.pie.stock_quantity, 5)
+
+    def test_invalid_items(self):
+        for items in ([], [(self.pie, 0)]):
+            with self.subTest(items=items):
+                self.assertEqual(self.order(*items).status_code, 400)
+        response = self.customer.post('/api/orders/', {
+            'store': self.store.id, 'delivery_address': '10 Side St',
+            'items': [{'product_id': 10 ** 6, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_release_is_idempotent(self):
+        order = Order.objects.get(pk=self.order((self.pie, 3)).json()['id'])
+        transition_orders(self.store, {order.id: 0}, 'cancelled')
+        self.assertEqual(release_reservations([order.id]), 0)
+        self.pie.refresh_from_db()
+        self.assertEqual(self.pie.stock_quantity, 5)
+
+    def test_sweeper_expires_and_releases(self):
+        stale = self.order((self.pie, 4)).json()['id']
+        Order.objects.filter(pk=stale).update(created_at=timezone.now() - timedelta(hours=2))
+        # Cancelled without going through the order queue
+        cancelled = Order.objects.get(pk=self.order((self.pie, 1)).json()['id'])
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        self.order((self.tart, 1))
+
+        out = StringIO()
+        call_command('release_stock_reservations', stdout=out)
+        self.assertIn('Expired 1 pending orders, released 2 reservations', out.getvalue())
+        self.pie.refresh_from_db()
+        self.assertEqual((self.pie.stock_quantity, self.pie.in_stock), (5, True))
+        self.assertEqual(Order.objects.get(pk=stale).status, 'cancelled')
+        self.assertEqual(list(StockReservation.objects.filter(status='held').values_list('product', flat=True)),
+                         [self.tart.id])
+
+
+    def test_expiry_only_reports_orders_it_cancelled(self):
+        first, second = (self.order((self.pie, 1)).json()['id'] for _ in range(2))
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        now = timezone.now()
+        atomic = transaction.atomic
+
+        def cancelled_meanwhile(*args, **kwargs):
+            # Another writer cancels one candidate in the same instant
+            Order.objects.filter(pk=second).update(status='cancelled', updated_at=now)
+            return atomic(*args, **kwargs)
+
+        with mock.patch('api.stock.transaction.atomic', cancelled_meanwhile), \
+                mock.patch('api.stock.publish_order_status') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(expire_pending_orders(now), [first])
+        self.assertEqual([row['id'] for row in publish.call_args.args[0]], [first])
+        self.assertEqual(Order.objects.get(pk=second).version, 0)
+
+
+class LoadDataTests(TestCase):
+    def test_generated_products_are_consistent(self):
+        call_command('generate_load_data', businesses=2, customers=3, products_per_store=20,
+                     items_per_business=3, orders_per_customer=2, days=14, workers=1, stdout=StringIO())
+        products = Product.objects.filter(store__business__email__startswith='load-')
+        self.assertTrue(products.exists())
+        self.assertFalse(products.filter(in_stock=True, stock_quantity=0).exists())
+        self.assertFalse(products.filter(in_stock=False, stock_quantity__gt=0).exists())
+
+
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        self.business = make_user('buffered@example.com')
+        self.item = receive_stock(self.business, 'Bread', 10)
+        self.client = client_for(self.business)
+
+    def sell(self, quantity):
+        return self.client.post('/api/sales/', {'item': self.item.id, 'quantity': quantity}, format='json')
+
+    def counters(self):
+        self.item.refresh_from_db()
+        return self.item.total_sold, self.item.current_quantity
+
+    def test_sales_update_counters_directly_by_default(self):
+        self.assertEqual(self.sell(3).status_code, 201)
+        self.assertEqual(self.counters(), (3, 7))
+        self.assertFalse(PendingSaleDelta.objects.exists())
+
+        response = self.sell(8)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Available: 7', response.content.decode())
+
+    @override_settings(INVENTORY_WRITE_BEHIND=True)
+    def test_sales_are_buffered(self):
+        etag = self.client.get('/api/inventory/')['ETag']
+        self.assertEqual(self.sell(3).status_code, 201)
+        self.assertEqual(self.sell(4).status_code, 201)
+        self.assertEqual(self.counters(), (0, 10))
+        self.assertEqual(available_quantities([self.item.id]), {self.item.id: 3})
+
+        # Reads show the buffered sales, and they change the ETag
+        response = self.client.get('/api/inventory/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()[0]['total_sold'], response.json()[0]['current_quantity']), (7, 3))
+        detail = self.client.get(f'/api/inventory/{self.item.id}/').json()
+        self.assertEqual(detail['current_quantity'], 3)
+
+        # A PUT of the values shown stores them without the buffered sales
+        detail['unit_price'] = '2.00'
+        response = self.client.put(f'/api/inventory/{self.item.id}/', detail, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_quantity'], 3)
+        self.assertEqual(self.counters(), (0, 10))
+
+    @override_settings(INVENTORY_WRITE_BEHIND=True)
+    def test_buffered_sales_count_against_stock(self):
+        self.sell(7)
+        response = self.sell(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Available: 3', response.content.decode())
+
+        response = self.client.post('/api/waste/', {'item': self.item.id, 'quantity': 4}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PendingSaleDelta.objects.count(), 1)
+
+    @override_settings(INVENTORY_WRITE_BEHIND=True)
+    def test_buffered_sale_writes_before_it_checks(self):
+        # So on SQLite the write lock is held before the stock is read
+        with CaptureQueriesContext(connection) as captured, transaction.atomic():
+            take_sold_stock(self.item, 4)
+        statements = [query['sql'] for query in captured if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertTrue(statements[0].startswith('INSERT INTO "api_pendingsaledelta"'))
+
+        with self.assertRaises(InsufficientInventory) as raised, transaction.atomic():
+            take_sold_stock(self.item, 7)
+        self.assertEqual(raised.exception.available, 6)
+        self.assertEqual(list(PendingSaleDelta.objects.values_list('quantity', flat=True)), [4])
+
+    @override_settings(INVENTORY_WRITE_BEHIND=True)
+    def test_flush_folds_deltas_into_counters(self):
+        self.sell(3)
+        self.sell(4)
+        out = StringIO()
+        call_command('flush_sale_deltas', '--batch-size', '1', stdout=out)
+        self.assertIn('Flushed 2', out.getvalue())
+        self.assertEqual(self.counters(), (7, 3))
+        self.assertFalse(PendingSaleDelta.objects.exists())
+        self.assertEqual(flush_sale_deltas(), 0)
+
+        listed = self.client.get('/api/inventory/').json()[0]
+        self.assertEqual((listed['total_sold'], listed['current_quantity']), (7, 3))
+        # The ledger took the sales straight away
+        self.assertEqual(balances(InventoryItem.objects.filter(pk=self.item.pk)), {self.item.id: 3})
+
+
+class InventoryLedgerTests(TestCase):
+    def setUp(self):
+        self.business = make_user('ledger@example.com')
+        self.client = client_for(self.business)
+        response = self.client.post('/api/inventory/', {'name': 'Bread', 'total_added': 10, 'current_quantity': 10},
+                                    format='json')
+        self.item = InventoryItem.objects.get(pk=response.json()['id'])
+        self.items = InventoryItem.objects.filter(pk=self.item.pk)
+
+    def test_every_change_is_recorded(self):
+        opened = timezone.now()
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 3}, format='json')
+        self.client.post('/api/waste/', {'item': self.item.id, 'quantity': 1}, format='json')
+        receive_stock(self.business, 'Bread', 5)
+        response = self.client.patch(f'/api/inventory/{self.item.id}/', {'current_quantity': 9}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(list(InventoryMovement.objects.order_by('id').values_list('kind', 'quantity')),
+                         [('added', 10), ('sold', -3), ('wasted', -1), ('added', 5), ('adjusted', -2)])
+        self.assertEqual(balances(self.items), {self.item.id: 9})
+        self.assertEqual(balances(self.items, opened), {self.item.id: 10})
+        self.assertEqual(balances(self.items, opened - timedelta(days=1)), {self.item.id: 0})
+        self.assertEqual(movement_totals(self.business, opened, timezone.now()),
+                         {self.item.id: {'sold': -3, 'wasted': -1, 'added': 5, 'adjusted': -2}})
+
+    def test_item_reads_show_the_ledger_balance(self):
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 3}, format='json')
+        take_snapshots(at=timezone.now())
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 1}, format='json')
+        # Counters that drifted don't change what is shown
+        InventoryItem.objects.filter(pk=self.item.pk).update(current_quantity=50)
+        self.assertEqual(self.client.get(f'/api/inventory/{self.item.id}/').json()['current_quantity'], 6)
+        self.assertEqual(self.client.get('/api/inventory/').json()[0]['current_quantity'], 6)
+
+        response = self.client.patch(f'/api/inventory/{self.item.id}/', {'current_quantity': 8}, format='json')
+        self.assertEqual(response.json()['current_quantity'], 8)
+
+    def test_edit_does_not_absorb_a_concurrent_sale(self):
+        atomic = transaction.atomic
+        sold = []
+
+        def sale_lands_first(*args, **kwargs):
+            # A sale commits after the view read the item, before its update
+            if not sold:
+                sold.append(3)
+                InventoryItem.objects.filter(pk=self.item.pk).update(
+                    total_sold=F('total_sold') + 3, current_quantity=F('current_quantity') - 3)
+                record_movement(self.item, 'sold', -3)
+            return atomic(*args, **kwargs)
+
+        with mock.patch('api.views.transaction.atomic', sale_lands_first):
+            response = self.client.patch(f'/api/inventory/{self.item.id}/', {'current_quantity': 9}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(InventoryMovement.objects.get(kind='adjusted').quantity, 2)
+        self.assertEqual(balances(self.items), {self.item.id: 9})
+        self.assertEqual(reconcile(), [])
+
+    def test_balances_start_from_the_latest_snapshot(self):
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 3}, format='json')
+        taken = timezone.now()
+        self.assertEqual(take_snapshots(at=taken), 1)
+        self.assertEqual(take_snapshots(at=taken), 0)
+
+        # Altered so the test can tell it is what the balance reads
+        InventorySnapshot.objects.update(quantity=100)
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 2}, format='json')
+        self.assertEqual(balances(self.items), {self.item.id: 98})
+        self.assertEqual(balances(self.items, taken - timedelta(microseconds=1)), {self.item.id: 7})
+
+    def test_snapshots_lag_behind_recent_movements(self):
+        out = StringIO()
+        call_command('snapshot_inventory', stdout=out)
+        self.assertIn('Wrote 0', out.getvalue())
+
+    def test_reconcile_finds_and_fixes_drift(self):
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 3}, format='json')
+        out = StringIO()
+        call_command('reconcile_inventory', stdout=out)
+        self.assertIn('All inventory counters match', out.getvalue())
+
+        InventoryItem.objects.filter(pk=self.item.pk).update(current_quantity=50)
+        out = StringIO()
+        call_command('reconcile_inventory', '--business', 'ledger@example.com', stdout=out)
+        self.assertIn(f'{self.item.id} Bread: counter 50, ledger 7', out.getvalue())
+
+        call_command('reconcile_inventory', '--fix', stdout=StringIO())
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.current_quantity, 7)
+        self.assertEqual(reconcile(), [])
+
+    @override_settings(INVENTORY_WRITE_BEHIND=True)
+    def test_buffered_sales_are_not_drift(self):
+        self.client.post('/api/sales/', {'item': self.item.id, 'quantity': 4}, format='json')
+        self.assertTrue(PendingSaleDelta.objects.exists())
+        self.assertEqual(reconcile(), [])
+        flush_sale_deltas()
+        self.assertEqual(reconcile(), [])
+
+    def test_migration_opens_the_ledger_now(self):
+        InventoryItem.objects.filter(pk=self.item.pk).update(created_at=timezone.now() - timedelta(days=90))
+        InventoryMovement.objects.all().delete()
+        PendingSaleDelta.objects.create(item=self.item, quantity=3)
+        before = timezone.now()
+
+        import_module('api.migrations.0015_inventory_ledger').open_ledger(django_apps, None)
+        movement = InventoryMovement.objects.get()
+        self.assertEqual((movement.kind, movement.quantity), ('opening', 7))
+        self.assertGreaterEqual(movement.recorded_at, before)
+        self.assertEqual(balances(self.items, before), {self.item.id: 0})
@@ -12,6 +12,9 @@ urlpatterns = [
     path('inventory/<int:pk>/', views.InventoryItemDetail.as_view(),
          name='inventory-detail'),
     path('sales/', views.SaleListCreate.as_view(), name='sale-list-create'),
+    path('sales/daily/', views.DailySalesList.as_view(), name='daily-sales'),
+    path('waste/', views.WasteEventListCreate.as_view(), name='waste-list-create'),
+    path('waste/analytics/', views.waste_analytics_view, name='waste-analytics'),
     path('reports/', views.InventoryReportList.as_view(), name='report-list'),
     path('reports/generate/', views.generate_inventory_report,
          name='generate-report'),
@@ -20,15 +23,22 @@ urlpatterns = [
     path('update-reporting-frequency/', views.update_reporting_frequency,
          name='update-reporting-frequency'),
     path('chat/', views.chat_with_ai, name='chat-with-ai'),
+    path('forecast/', views.demand_forecast, name='demand-forecast'),
     
     # Store and Product endpoints
     path('stores/', views.StoreList.as_view(), name='store-list'),
+    path('stores/nearby/', views.nearby_stores, name='store-nearby'),
     path('stores/<int:pk>/', views.StoreDetail.as_view(), name='store-detail'),
     path('stores/<int:store_id>/products/', views.ProductList.as_view(), name='product-list'),
+    path('products/search/', views.product_search, name='product-search'),
     
     # Order endpoints
     path('orders/', views.OrderListCreate.as_view(), name='order-list-create'),
     path('orders/<int:pk>/', views.OrderDetail.as_view(), name='order-detail'),
+    path('orders/queue/', views.business_order_queue, name='order-queue'),
+    path('orders/queue/transition/', views.transition_order_status, name='order-transition'),
+    path('orders/events/', views.order_events, name='order-events'),
+    path('dashboard/', views.store_dashboard_view, name='store-dashboard'),
     
     # Payment endpoints removed - Stripe integration removed
 ]
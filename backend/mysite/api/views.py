@@ -4,11 +4,14 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Customer, InventoryItem, Sale, InventoryReport, Store, Product, Order, OrderItem
-from .serializers import CustomerSerializer, InventoryItemSerializer, SaleSerializer, InventoryReportSerializer, StoreSerializer, ProductSerializer, OrderSerializer, OrderItemSerializer
+from .models import Customer, InventoryItem, Sale, WasteEvent, InventoryReport, Store, Product, Order, OrderItem
+from .serializers import CustomerSerializer, InventoryItemSerializer, SaleSerializer, InventoryReportSerializer, StoreSerializer, ProductSerializer, OrderSerializer, OrderItemSerializer, DailyItemSalesSerializer, WasteEventSerializer, ProductSearchSerializer, NearbyStoreSerializer
 # Stripe import removed
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
 from accounts.models import User
 from accounts.serializers import UserUpdateSerializer
@@ -19,11 +22,30 @@ import os
 from django.conf import settings
 from datetime import datetime, timedelta
 import pandas as pd
-from django.http import FileResponse
-import openpyxl
-from openpyxl.styles import Font, PatternFill
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from accounts.authentication import CachedJWTAuthentication
 import logging
 from .chatbot.chatbot import analyze_csv, chat_with_gpt
+from .rollups import record_sale, daily_sales
+from .forecasting import DEFAULTS as FORECAST_DEFAULTS, reorder_suggestions
+from .waste import WasteExceedsStock, log_waste, waste_analytics
+from . import reports
+from . import catalog_cache
+from .conditional import ConditionalGetMixin, etag_matches
+from .idempotency import IdempotentCreateMixin
+from .search import search_products
+from . import geo
+from .dashboard import store_dashboard
+from .stock import InsufficientStock, reserve_stock
+from .ledger import balances, receive_stock, record_movement, with_balances
+from .inventory_buffer import InsufficientInventory, pending_validators, take_sold_stock, with_pending_sales
+from .order_queue import ACTIVE_STATUSES, ORDER_TRANSITIONS, order_queue, transition_orders
+from .events import (ORDER_EVENT_FIELDS, customer_channel, event_stream, order_event_data,
+                     publish_order_status, store_channel)
+from mysite.metrics import time_upstream
 
 logger = logging.getLogger(__name__)
 
@@ -108,12 +130,13 @@ def analyze_image(request):
         }
 
         # Make request to OpenAI API
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
+        with time_upstream('openai', 'analyze_image'):
+            response = requests.post(
+                'https://api.openai.com/v1/chat/completions',
+                headers=headers,
+                json=payload,
+                timeout=30
+            )
 
         if response.status_code != 200:
             return Response(
@@ -145,21 +168,8 @@ def analyze_image(request):
             updated_items = []
             for item_name, count in parsed_data['items'].items():
                 if isinstance(count, (int, float)) and count > 0:
-                    # Get or create inventory item
-                    item, created = InventoryItem.objects.get_or_create(
-                        business=request.user,
-                        name=item_name,
-                        defaults={
-                            'total_added': count,
-                            'current_quantity': count
-                        }
-                    )
-
-                    if not created:
-                        # Update existing item
-                        item.total_added += count
-                        item.current_quantity += count
-                        item.save()
+                    # Get or create the inventory item and add the stock
+                    item = receive_stock(request.user, item_name, int(count))
 
                     updated_items.append({
                         'name': item_name,
@@ -180,26 +190,56 @@ def analyze_image(request):
         )
 
 
-class InventoryItemListCreate(generics.ListCreateAPIView):
+class InventoryItemListCreate(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = InventoryItemSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
+        return with_balances(with_pending_sales(self.get_validator_base_queryset()))
+
+    def get_validator_base_queryset(self):
         return InventoryItem.objects.filter(business=self.request.user)
 
+    def get_extra_validators(self):
+        return pending_validators(self.request.user)
+
     def perform_create(self, serializer):
-        serializer.save(business=self.request.user)
+        with transaction.atomic():
+            item = serializer.save(business=self.request.user)
+            record_movement(item, 'added', item.current_quantity)
 
 
-class InventoryItemDetail(generics.RetrieveUpdateDestroyAPIView):
+class InventoryItemDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = InventoryItemSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
+        return with_balances(with_pending_sales(self.get_validator_base_queryset()))
+
+    def get_validator_base_queryset(self):
         return InventoryItem.objects.filter(business=self.request.user)
 
+    def get_extra_validators(self):
+        return pending_validators(self.request.user)
+
+    def perform_update(self, serializer):
+        pk = serializer.instance.pk
+        with transaction.atomic():
+            # Lock the row (SQLite's IMMEDIATE transactions hold the write
+            # lock already) and read the balance under it, so a sale, waste
+            # event or flush landing meanwhile isn't counted as part of the edit
+            list(InventoryItem.objects.select_for_update().filter(pk=pk).values_list('pk'))
+            before = balances(InventoryItem.objects.filter(pk=pk))[pk]
+            serializer.save()
+            if 'current_quantity' in serializer.validated_data:
+                # A quantity set by hand goes into the ledger as the difference
+                record_movement(serializer.instance, 'adjusted',
+                                serializer.validated_data['current_quantity'] - before)
+        # Respond with the balance the adjustment moved, as a read would show it
+        serializer.instance = self.get_queryset().get(pk=pk)
+
 
-class SaleListCreate(generics.ListCreateAPIView):
+class SaleListCreate(IdempotentCreateMixin, generics.ListCreateAPIView):
     serializer_class = SaleSerializer
     permission_classes = [IsAuthenticated]
 
@@ -207,23 +247,113 @@ class SaleListCreate(generics.ListCreateAPIView):
         return Sale.objects.filter(business=self.request.user)
 
     def perform_create(self, serializer):
-        # Get the inventory item
         item = serializer.validated_data['item']
         quantity = serializer.validated_data['quantity']
 
-        # Check if enough inventory is available
-        if item.current_quantity < quantity:
+        with transaction.atomic():
+            # Take the stock (or buffer it with INVENTORY_WRITE_BEHIND on)
+            try:
+                take_sold_stock(item, quantity)
+            except InsufficientInventory as e:
+                raise serializers.ValidationError(str(e))
+
+            # Create the sale record and roll it into the daily totals
+            sale = serializer.save(business=self.request.user)
+            record_sale(sale)
+
+
+class DailySalesList(generics.ListAPIView):
+    """
+    Per-item daily sales read from the rollup table.
+    Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD bounds (inclusive).
+    """
+    serializer_class = DailyItemSalesSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        start = self.request.query_params.get('start')
+        end = self.request.query_params.get('end')
+        try:
+            # parse_date raises ValueError for well-formed but impossible dates
+            start_date = parse_date(start) if start else None
+            end_date = parse_date(end) if end else None
+        except ValueError:
+            start_date = end_date = None
+        if (start and not start_date) or (end and not end_date):
             raise serializers.ValidationError(
-                f"Insufficient inventory. Available: {item.current_quantity}, Requested: {quantity}"
-            )
+                "Dates must be in YYYY-MM-DD format")
+        return daily_sales(self.request.user, start_date, end_date)
+
+
+class WasteEventListCreate(generics.ListCreateAPIView):
+    """
+    List waste events, or log one (object body) or many (list body) at once
+    """
+    serializer_class = WasteEventSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WasteEvent.objects.filter(
+            business=self.request.user).select_related('item').order_by('-wasted_at')
 
-        # Update inventory
-        item.total_sold += quantity
-        item.current_quantity -= quantity
-        item.save()
+    def create(self, request, *args, **kwargs):
+        many = isinstance(request.data, list)
+        serializer = self.get_serializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        entries = serializer.validated_data if many else [serializer.validated_data]
 
-        # Create the sale record
-        serializer.save(business=self.request.user)
+        # Stock is checked by the same conditional UPDATE that takes it
+        try:
+            events = log_waste(request.user, entries)
+        except WasteExceedsStock as e:
+            raise serializers.ValidationError(str(e))
+        data = WasteEventSerializer(events, many=True).data
+        return Response(data if many else data[0], status=status.HTTP_201_CREATED)
+
+
+def _date_range_params(request, default_days=30):
+    """
+    Read ?start=&end= (YYYY-MM-DD) from the query string. Defaults to the
+    last `default_days` days ending today. Returns (start, end) or raises
+    ValidationError.
+    """
+    end = request.query_params.get('end')
+    start = request.query_params.get('start')
+    try:
+        # parse_date raises ValueError for well-formed but impossible dates
+        end_date = parse_date(end) if end else timezone.localdate()
+        start_date = parse_date(start) if start else (
+            end_date - timedelta(days=default_days - 1) if end_date else None)
+    except ValueError:
+        start_date = end_date = None
+    if not start_date or not end_date:
+        raise serializers.ValidationError("Dates must be in YYYY-MM-DD format")
+    if start_date > end_date:
+        raise serializers.ValidationError("start must not be after end")
+    return start_date, end_date
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def waste_analytics_view(request):
+    """
+    Waste loss vs net gain per item over ?start=&end= (default: last 30 days)
+    """
+    start_date, end_date = _date_range_params(request)
+    try:
+        rows, summary = waste_analytics(request.user, start_date, end_date)
+        return Response({
+            'period_start': start_date,
+            'period_end': end_date,
+            'items': rows,
+            'summary': summary
+        })
+    except Exception as e:
+        logger.error(f"Error computing waste analytics: {str(e)}")
+        return Response(
+            {'error': f'Failed to compute waste analytics: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 class InventoryReportList(generics.ListAPIView):
@@ -241,82 +371,12 @@ def generate_inventory_report(request):
     Generate inventory report based on user's reporting frequency
     """
     try:
-        user = request.user
-
-        # Create inventory_reports directory if it doesn't exist
-        reports_dir = os.path.join(settings.BASE_DIR, 'inventory_reports')
-        os.makedirs(reports_dir, exist_ok=True)
-
-        # Get current inventory items
-        inventory_items = InventoryItem.objects.filter(business=user)
-
-        # Create Excel file
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Inventory Summary"
-
-        # Add headers
-        headers = ['Item Name', 'Total Added',
-                   'Total Sold', 'Current Quantity']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(
-                start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-
-        # Add data
-        for row, item in enumerate(inventory_items, 2):
-            ws.cell(row=row, column=1, value=item.name)
-            ws.cell(row=row, column=2, value=item.total_added)
-            ws.cell(row=row, column=3, value=item.total_sold)
-            ws.cell(row=row, column=4, value=item.current_quantity)
-
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        # Generate filename based on frequency
-        today = datetime.now()
-        if user.reporting_frequency == 'daily':
-            filename = f"inventory_daily_{today.strftime('%Y-%m-%d')}.xlsx"
-        elif user.reporting_frequency == '3days':
-            filename = f"inventory_3days_{today.strftime('%Y-%m-%d')}.xlsx"
-        elif user.reporting_frequency == 'weekly':
-            week_num = today.isocalendar()[1]
-            filename = f"inventory_weekly_W{week_num:02d}.xlsx"
-        elif user.reporting_frequency == 'monthly':
-            filename = f"inventory_monthly_{today.strftime('%Y-%m')}.xlsx"
-        elif user.reporting_frequency == 'custom':
-            days = user.custom_reporting_days or 7
-            filename = f"inventory_custom_{days}_days_{today.strftime('%Y-%m-%d')}.xlsx"
-        else:
-            filename = f"inventory_{today.strftime('%Y-%m-%d_%H-%M-%S')}.xlsx"
-
-        file_path = os.path.join(reports_dir, filename)
-        wb.save(file_path)
-
-        # Create report record
-        report = InventoryReport.objects.create(
-            business=user,
-            report_type=user.reporting_frequency,
-            file_path=file_path,
-            period_start=today.date(),
-            period_end=today.date()
-        )
+        report = reports.generate_inventory_report(request.user)
 
         return Response({
             'message': 'Inventory report generated successfully',
             'report_id': report.id,
-            'filename': filename
+            'filename': report.filename
         }, status=status.HTTP_201_CREATED)
 
     except Exception as e:
@@ -331,22 +391,71 @@ def generate_inventory_report(request):
 @permission_classes([IsAuthenticated])
 def download_report(request, report_id):
     """
-    Download a specific inventory report
+    Download a specific inventory report.
+    Report files are immutable and content-addressed, so the content hash
+    is a strong ETag: If-None-Match is answered with 304 without touching
+    the file, and single byte ranges (Range / If-Range) are supported.
     """
     try:
         report = InventoryReport.objects.get(
             id=report_id, business=request.user)
 
-        if not os.path.exists(report.file_path):
+        if not report.content_hash:
+            # Reports stored before content addressing: hash once, keep it
+            try:
+                report.content_hash = reports.file_sha256(report.file_path)
+                report.file_size = os.path.getsize(report.file_path)
+            except FileNotFoundError:
+                return Response(
+                    {'error': 'Report file not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            report.save(update_fields=['content_hash', 'file_size'])
+
+        etag = f'"{report.content_hash}"'
+        reports.touch_report(report)
+
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        try:
+            report_file = open(report.file_path, 'rb')
+        except FileNotFoundError:
             return Response(
                 {'error': 'Report file not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        filename = os.path.basename(report.file_path)
-        response = FileResponse(open(report.file_path, 'rb'))
+        size = report.file_size
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if range_header and request.headers.get('If-Range', etag) == etag:
+            byte_range = _parse_byte_range(range_header, size)
+            if byte_range is None:
+                report_file.close()
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            with report_file:
+                report_file.seek(start)
+                response = HttpResponse(
+                    report_file.read(end - start + 1),
+                    status=status.HTTP_206_PARTIAL_CONTENT)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(report_file)
+
+        filename = report.filename or os.path.basename(report.file_path)
         response['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = etag
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
         return response
 
     except InventoryReport.DoesNotExist:
@@ -362,6 +471,32 @@ def download_report(request, report_id):
         )
 
 
+def _parse_byte_range(header, size):
+    """
+    Parse a single "bytes=start-end" range (including open-ended and suffix
+    forms). Returns inclusive (start, end) or None if unsatisfiable.
+    Multiple ranges are not supported and are treated as unsatisfiable.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec or '-' not in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_reporting_frequency(request):
@@ -414,20 +549,7 @@ def send_test_inventory_data(request):
 
         # Create or update inventory items
         for item_data in test_items:
-            item, created = InventoryItem.objects.get_or_create(
-                business=user,
-                name=item_data["name"],
-                defaults={
-                    'total_added': item_data["count"],
-                    'current_quantity': item_data["count"]
-                }
-            )
-
-            if not created:
-                # Update existing item
-                item.total_added += item_data["count"]
-                item.current_quantity += item_data["count"]
-                item.save()
+            item = receive_stock(user, item_data["name"], item_data["count"])
 
             updated_items.append({
                 'name': item_data["name"],
@@ -437,57 +559,29 @@ def send_test_inventory_data(request):
             })
 
         # Generate Excel report
-        reports_dir = os.path.join(settings.BASE_DIR, 'inventory_reports')
-        os.makedirs(reports_dir, exist_ok=True)
-
-        # Create Excel file
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Test Inventory Summary"
-
-        # Add headers
-        headers = ['Item Name', 'Total Added',
-                   'Total Sold', 'Current Quantity']
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(
-                start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-
-        # Add data
-        for row, item in enumerate(updated_items, 2):
-            ws.cell(row=row, column=1, value=item['name'])
-            ws.cell(row=row, column=2, value=item['total_added'])
-            ws.cell(row=row, column=3, value=0)  # No sales in test data
-            ws.cell(row=row, column=4, value=item['current_quantity'])
-
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        # Generate filename
         today = datetime.now()
         filename = f"test_inventory_{today.strftime('%Y-%m-%d_%H-%M-%S')}.xlsx"
-        file_path = os.path.join(reports_dir, filename)
-        wb.save(file_path)
+        content = reports.render_inventory_workbook(
+            "Test Inventory Summary",
+            reports.INVENTORY_HEADERS,
+            # No sales in test data
+            [(item['name'], item['total_added'], 0, item['current_quantity'])
+             for item in updated_items]
+        )
+        file_path, digest, size = reports.store_report_file(user.id, content)
 
         # Create report record
         report = InventoryReport.objects.create(
             business=user,
             report_type='test',
             file_path=file_path,
+            filename=filename,
+            content_hash=digest,
+            file_size=size,
             period_start=today.date(),
             period_end=today.date()
         )
+        reports.enforce_report_retention(user)
 
         return Response({
             'message': 'Test inventory data sent successfully',
@@ -544,6 +638,25 @@ def chat_with_ai(request):
             else:
                 # Handle file upload
                 context_summary = analyze_csv(csv_data)
+        elif request.user.user_type == 'business':
+            # No CSV: summarise the last 30 days of recorded sales and waste
+            end_date = timezone.localdate()
+            _, context_summary = waste_analytics(
+                request.user, end_date - timedelta(days=29), end_date)
+
+        # Give the assistant real reorder points computed from sales history
+        if request.user.user_type == 'business':
+            suggestions = [s for s in reorder_suggestions(request.user)
+                           if s['needs_reorder']]
+            context_summary['reorder_suggestions'] = [
+                {
+                    'item': s['item'],
+                    'on_hand': s['on_hand'],
+                    'reorder_point': s['reorder_point'],
+                    'suggested_order': s['suggested_order'],
+                }
+                for s in suggestions[:5]
+            ]
 
         # Get AI response with business profile
         response = chat_with_gpt(
@@ -563,7 +676,73 @@ def chat_with_ai(request):
         )
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def demand_forecast(request):
+    """
+    Forecast demand and suggest reorder quantities for every inventory item.
+    Optional query params: history_days, window, alpha, lead_time_days,
+    review_days, service_level
+    """
+    params = {}
+    try:
+        for name, default in FORECAST_DEFAULTS.items():
+            value = request.query_params.get(name)
+            if value is not None:
+                params[name] = type(default)(value)
+    except ValueError:
+        return Response(
+            {'error': 'Forecast parameters must be numeric'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if not 1 <= params.get('history_days', 1) <= 730:
+        return Response(
+            {'error': 'history_days must be between 1 and 730'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if params.get('window', 1) < 1:
+        return Response(
+            {'error': 'window must be at least 1'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if params.get('lead_time_days', 1) < 1:
+        return Response(
+            {'error': 'lead_time_days must be at least 1'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if params.get('review_days', 0) < 0:
+        return Response(
+            {'error': 'review_days must not be negative'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 0 < params.get('alpha', 0.5) <= 1:
+        return Response(
+            {'error': 'alpha must be in (0, 1]'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 0 < params.get('service_level', 0.5) < 1:
+        return Response(
+            {'error': 'service_level must be in (0, 1)'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        suggestions = reorder_suggestions(request.user, **params)
+        return Response({
+            'parameters': {**FORECAST_DEFAULTS, **params},
+            'items': suggestions
+        })
+    except Exception as e:
+        logger.error(f"Error computing demand forecast: {str(e)}")
+        return Response(
+            {'error': f'Failed to compute forecast: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 # Store Views
+# Catalog responses are served pre-rendered from the versioned catalog cache
 class StoreList(generics.ListAPIView):
     serializer_class = StoreSerializer
     permission_classes = [IsAuthenticated]
@@ -571,12 +750,60 @@ class StoreList(generics.ListAPIView):
     def get_queryset(self):
         return Store.objects.filter(is_active=True)
 
+    def list(self, request, *args, **kwargs):
+        return catalog_cache.store_list_response(
+            request,
+            lambda: super(StoreList, self).list(request, *args, **kwargs).data)
+
 
 class StoreDetail(generics.RetrieveAPIView):
     serializer_class = StoreSerializer
     permission_classes = [IsAuthenticated]
     queryset = Store.objects.all()
 
+    def retrieve(self, request, *args, **kwargs):
+        return catalog_cache.store_detail_response(
+            request,
+            self.kwargs['pk'],
+            lambda: super(StoreDetail, self).retrieve(request, *args, **kwargs).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def nearby_stores(request):
+    """
+    Active stores within a radius of a point, nearest first.
+    Query params: lat, lon, radius (km, default 5, max 500), limit
+    (default 50, max 200)
+    """
+    try:
+        latitude = float(request.query_params['lat'])
+        longitude = float(request.query_params['lon'])
+        radius = float(request.query_params.get('radius', 5))
+        limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+    except KeyError:
+        return Response(
+            {'error': 'Query parameters lat and lon are required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError:
+        return Response(
+            {'error': 'lat, lon and radius must be numbers and limit an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius <= 500:
+        return Response(
+            {'error': 'lat must be in [-90, 90], lon in [-180, 180] and radius in (0, 500]'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    stores = []
+    for distance, store in geo.nearby(
+            Store.objects.filter(is_active=True), latitude, longitude, radius, limit):
+        store.distance_km = distance
+        stores.append(store)
+    return Response(NearbyStoreSerializer(stores, many=True).data)
+
 
 # Product Views
 class ProductList(generics.ListAPIView):
@@ -587,9 +814,43 @@ class ProductList(generics.ListAPIView):
         store_id = self.kwargs.get('store_id')
         return Product.objects.filter(store_id=store_id, in_stock=True)
 
+    def list(self, request, *args, **kwargs):
+        return catalog_cache.product_list_response(
+            request,
+            self.kwargs['store_id'],
+            lambda: super(ProductList, self).list(request, *args, **kwargs).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def product_search(request):
+    """
+    Full-text product search across all active stores, best match first.
+    Query params: q (words are matched as prefixes), limit (default 20,
+    max 100), store (optional store id)
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response(
+            {'error': 'Query parameter q is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        store_id = request.query_params.get('store')
+        store_id = int(store_id) if store_id else None
+    except ValueError:
+        return Response(
+            {'error': 'limit and store must be integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    products = search_products(text, limit, store_id)
+    return Response(ProductSearchSerializer(products, many=True).data)
+
 
 # Order Views
-class OrderListCreate(generics.ListCreateAPIView):
+class OrderListCreate(IdempotentCreateMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
@@ -597,35 +858,57 @@ class OrderListCreate(generics.ListCreateAPIView):
         return Order.objects.filter(customer=self.request.user)
 
     def perform_create(self, serializer):
-        # Calculate total amount
         items_data = self.request.data.get('items', [])
-        total_amount = 0
-        
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            quantity = item_data['quantity']
-            total_amount += product.price * quantity
-
-        # Create order
-        order = serializer.save(
-            customer=self.request.user,
-            total_amount=total_amount
-        )
-
-        # Create order items
-        for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=item_data['quantity'],
-                price=product.price
-            )
+        store = serializer.validated_data['store']
+        quantities = {}
+        try:
+            for item_data in items_data:
+                product_id = int(item_data['product_id'])
+                quantity = int(item_data['quantity'])
+                if quantity < 1:
+                    raise ValueError
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError(
+                "Each item needs a product_id and a positive integer quantity")
+        if not quantities:
+            raise serializers.ValidationError("An order needs at least one item")
+
+        products = Product.objects.filter(store=store, id__in=quantities).in_bulk()
+        missing = set(quantities) - set(products)
+        if missing:
+            raise serializers.ValidationError(
+                f"Products not found in this store: {', '.join(map(str, sorted(missing)))}")
+        total_amount = sum(products[product_id].price * quantity
+                           for product_id, quantity in quantities.items())
 
+        # Order, items and stock reservations commit together; reserving
+        # fails (and rolls everything back) if any product is short
+        try:
+            with transaction.atomic():
+                order = serializer.save(
+                    customer=self.request.user,
+                    total_amount=total_amount
+                )
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=products[product_id],
+                              quantity=quantity, price=products[product_id].price)
+                    for product_id, quantity in quantities.items()
+                ])
+                reserve_stock(order, quantities)
+        except InsufficientStock as e:
+            raise serializers.ValidationError(
+                f"Insufficient stock for {products[e.product_id].name}. Requested: {e.requested}")
+
+        # The dashboard may have been cached before the items were added
+        transaction.on_commit(lambda: catalog_cache.bump_dashboard(order.store_id))
+        # Lets the store's order queue stream show the new order
+        transaction.on_commit(lambda: publish_order_status(
+            Order.objects.filter(id=order.id).values(*ORDER_EVENT_FIELDS)))
         return order
 
 
-class OrderDetail(generics.RetrieveAPIView):
+class OrderDetail(ConditionalGetMixin, generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
@@ -633,4 +916,197 @@ class OrderDetail(generics.RetrieveAPIView):
         return Order.objects.filter(customer=self.request.user)
 
 
+def _business_store(request):
+    """The requesting business's store, or an error Response"""
+    if request.user.user_type != 'business':
+        return None, Response(
+            {'error': 'Only business accounts can manage orders'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    store = Store.objects.filter(business=request.user).first()
+    if store is None:
+        return None, Response(
+            {'error': 'No store found for this business'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return store, None
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def business_order_queue(request):
+    """
+    The business's incoming orders, oldest first.
+    Query params: status (comma-separated, default all active statuses),
+    limit (default 100, max 500)
+    """
+    store, error = _business_store(request)
+    if error:
+        return error
+
+    statuses = [s for s in request.query_params.get('status', '').split(',') if s] or ACTIVE_STATUSES
+    unknown = set(statuses) - set(ORDER_TRANSITIONS)
+    if unknown:
+        return Response(
+            {'error': f"Unknown status: {', '.join(sorted(unknown))}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = min(max(int(request.query_params.get('limit', 100)), 1), 500)
+    except ValueError:
+        return Response(
+            {'error': 'limit must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    orders = order_queue(store, statuses)[:limit]
+    return Response(OrderSerializer(orders, many=True).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def transition_order_status(request):
+    """
+    Move several of the business's orders to a new status at once.
+    Body: {"status": "preparing", "orders": [{"id": 1, "version": 0}, ...]}
+    with each order's version as last read. All or nothing: if any order
+    has changed since, or can't move to the status, nothing is updated and
+    409 lists the conflicting orders.
+    """
+    store, error = _business_store(request)
+    if error:
+        return error
+
+    to_status = request.data.get('status')
+    entries = request.data.get('orders')
+    if to_status not in ORDER_TRANSITIONS:
+        return Response(
+            {'error': f"status must be one of: {', '.join(ORDER_TRANSITIONS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not isinstance(entries, list) or not 1 <= len(entries) <= 100:
+        return Response(
+            {'error': 'orders must be a list of 1 to 100 {"id", "version"} objects'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    versions = {}
+    try:
+        for entry in entries:
+            versions[int(entry['id'])] = int(entry['version'])
+    except (KeyError, TypeError, ValueError):
+        return Response(
+            {'error': 'Each order needs an integer id and version'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(versions) != len(entries):
+        return Response(
+            {'error': 'Each order may only appear once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    updated, conflicts = transition_orders(store, versions, to_status)
+    if not updated:
+        return Response(
+            {'error': 'Some orders have changed or cannot move to this status', 'conflicts': conflicts},
+            status=status.HTTP_409_CONFLICT
+        )
+    orders = order_queue(store, [to_status]).filter(id__in=updated)
+    return Response(OrderSerializer(orders, many=True).data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def store_dashboard_view(request):
+    """
+    Revenue per day, order counts by status and top products for the
+    business's store over ?start=&end= (default: last 30 days, at most a
+    year). ?top= sets how many products to list (default 10, max 50).
+    Cached until the store's orders or products change.
+    """
+    store, error = _business_store(request)
+    if error:
+        return error
+    start_date, end_date = _date_range_params(request)
+    if (end_date - start_date).days >= 366:
+        return Response(
+            {'error': 'The date range can be at most 366 days'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        top = min(max(int(request.query_params.get('top', 10)), 1), 50)
+    except ValueError:
+        return Response(
+            {'error': 'top must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return catalog_cache.dashboard_response(
+        request, store.id, start_date, end_date, top,
+        lambda: store_dashboard(store, start_date, end_date, top))
+
+
+def _event_stream_user(request):
+    """The user for an event stream, from ?token= or the Authorization header"""
+    authentication = CachedJWTAuthentication()
+    raw_token = request.GET.get('token')
+    if raw_token:
+        raw_token = raw_token.encode()
+    else:
+        header = authentication.get_header(request)
+        raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        raise AuthenticationFailed('Authentication credentials were not provided.')
+    return authentication.get_user(authentication.get_validated_token(raw_token))
+
+
+def _event_channels(user):
+    if user.user_type == 'business':
+        store = Store.objects.filter(business=user).first()
+        return [store_channel(store.id)] if store else []
+    return [customer_channel(user.id)]
+
+
+def _active_order_events(user):
+    orders = Order.objects.filter(status__in=ACTIVE_STATUSES)
+    if user.user_type == 'business':
+        orders = orders.filter(store__business=user)
+    else:
+        orders = orders.filter(customer=user)
+    return [order_event_data(row) for row in orders.order_by('created_at').values(*ORDER_EVENT_FIELDS)]
+
+
+async def order_events(request):
+    """
+    Server-Sent Events stream of order status changes, replacing polling of
+    the order endpoints. Customers get their own orders, businesses their
+    store's. Must be served under ASGI (mysite.asgi), where an idle stream
+    holds no thread.
+
+    EventSource can't set headers, so the access token may be passed as
+    ?token=. Reconnects resume from Last-Event-ID (or ?last_event_id=);
+    a new stream, or one whose gap can no longer be replayed, starts with
+    a "snapshot" event listing the active orders.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        user = await sync_to_async(_event_stream_user)(request)
+    except InvalidToken:
+        return JsonResponse({'error': 'Token is invalid or expired'}, status=401)
+    except AuthenticationFailed as e:
+        return JsonResponse({'error': str(e.detail)}, status=401)
+    channels = await sync_to_async(_event_channels)(user)
+    if not channels:
+        return JsonResponse({'error': 'No store found for this business'}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    response = StreamingHttpResponse(
+        event_stream(channels, last_event_id, sync_to_async(lambda: _active_order_events(user))),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # Stripe payment views removed - payment integration removed
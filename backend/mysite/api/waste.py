@@ -0,0 +1,122 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery,
+    Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .inventory_buffer import available_quantities, with_pending_sales
+from .models import DailyItemSales, InventoryItem, InventoryMovement, WasteEvent
+
+
+class WasteExceedsStock(Exception):
+    def __init__(self, item, available, wasted):
+        super().__init__(
+            f"Insufficient inventory for {item.name}. Available: {available}, Wasted: {wasted}")
+        self.item = item
+        self.available = available
+        self.wasted = wasted
+
+
+def log_waste(business, entries):
+    """
+    Record many waste events at once. `entries` are validated dicts with
+    item, quantity and optional reason/wasted_at. Takes the wasted stock
+    off every affected item in one UPDATE that only matches items with
+    enough stock left (sales still buffered by INVENTORY_WRITE_BEHIND
+    included), then inserts all events and one ledger movement per item in
+    bulk, all in a single transaction. Raises WasteExceedsStock,
+    changing nothing, if any item is short.
+    """
+    totals = {}
+    items = {}
+    for entry in entries:
+        items[entry['item'].id] = entry['item']
+        totals[entry['item'].id] = totals.get(entry['item'].id, 0) + entry['quantity']
+
+    wasted = Case(
+        *[When(id=item_id, then=Value(qty)) for item_id, qty in totals.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+    now = timezone.now()
+    with transaction.atomic():
+        updated = (with_pending_sales(InventoryItem.objects.filter(business=business, id__in=totals))
+                   .filter(available__gte=wasted)
+                   .update(
+                       current_quantity=F('current_quantity') - wasted,
+                       total_wasted=F('total_wasted') + wasted,
+                       updated_at=now
+                   ))
+        if updated != len(totals):
+            available = available_quantities(totals)
+            item_id = next(item_id for item_id, qty in totals.items() if available.get(item_id, 0) < qty)
+            raise WasteExceedsStock(items[item_id], available.get(item_id, 0), totals[item_id])
+
+        events = WasteEvent.objects.bulk_create([
+            WasteEvent(business=business, **entry) for entry in entries
+        ])
+        InventoryMovement.objects.bulk_create([
+            InventoryMovement(business=business, item_id=item_id, kind='wasted',
+                              quantity=-qty, recorded_at=now)
+            for item_id, qty in totals.items()
+        ])
+    return events
+
+
+def _day_bounds(start, end):
+    tz = timezone.get_current_timezone()
+    return (datetime.combine(start, time.min, tzinfo=tz),
+            datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz))
+
+
+def waste_analytics(business, start, end):
+    """
+    Per-item waste loss vs net gain for [start, end], computed by the
+    database in one query. Returns (rows, summary); summary uses the same
+    keys as chatbot.analyze_csv so it can feed the chat context directly.
+    """
+    range_start, range_end = _day_bounds(start, end)
+
+    sold = (DailyItemSales.objects
+            .filter(item=OuterRef('pk'), day__gte=start, day__lte=end)
+            .order_by().values('item')
+            .annotate(total=Sum('qty')).values('total'))
+    wasted = (WasteEvent.objects
+              .filter(item=OuterRef('pk'), wasted_at__gte=range_start, wasted_at__lt=range_end)
+              .order_by().values('item')
+              .annotate(total=Sum('quantity')).values('total'))
+    money = DecimalField(max_digits=14, decimal_places=2)
+
+    rows = list(InventoryItem.objects
+                .filter(business=business)
+                .annotate(
+                    sold=Coalesce(Subquery(sold, output_field=IntegerField()), 0),
+                    wasted=Coalesce(Subquery(wasted, output_field=IntegerField()), 0))
+                .annotate(
+                    net_gain=ExpressionWrapper(
+                        (F('unit_price') - F('unit_cost')) * F('sold'), output_field=money),
+                    waste_loss=ExpressionWrapper(
+                        F('unit_cost') * F('wasted'), output_field=money))
+                .order_by('name')
+                .values('id', 'name', 'unit_cost', 'unit_price', 'sold', 'wasted',
+                        'net_gain', 'waste_loss'))
+
+    if not rows:
+        return rows, {}
+
+    top = max(rows, key=lambda r: r['sold'])
+    low = min(rows, key=lambda r: r['sold'])
+    summary = {
+        'net_gain_total': round(float(sum(r['net_gain'] for r in rows)), 2),
+        'waste_loss_total': round(float(sum(r['waste_loss'] for r in rows)), 2),
+        'top_seller': top['name'],
+        'low_seller': low['name'],
+        'optimize_more': [r['name'] for r in rows if r['net_gain'] > r['waste_loss']],
+        'cut_back': [r['name'] for r in rows if r['waste_loss'] > r['net_gain']],
+    }
+    return rows, summary
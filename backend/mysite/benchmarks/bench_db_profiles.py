@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Compare database profiles (DB_PROFILE) under concurrent sales and reads.
+
+Each profile runs in its own subprocess against a fresh database file.
+Worker threads emulate requests: every operation opens and closes its
+request the way Django's request signals do (so CONN_MAX_AGE matters),
+then either records a sale (read the item, update it, insert the sale
+and roll it up, all in one transaction) or lists recent sales.
+
+    python benchmarks/bench_db_profiles.py [--threads 8] [--seconds 10]
+
+The postgres profile is included when POSTGRES_HOST is set.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_worker(args):
+    import django
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import OperationalError, close_old_connections, connection, transaction
+    from django.db.models import F
+
+    from accounts.models import User
+    from api.models import InventoryItem, Sale
+    from api.rollups import record_sale
+
+    call_command('migrate', verbosity=0)
+    business = User.objects.create_user(
+        username='bench@example.com', email='bench@example.com',
+        password='bench-pass-123', user_type='business')
+    item_ids = [
+        InventoryItem.objects.create(
+            business=business, name=f'Item {i}', total_added=10 ** 9,
+            current_quantity=10 ** 9).id
+        for i in range(args.items)
+    ]
+    connection.close()
+
+    deadline = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    results = {'writes': [], 'reads': [], 'errors': 0}
+
+    def sell(rng):
+        quantity = rng.randint(1, 3)
+        with transaction.atomic():
+            # Read then write in one transaction: a deferred transaction has to
+            # upgrade its read lock, which fails at once under contention
+            item = InventoryItem.objects.get(pk=rng.choice(item_ids))
+            InventoryItem.objects.filter(pk=item.pk).update(
+                total_sold=F('total_sold') + quantity,
+                current_quantity=F('current_quantity') - quantity)
+            sale = Sale.objects.create(business=business, item=item, quantity=quantity)
+            record_sale(sale)
+
+    def recent_sales():
+        list(Sale.objects.filter(business=business).order_by('-sold_at')[:50])
+
+    def worker(seed):
+        rng = random.Random(seed)
+        writes, reads, errors = [], [], 0
+        while time.perf_counter() < deadline:
+            is_write = rng.random() < args.write_ratio
+            close_old_connections()
+            start = time.perf_counter()
+            try:
+                sell(rng) if is_write else recent_sales()
+            except OperationalError:
+                errors += 1
+            else:
+                (writes if is_write else reads).append(time.perf_counter() - start)
+            finally:
+                close_old_connections()
+        connection.close()
+        with lock:
+            results['writes'] += writes
+            results['reads'] += reads
+            results['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    def summary(timings):
+        if not timings:
+            return {'ops_per_sec': 0, 'p50_ms': None, 'p99_ms': None}
+        timings.sort()
+        return {
+            'ops_per_sec': round(len(timings) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 2),
+        }
+
+    print(json.dumps({
+        'writes': summary(results['writes']),
+        'reads': summary(results['reads']),
+        'errors': results['errors'],
+    }))
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DB_PROFILE=profile, SQLITE_PATH=os.path.join(tmp, 'bench.sqlite3'))
+        command = [sys.executable, os.path.abspath(__file__), '--worker',
+                   '--threads', str(args.threads), '--seconds', str(args.seconds),
+                   '--items', str(args.items), '--write-ratio', str(args.write_ratio)]
+        output = subprocess.run(command, env=env, capture_output=True, text=True)
+        if output.returncode != 0:
+            raise RuntimeError(f"{profile} worker failed:\n{output.stderr}")
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--write-ratio', type=float, default=0.5)
+    parser.add_argument('--profiles', nargs='+')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    profiles = args.profiles or ['sqlite', 'sqlite-prod'] + (
+        ['postgres'] if os.getenv('POSTGRES_HOST') else [])
+    print(f"{args.threads} threads, {args.seconds}s, {args.write_ratio:.0%} writes")
+    print(f"{'profile':12} {'kind':6} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for profile in profiles:
+        result = run_profile(profile, args)
+        for kind in ('writes', 'reads'):
+            row = result[kind]
+            print(f"{profile:12} {kind:6} {row['ops_per_sec']:>9} "
+                  f"{row['p50_ms'] or '-':>9} {row['p99_ms'] or '-':>9}")
+        print(f"{profile:12} errors {result['errors']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+"""
+Benchmark the main API endpoints in-process against a deterministic dataset.
+
+Builds a throwaway test database, seeds it at --scale (same seed, same
+data), then drives each endpoint through Django's test client with real
+JWT authentication and the full middleware stack. The AI assistant's
+upstream client is replaced by a stub, so chat measures our own work.
+
+For each endpoint records ops/sec, p50/p99 latency and queries per call.
+
+    python benchmarks/bench_endpoints.py [--scale 1] [--iterations 200]
+        [--output results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+With --baseline, results are compared and the exit status is 1 if any
+endpoint's p50 latency grew by more than --tolerance or it runs more
+queries than before.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import django
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from accounts.tokens import UserRefreshToken
+from api import geo
+from api.models import InventoryItem, Order, OrderItem, Product, Sale, Store, WasteEvent
+from api.rollups import rebuild_daily_sales
+
+DISHES = ['Pizza', 'Burger', 'Salad', 'Pasta', 'Taco', 'Sushi', 'Ramen', 'Curry',
+          'Sandwich', 'Soup', 'Wrap', 'Bagel', 'Muffin', 'Cake', 'Dumplings', 'Falafel']
+STYLES = ['Classic', 'Spicy', 'Veggie', 'Deluxe', 'Grilled', 'Crispy', 'Garlic', 'Smoky']
+CENTER = (40.73, -73.95)
+
+
+def seed(scale, rng):
+    """
+    Seed businesses with a store, products, inventory and sales history,
+    and customers with orders. Returns (business, customer, store) to
+    benchmark as.
+    """
+    n_businesses = 20 * scale
+    n_customers = 200 * scale
+    items_per_business = 50
+    products_per_store = 30
+    history_days = 90
+    password = make_password('bench-pass-123')
+
+    User.objects.bulk_create([
+        User(username=f'biz{i}', email=f'biz{i}@example.com', password=password,
+             user_type='business')
+        for i in range(n_businesses)
+    ] + [
+        User(username=f'cust{i}', email=f'cust{i}@example.com', password=password,
+             user_type='customer')
+        for i in range(n_customers)
+    ])
+    businesses = list(User.objects.filter(user_type='business').order_by('id'))
+    customers = list(User.objects.filter(user_type='customer').order_by('id'))
+
+    stores = []
+    for i, business in enumerate(businesses):
+        lat = CENTER[0] + rng.uniform(-0.2, 0.2)
+        lon = CENTER[1] + rng.uniform(-0.2, 0.2)
+        stores.append(Store(business=business, name=f'{rng.choice(STYLES)} Kitchen {i}',
+                            address=f'{i} Main St', latitude=lat, longitude=lon,
+                            geohash=geo.encode(lat, lon)))
+    Store.objects.bulk_create(stores)
+    stores = list(Store.objects.order_by('id'))
+
+    products = []
+    for store in stores:
+        for _ in range(products_per_store):
+            product = Product(store=store, name=f'{rng.choice(STYLES)} {rng.choice(DISHES)}',
+                              description='Freshly made', price=rng.randint(300, 2000) / 100,
+                              stock_quantity=rng.randint(0, 100))
+            # bulk_create skips Product.save(), which keeps in_stock in step
+            product.in_stock = product.stock_quantity > 0
+            products.append(product)
+    Product.objects.bulk_create(products)
+    products_by_store = {}
+    for product in Product.objects.order_by('id'):
+        products_by_store.setdefault(product.store_id, []).append(product)
+
+    InventoryItem.objects.bulk_create([
+        InventoryItem(business=business, name=f'Ingredient {j}', total_added=10000,
+                      current_quantity=rng.randint(0, 500),
+                      unit_cost=rng.randint(50, 500) / 100, unit_price=rng.randint(300, 1500) / 100)
+        for business in businesses for j in range(items_per_business)
+    ])
+    items = list(InventoryItem.objects.order_by('id'))
+
+    # Sale.sold_at is auto_now_add, so each day's rows are backdated after insert
+    today = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+    for days_ago in range(history_days, 0, -1):
+        day_sales = [
+            Sale(business_id=item.business_id, item=item, quantity=rng.randint(1, 8))
+            for item in items if rng.random() < 0.5
+        ]
+        created = Sale.objects.bulk_create(day_sales)
+        Sale.objects.filter(pk__gte=created[0].pk, pk__lte=created[-1].pk).update(
+            sold_at=today - timedelta(days=days_ago))
+        WasteEvent.objects.bulk_create([
+            WasteEvent(business_id=item.business_id, item=item, quantity=rng.randint(1, 3),
+                       reason='expired', wasted_at=today - timedelta(days=days_ago))
+            for item in items if rng.random() < 0.05
+        ])
+    rebuild_daily_sales()
+
+    orders = []
+    for customer in customers:
+        for _ in range(10):
+            orders.append(Order(customer=customer, store=rng.choice(stores),
+                                status=rng.choice(['pending', 'completed', 'completed']),
+                                total_amount=0, delivery_address='1 Bench Way'))
+    Order.objects.bulk_create(orders)
+    order_items = []
+    for order in Order.objects.order_by('id'):
+        for product in rng.sample(products_by_store[order.store_id], 2):
+            order_items.append(OrderItem(order=order, product=product,
+                                         quantity=rng.randint(1, 3), price=product.price))
+    OrderItem.objects.bulk_create(order_items)
+
+    return businesses[0], customers[0], stores[0]
+
+
+def stub_openai_client(latency_ms):
+    def create(**kwargs):
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        return SimpleNamespace(choices=[SimpleNamespace(
+            message=SimpleNamespace(content='Reorder the items running low.'))])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def client_for(user):
+    access = UserRefreshToken.for_user(user).access_token
+    return Client(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+
+def build_cases(business, customer, store):
+    """(name, client role, method, path or callable, body, iterations factor)"""
+    item = InventoryItem.objects.filter(business=business).order_by('id').first()
+    order = Order.objects.filter(customer=customer).order_by('id').first()
+    product = Product.objects.filter(store=store).order_by('id').first()
+    # Every order reserves stock; don't let the order create case sell out
+    product.stock_quantity = 10 ** 9
+    product.save(update_fields=['stock_quantity'])
+    return [
+        ('inventory list', 'business', 'get', '/api/inventory/', None, 1),
+        ('inventory detail', 'business', 'get', f'/api/inventory/{item.id}/', None, 1),
+        ('sales list', 'business', 'get', '/api/sales/', None, 0.25),
+        ('sales create', 'business', 'post', '/api/sales/', {'item': item.id, 'quantity': 1}, 1),
+        ('daily sales', 'business', 'get', '/api/sales/daily/', None, 0.25),
+        ('waste analytics', 'business', 'get', '/api/waste/analytics/', None, 0.5),
+        ('forecast', 'business', 'get', '/api/forecast/', None, 0.25),
+        ('stores list', 'customer', 'get', '/api/stores/', None, 1),
+        ('store detail', 'customer', 'get', f'/api/stores/{store.id}/', None, 1),
+        ('stores nearby', 'customer', 'get', f'/api/stores/nearby/?lat={CENTER[0]}&lon={CENTER[1]}&radius=5', None, 1),
+        ('products list', 'customer', 'get', f'/api/stores/{store.id}/products/', None, 1),
+        ('product search', 'customer', 'get', '/api/products/search/?q=spicy', None, 1),
+        ('orders list', 'customer', 'get', '/api/orders/', None, 1),
+        ('order detail', 'customer', 'get', f'/api/orders/{order.id}/', None, 1),
+        ('order create', 'customer', 'post', '/api/orders/', {
+            'customer': customer.id, 'store': store.id, 'delivery_address': '1 Bench Way',
+            'items': [{'product_id': product.id, 'quantity': 2}]}, 1),
+        ('reports list', 'business', 'get', '/api/reports/', None, 1),
+        ('report generate', 'business', 'post', '/api/reports/generate/', None, 0.1),
+        ('report download', 'business', 'get', 'report-download', None, 0.5),
+        ('chat', 'business', 'post', '/api/chat/', {'message': 'What should I reorder?'}, 0.25),
+    ]
+
+
+def run_case(client, method, path, body, iterations, warmup):
+    def call():
+        if method == 'get':
+            response = client.get(path)
+        else:
+            response = client.post(path, data=json.dumps(body or {}), content_type='application/json')
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {path} returned {response.status_code}: '
+                               f'{response.content[:200]}')
+        # Drain streaming responses (report downloads) as a client would
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        return response
+
+    for _ in range(warmup):
+        call()
+    with CaptureQueriesContext(connection) as queries:
+        call()
+    query_count = len(queries.captured_queries)
+
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / elapsed, 1),
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+        'queries': query_count,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table and return the names of regressed endpoints"""
+    regressions = []
+    print(f"\n{'endpoint':18} {'p50 ms':>9} {'base':>9} {'change':>8} {'queries':>8} {'base':>5}")
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:18} {row['p50_ms']:>9} {'-':>9} {'new':>8} {row['queries']:>8} {'-':>5}")
+            continue
+        change = row['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        regressed = change > tolerance or row['queries'] > base['queries']
+        if regressed:
+            regressions.append(name)
+        print(f"{name:18} {row['p50_ms']:>9} {base['p50_ms']:>9} {change:>+8.0%} "
+              f"{row['queries']:>8} {base['queries']:>5}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--upstream-latency-ms', type=float, default=0,
+                        help='Delay added by the stubbed AI upstream')
+    parser.add_argument('--only', nargs='+', help='Only run endpoints whose name contains one of these')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against results JSON from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative p50 increase before flagging a regression')
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    report_dir = tempfile.TemporaryDirectory()
+    try:
+        with override_settings(BASE_DIR=report_dir.name), \
+                mock.patch('api.chatbot.chatbot.client', stub_openai_client(args.upstream_latency_ms)):
+            t0 = time.perf_counter()
+            business, customer, store = seed(args.scale, random.Random(args.seed))
+            print(f"Seeded scale {args.scale} in {time.perf_counter() - t0:.1f}s")
+
+            clients = {'business': client_for(business), 'customer': client_for(customer)}
+            results = {}
+            for name, role, method, path, body, factor in build_cases(business, customer, store):
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                if path == 'report-download':
+                    clients[role].post('/api/reports/generate/')
+                    report_id = business.inventory_reports.order_by('-id').values_list('id', flat=True)[0]
+                    path = f'/api/reports/{report_id}/download/'
+                iterations = max(5, int(args.iterations * factor))
+                results[name] = run_case(clients[role], method, path, body, iterations, args.warmup)
+                row = results[name]
+                print(f"{name:18} {row['ops_per_sec']:>9} ops/s  p50 {row['p50_ms']:>8} ms  "
+                      f"p99 {row['p99_ms']:>8} ms  {row['queries']:>3} queries")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        report_dir.cleanup()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'scale': args.scale,
+                    'seed': args.seed,
+                    'iterations': args.iterations,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'recorded_at': timezone.now().isoformat(),
+                },
+                'results': results,
+            }, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            sys.exit(1)
+        print('\nNo regressions')
+
+
+if __name__ == '__main__':
+    main()
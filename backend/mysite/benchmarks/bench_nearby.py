@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Benchmark nearby-store lookups as the number of stores grows.
+
+Seeds a throwaway test database with --stores located stores spread over
+a metro area and times geo.nearby() against a full haversine scan.
+
+    python benchmarks/bench_nearby.py [--stores 50000] [--radius 2]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+django.setup()
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import geo
+from api.models import Store
+
+# Roughly New York City
+CENTER = (40.73, -73.95)
+SPREAD_DEGREES = 0.4
+
+
+def seed(n_stores, rng):
+    now = timezone.now()
+    with connection.cursor() as cursor, transaction.atomic():
+        cursor.executemany(
+            "INSERT INTO accounts_user (password, is_superuser, username, first_name, last_name, "
+            "email, is_staff, is_active, date_joined, user_type, phone_number, address, "
+            "reporting_frequency, custom_reporting_days, token_version, created_at, updated_at) "
+            "VALUES ('', 0, %s, '', '', %s, 0, 1, %s, 'business', '', '', 'weekly', 7, 0, %s, %s)",
+            [(f'bench{i}', f'bench{i}@example.com', now, now, now) for i in range(n_stores)])
+        cursor.execute("SELECT id FROM accounts_user ORDER BY id")
+        rows = []
+        for i, (user_id,) in enumerate(cursor.fetchall()):
+            lat = CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+            lon = CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES)
+            rows.append((user_id, f'Store {i}', lat, lon, geo.encode(lat, lon), now, now))
+        cursor.executemany(
+            "INSERT INTO api_store (business_id, name, description, address, phone, latitude, "
+            "longitude, geohash, is_active, created_at, updated_at) "
+            "VALUES (%s, %s, '', '', '', %s, %s, %s, 1, %s, %s)", rows)
+
+
+def full_scan(latitude, longitude, radius_km):
+    matches = []
+    for store in Store.objects.filter(is_active=True).exclude(latitude=None):
+        distance = geo.haversine_km(latitude, longitude, store.latitude, store.longitude)
+        if distance <= radius_km:
+            matches.append((distance, store))
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+
+def time_calls(fn, points):
+    timings = []
+    hits = 0
+    for latitude, longitude in points:
+        t0 = time.perf_counter()
+        hits += len(fn(latitude, longitude))
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))], hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stores', type=int, default=50000)
+    parser.add_argument('--radius', type=float, default=2.0)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.stores, rng)
+        points = [(CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                   CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES))
+                  for _ in range(args.queries)]
+
+        queryset = Store.objects.filter(is_active=True)
+        precision = geo.precision_for_radius(CENTER[0], args.radius)
+        print(f"{args.stores} stores, radius {args.radius} km, geohash precision {precision}")
+        if precision:
+            candidates = queryset.filter(
+                geo.cells_filter(geo.covering_cells(*CENTER, precision)))
+            print("Plan:", candidates.explain())
+
+        indexed = time_calls(
+            lambda lat, lon: geo.nearby(queryset, lat, lon, args.radius), points)
+        scan = time_calls(lambda lat, lon: full_scan(lat, lon, args.radius), points[:5])
+        print(f"geohash index  p50 {indexed[0]:8.2f} ms  p99 {indexed[1]:8.2f} ms  "
+              f"({indexed[2] / len(points):.1f} hits/query)")
+        print(f"full scan      p50 {scan[0]:8.2f} ms  p99 {scan[1]:8.2f} ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Benchmark full-text product search on a synthetic catalog.
+
+Builds a throwaway test database (migrations included, so the FTS5 index
+and its triggers exist), inserts --products rows spread over --stores
+stores, then times search queries.
+
+    python benchmarks/bench_search.py [--products 1000000] [--stores 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+# Setup Django
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+django.setup()
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.search import search_product_ids
+
+DISHES = ['pizza', 'burger', 'salad', 'pasta', 'taco', 'burrito', 'sushi', 'ramen',
+          'curry', 'sandwich', 'soup', 'wrap', 'bagel', 'muffin', 'cake', 'pie',
+          'noodles', 'dumplings', 'kebab', 'falafel', 'pho', 'bibimbap', 'paella']
+STYLES = ['margherita', 'pepperoni', 'veggie', 'spicy', 'classic', 'deluxe', 'smoky',
+          'crispy', 'grilled', 'garlic', 'truffle', 'lemon', 'honey', 'bbq', 'teriyaki']
+WORDS = ['fresh', 'homemade', 'organic', 'served', 'with', 'sauce', 'cheese', 'herbs',
+         'tomato', 'basil', 'onion', 'pepper', 'chicken', 'beef', 'tofu', 'rice']
+QUERIES = ['pizza', 'margherita pizza', 'marg', 'spicy ramen', 'tru', 'bbq chicken wrap',
+           'store 42', 'dumplings garlic', 'pa', 'falafel']
+
+
+def seed(n_products, n_stores, batch_size, rng):
+    now = timezone.now()
+    with connection.cursor() as cursor, transaction.atomic():
+        cursor.executemany(
+            "INSERT INTO accounts_user (password, is_superuser, username, first_name, last_name, "
+            "email, is_staff, is_active, date_joined, user_type, phone_number, address, "
+            "reporting_frequency, custom_reporting_days, token_version, created_at, updated_at) "
+            "VALUES ('', 0, %s, '', '', %s, 0, 1, %s, 'business', '', '', 'weekly', 7, 0, %s, %s)",
+            [(f'bench{i}', f'bench{i}@example.com', now, now, now) for i in range(n_stores)])
+        cursor.execute("SELECT id FROM accounts_user ORDER BY id")
+        user_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany(
+            "INSERT INTO api_store (business_id, name, description, address, phone, geohash, "
+            "is_active, created_at, updated_at) VALUES (%s, %s, '', '', '', '', 1, %s, %s)",
+            [(user_id, f'Store {i}', now, now) for i, user_id in enumerate(user_ids)])
+        cursor.execute("SELECT id FROM api_store ORDER BY id")
+        store_ids = [row[0] for row in cursor.fetchall()]
+
+        for offset in range(0, n_products, batch_size):
+            rows = []
+            for _ in range(min(batch_size, n_products - offset)):
+                name = f'{rng.choice(STYLES).title()} {rng.choice(DISHES).title()}'
+                description = ' '.join(rng.choices(WORDS, k=6))
+                rows.append((rng.choice(store_ids), name, description, now, now))
+            cursor.executemany(
+                "INSERT INTO api_product (store_id, name, description, price, image_url, "
+                "in_stock, stock_quantity, created_at, updated_at) "
+                "VALUES (%s, %s, %s, 9.99, '', 1, 10, %s, %s)", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--stores', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        t0 = time.perf_counter()
+        seed(args.products, args.stores, args.batch_size, random.Random(args.seed))
+        print(f"Seeded {args.products} products in {args.stores} stores "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                ids = search_product_ids(query, args.limit)
+                timings.append((time.perf_counter() - t0) * 1000)
+            timings.sort()
+            p50 = statistics.median(timings)
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            print(f"{query!r:24} {len(ids):3} hits  p50 {p50:8.2f} ms  p99 {p99:8.2f} ms")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
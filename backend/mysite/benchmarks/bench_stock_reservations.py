@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Concurrent order load test for stock reservations.
+
+Customers in worker threads place orders for a handful of scarce products
+through the full API stack (JWT auth, middleware, views) until everything
+has sold out. Meanwhile the store owner confirms some orders and cancels
+others through the bulk transition endpoint. At the end the reservation
+sweeper runs and the books are checked:
+
+  * no product's stock went negative, and in_stock matches it
+  * for every product, initial stock = stock left + stock held by
+    reservations, and held stock = quantities on orders not cancelled
+  * every created order has exactly one held-or-released reservation per
+    product it contains
+
+Runs against a fresh database file, with DB_PROFILE (default sqlite-prod)
+so it can be pointed at postgres too.
+
+    python benchmarks/bench_stock_reservations.py [--threads 8] [--products 5]
+        [--stock 200] [--cancel-ratio 0.2]
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import django
+
+tmp = tempfile.TemporaryDirectory()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('DB_PROFILE', 'sqlite-prod')
+os.environ.setdefault('SQLITE_PATH', os.path.join(tmp.name, 'bench.sqlite3'))
+django.setup()
+
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from django.test import Client
+
+from accounts.models import User
+from accounts.tokens import UserRefreshToken
+from api.models import Order, OrderItem, Product, StockReservation, Store
+
+
+def client_for(user):
+    access = UserRefreshToken.for_user(user).access_token
+    return Client(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+
+def seed(args):
+    business = User.objects.create_user(
+        username='stock-bench@example.com', email='stock-bench@example.com',
+        password='bench-pass-123', user_type='business')
+    store = Store.objects.create(business=business, name='Lunch Rush', address='1 Bench Way')
+    products = [Product.objects.create(store=store, name=f'Special {i}', price=10, stock_quantity=args.stock)
+                for i in range(args.products)]
+    customers = [User.objects.create_user(
+        username=f'stock-bench-{i}@example.com', email=f'stock-bench-{i}@example.com',
+        password='bench-pass-123', user_type='customer') for i in range(args.threads)]
+    return business, store, products, customers
+
+
+def check(store, initial):
+    failures = []
+    held = dict(StockReservation.objects.filter(order__store=store, status='held')
+                .values('product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+    ordered = dict(OrderItem.objects.filter(order__store=store).exclude(order__status='cancelled')
+                   .values('product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+    for product in Product.objects.filter(store=store):
+        if product.stock_quantity < 0:
+            failures.append(f'{product.name}: negative stock {product.stock_quantity}')
+        if product.in_stock != (product.stock_quantity > 0):
+            failures.append(f'{product.name}: in_stock={product.in_stock} with stock {product.stock_quantity}')
+        if product.stock_quantity + held.get(product.id, 0) != initial:
+            failures.append(f'{product.name}: {product.stock_quantity} left + {held.get(product.id, 0)} held '
+                            f'!= {initial} initial')
+        if held.get(product.id, 0) != ordered.get(product.id, 0):
+            failures.append(f'{product.name}: {held.get(product.id, 0)} held but '
+                            f'{ordered.get(product.id, 0)} on live orders')
+
+    items = Counter(OrderItem.objects.filter(order__store=store).values_list('order', 'product'))
+    reservations = Counter(StockReservation.objects.filter(order__store=store).values_list('order', 'product'))
+    if items != reservations:
+        failures.append(f'{len(set(items) ^ set(reservations))} order lines without exactly one reservation')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--products', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=200, help='Initial stock of each product')
+    parser.add_argument('--cancel-ratio', type=float, default=0.2,
+                        help='Share of orders the store cancels (the rest are confirmed)')
+    parser.add_argument('--max-seconds', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    business, store, products, customers = seed(args)
+    product_ids = [product.id for product in products]
+    connection.close()
+
+    lock = threading.Lock()
+    stats = Counter()
+    latencies = []
+    done = threading.Event()
+    deadline = time.perf_counter() + args.max_seconds
+
+    def customer(user, seed_value):
+        rng = random.Random(seed_value)
+        client = client_for(user)
+        sold_out_streak = 0
+        while not done.is_set() and time.perf_counter() < deadline and sold_out_streak < 20:
+            lines = [{'product_id': product_id, 'quantity': rng.randint(1, 3)}
+                     for product_id in rng.sample(product_ids, rng.randint(1, min(3, len(product_ids))))]
+            close_old_connections()
+            start = time.perf_counter()
+            try:
+                response = client.post('/api/orders/', data=json.dumps({
+                    'customer': user.id, 'store': store.id, 'delivery_address': 'x', 'items': lines,
+                }), content_type='application/json')
+                outcome = {201: 'created', 400: 'rejected'}.get(response.status_code, f'http_{response.status_code}')
+            except Exception as e:
+                outcome = type(e).__name__
+            finally:
+                close_old_connections()
+            elapsed = time.perf_counter() - start
+            sold_out_streak = sold_out_streak + 1 if outcome == 'rejected' else 0
+            with lock:
+                stats[outcome] += 1
+                latencies.append(elapsed)
+        connection.close()
+
+    def store_owner():
+        rng = random.Random(args.seed)
+        client = client_for(business)
+        while not done.is_set():
+            close_old_connections()
+            pending = list(Order.objects.filter(store=store, status='pending').values_list('id', 'version')[:50])
+            batches = {'cancelled': [], 'confirmed': []}
+            for order_id, version in pending:
+                target = 'cancelled' if rng.random() < args.cancel_ratio else 'confirmed'
+                batches[target].append({'id': order_id, 'version': version})
+            for target, batch in batches.items():
+                if not batch:
+                    continue
+                try:
+                    response = client.post('/api/orders/queue/transition/', data=json.dumps(
+                        {'status': target, 'orders': batch}), content_type='application/json')
+                    outcome = f'{target}_{response.status_code}'
+                except Exception as e:
+                    outcome = f'{target}_{type(e).__name__}'
+                with lock:
+                    stats[outcome] += len(batch) if outcome.endswith('200') else 1
+            close_old_connections()
+            time.sleep(0.05)
+        connection.close()
+
+    threads = [threading.Thread(target=customer, args=(user, args.seed + i)) for i, user in enumerate(customers)]
+    owner = threading.Thread(target=store_owner)
+    started = time.perf_counter()
+    owner.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    owner.join()
+    elapsed = time.perf_counter() - started
+
+    call_command('release_stock_reservations', '--no-expire', verbosity=0)
+    failures = check(store, args.stock)
+
+    latencies.sort()
+    print(f"{args.threads} customers, {args.products} products x {args.stock} stock, "
+          f"{connection.settings_dict['ENGINE'].rsplit('.', 1)[-1]} ({os.environ.get('DB_PROFILE')})")
+    print(f"{sum(stats[k] for k in ('created', 'rejected')) / elapsed:.0f} order attempts/s over {elapsed:.1f}s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.1f} ms")
+    print(', '.join(f'{key}: {value}' for key, value in sorted(stats.items())))
+    print(f"stock left: {dict(Product.objects.filter(store=store).values_list('name', 'stock_quantity'))}")
+    if failures:
+        print('FAILED:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+    print('OK: no overselling, stock and reservations balance')
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        tmp.cleanup()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Concurrent sales of a few popular inventory items, with the counters
+updated directly and with INVENTORY_WRITE_BEHIND.
+
+Each mode runs in its own subprocess against a fresh database file.
+Worker threads post sales through the full API stack (JWT auth,
+middleware, views); in write-behind mode a flusher thread runs
+flush_sale_deltas alongside them. After a final flush the books are
+checked for every item:
+
+  * total_sold equals the quantity of its Sale rows
+  * current_quantity equals its initial stock less total_sold, and is
+    not negative
+  * current_quantity equals its inventory ledger balance
+
+    python benchmarks/bench_write_behind.py [--threads 8] [--items 3] [--seconds 10]
+
+Runs with DB_PROFILE (default sqlite-prod). Exits with status 1 if any
+check fails.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('direct', 'write-behind')
+
+
+def run_worker(args):
+    import django
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import close_old_connections, connection
+    from django.db.models import Sum
+    from django.test import Client
+
+    from accounts.models import User
+    from accounts.tokens import UserRefreshToken
+    from api.inventory_buffer import flush_sale_deltas
+    from api.ledger import balances, receive_stock
+    from api.models import InventoryItem, Sale
+
+    call_command('migrate', verbosity=0)
+    business = User.objects.create_user(
+        username='wb-bench@example.com', email='wb-bench@example.com',
+        password='bench-pass-123', user_type='business')
+    items = [receive_stock(business, f'Hot item {i}', args.stock) for i in range(args.items)]
+    item_ids = [item.id for item in items]
+    access = UserRefreshToken.for_user(business).access_token
+    connection.close()
+
+    lock = threading.Lock()
+    latencies = []
+    outcomes = {}
+    done = threading.Event()
+
+    def seller(index):
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {access}')
+        n = 0
+        while not done.is_set():
+            item_id = item_ids[(index + n) % len(item_ids)]
+            n += 1
+            close_old_connections()
+            start = time.perf_counter()
+            try:
+                response = client.post('/api/sales/', data=json.dumps({'item': item_id, 'quantity': 1}),
+                                       content_type='application/json')
+                outcome = str(response.status_code)
+            except Exception as e:
+                outcome = type(e).__name__
+            finally:
+                close_old_connections()
+            elapsed = time.perf_counter() - start
+            with lock:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                latencies.append(elapsed)
+        connection.close()
+
+    def flusher():
+        while not done.is_set():
+            flush_sale_deltas()
+            close_old_connections()
+            time.sleep(args.flush_interval)
+        connection.close()
+
+    threads = [threading.Thread(target=seller, args=(i,)) for i in range(args.threads)]
+    if args.mode == 'write-behind':
+        threads.append(threading.Thread(target=flusher))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    done.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    while flush_sale_deltas():
+        pass
+
+    sold = dict(Sale.objects.values('item').annotate(total=Sum('quantity')).values_list('item', 'total'))
+    ledger = balances(InventoryItem.objects.filter(id__in=item_ids))
+    failures = []
+    for item in InventoryItem.objects.filter(id__in=item_ids):
+        if item.total_sold != sold.get(item.id, 0):
+            failures.append(f'{item.name}: total_sold {item.total_sold} but {sold.get(item.id, 0)} sold')
+        if item.current_quantity != args.stock - item.total_sold or item.current_quantity < 0:
+            failures.append(f'{item.name}: current_quantity {item.current_quantity} '
+                            f'with {item.total_sold} of {args.stock} sold')
+        if item.current_quantity != ledger[item.id]:
+            failures.append(f'{item.name}: current_quantity {item.current_quantity} '
+                            f'but ledger balance {ledger[item.id]}')
+
+    latencies.sort()
+    print(json.dumps({
+        'mode': args.mode,
+        'sales_per_second': outcomes.get('201', 0) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else None,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else None,
+        'outcomes': outcomes,
+        'failures': failures,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--items', type=int, default=3, help='Number of hot items sales are spread over')
+    parser.add_argument('--stock', type=int, default=10 ** 6, help='Initial stock of each item')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_worker(args)
+        return
+
+    results = []
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {
+                **os.environ,
+                'DB_PROFILE': os.environ.get('DB_PROFILE', 'sqlite-prod'),
+                'SQLITE_PATH': os.path.join(tmp, 'bench.sqlite3'),
+                'INVENTORY_WRITE_BEHIND': '1' if mode == 'write-behind' else '',
+            }
+            output = subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--threads', str(args.threads),
+                 '--items', str(args.items), '--stock', str(args.stock), '--seconds', str(args.seconds),
+                 '--flush-interval', str(args.flush_interval)],
+                env=env, capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{args.threads} threads selling {args.items} items for {args.seconds:.0f}s "
+          f"({os.environ.get('DB_PROFILE', 'sqlite-prod')})")
+    print(f"{'mode':<14}{'sales/s':>10}{'p50 ms':>10}{'p99 ms':>10}  outcomes")
+    for result in results:
+        print(f"{result['mode']:<14}{result['sales_per_second']:>10.0f}{result['p50_ms']:>10.1f}"
+              f"{result['p99_ms']:>10.1f}  {result['outcomes']}")
+    failures = [f"{result['mode']}: {failure}" for result in results for failure in result['failures']]
+    if failures:
+        print('FAILED:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+    print('OK: counters match the sales and the ledger in both modes')
+
+
+if __name__ == '__main__':
+    main()
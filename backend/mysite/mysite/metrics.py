@@ -0,0 +1,184 @@
+"""
+In-process request metrics, served in Prometheus text format at /metrics.
+
+Every thread records into its own shard of plain dicts, so recording
+takes no locks; a scrape sums the shards. Values are per process: with
+several worker processes, scrape each one (they are told apart by the
+`instance` label Prometheus adds).
+
+Recorded per request: latency by route, DB query count and time by route.
+Calls to upstream services (the AI assistant) are timed with
+time_upstream().
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route', LATENCY_BUCKETS),
+    'http_request_db_queries': ('histogram', 'Database queries per request by route', QUERY_COUNT_BUCKETS),
+    'db_queries_total': ('counter', 'Database queries by route', None),
+    'db_query_seconds_total': ('counter', 'Time spent in database queries by route', None),
+    'upstream_request_duration_seconds': ('histogram', 'Latency of calls to upstream services', LATENCY_BUCKETS),
+}
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        # key -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+
+
+_shards = []
+_local = threading.local()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        # list.append is atomic; shards of finished threads keep their totals
+        _shards.append(shard)
+    return shard
+
+
+def inc(name, labels, amount=1):
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, labels, value):
+    histograms = _shard().histograms
+    key = (name, labels)
+    row = histograms.get(key)
+    if row is None:
+        buckets = METRICS[name][2]
+        row = histograms[key] = [0] * (len(buckets) + 2)
+    # Non-cumulative here; made cumulative when rendered
+    row[bisect_left(METRICS[name][2], value)] += 1
+    row[-1] += value
+
+
+@contextmanager
+def time_upstream(service, operation):
+    """Time a call to an upstream service, labelled by whether it raised"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        observe('upstream_request_duration_seconds',
+                (('service', service), ('operation', operation), ('outcome', outcome)),
+                time.perf_counter() - start)
+
+
+def collect():
+    """Sum all shards into ({key: value}, {key: row})"""
+    counters = {}
+    histograms = {}
+    for shard in list(_shards):
+        for key, value in list(shard.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, row in list(shard.histograms.items()):
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = list(row)
+            else:
+                for i, value in enumerate(row):
+                    total[i] += value
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render():
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+            continue
+        for (metric, labels), row in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), row):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {row[-1]}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class _QueryTimer:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = _QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        # The URL pattern, not the path, keeps label cardinality bounded
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        observe('http_request_duration_seconds',
+                (('method', request.method), ('route', route), ('status', response.status_code)),
+                elapsed)
+        observe('http_request_db_queries', (('route', route),), queries.count)
+        inc('db_queries_total', (('route', route),), queries.count)
+        inc('db_query_seconds_total', (('route', route),), queries.seconds)
+        return response
@@ -0,0 +1,196 @@
+"""
+Opt-in request profiling and the slow-query log.
+
+A request is profiled when it carries "X-Profile: <PROFILING_TOKEN>" or is
+picked by PROFILING_SAMPLE_RATE. Its trace (cProfile .prof, or pyinstrument
+.html when PROFILING_ENGINE is 'pyinstrument' and it is installed) and a
+JSON log of every SQL query with timings go to PROFILING_DIR, which keeps
+only the newest PROFILING_KEEP traces. The response carries X-Profile-Id
+naming the files.
+
+Independently, every query slower than SLOW_QUERY_MS is logged to the
+"slow_queries" logger with the view code it came from.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+import traceback
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('slow_queries')
+
+# Slow queries are attributed to the innermost frame in one of these files,
+# or else to the innermost frame of project code
+SLOW_QUERY_ORIGINS = ('api/views.py', 'accounts/views.py')
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+def profiling_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+def should_profile(request):
+    token = getattr(settings, 'PROFILING_TOKEN', None)
+    if token and request.headers.get('X-Profile') == token:
+        return True
+    rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate
+
+
+class _SQLLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': None if many else repr(params),
+                'many': many,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+class _Profiler:
+    """cProfile, or pyinstrument when configured and installed"""
+
+    def __init__(self):
+        engine = getattr(settings, 'PROFILING_ENGINE', 'cprofile')
+        if engine == 'pyinstrument' and pyinstrument is not None:
+            self.profiler = pyinstrument.Profiler()
+            self.extension = 'html'
+        else:
+            self.profiler = cProfile.Profile()
+            self.extension = 'prof'
+
+    def start(self):
+        if self.extension == 'html':
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.extension == 'html':
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+    def write(self, path):
+        if self.extension == 'html':
+            path.write_text(self.profiler.output_html())
+        else:
+            self.profiler.dump_stats(str(path))
+
+
+def write_trace(profiler, summary):
+    """Write one trace and its SQL log, then drop the oldest beyond PROFILING_KEEP"""
+    directory = profiling_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    route = re.sub(r'[^A-Za-z0-9]+', '-', summary['route']).strip('-') or 'root'
+    trace_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{route[:60]}-{uuid.uuid4().hex[:8]}"
+
+    profiler.write(directory / f'{trace_id}.{profiler.extension}')
+    (directory / f'{trace_id}.sql.json').write_text(json.dumps(summary, indent=2))
+
+    keep = getattr(settings, 'PROFILING_KEEP', 50)
+    # Names start with the timestamp, so they sort oldest first
+    traces = sorted(path.name.split('.', 1)[0] for path in directory.glob('*.sql.json'))
+    for old_id in traces[:-keep] if keep else traces:
+        for path in directory.glob(f'{old_id}.*'):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+    return trace_id
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not should_profile(request):
+            return self.get_response(request)
+
+        sql_log = _SQLLog()
+        profiler = _Profiler()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sql_log))
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        summary = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'route': match.route if match is not None else 'unmatched',
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 3),
+            'query_count': len(sql_log.queries),
+            'query_ms': round(sum(query['ms'] for query in sql_log.queries), 3),
+            'queries': sql_log.queries,
+        }
+        try:
+            response['X-Profile-Id'] = write_trace(profiler, summary)
+        except OSError as e:
+            logger.error(f"Could not write profile trace: {str(e)}")
+        return response
+
+
+def _query_origin():
+    """The innermost view frame behind the current query, else the innermost project frame"""
+    stack = traceback.extract_stack()
+    fallback = None
+    for frame in reversed(stack):
+        filename = frame.filename.replace(os.sep, '/')
+        if filename.endswith(SLOW_QUERY_ORIGINS):
+            return f'{filename}:{frame.lineno} in {frame.name}'
+        if (fallback is None and frame.filename.startswith(PROJECT_ROOT)
+                and 'site-packages' not in filename and not filename.endswith('mysite/profiling.py')):
+            fallback = f'{filename}:{frame.lineno} in {frame.name}'
+    return fallback or 'unknown'
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= getattr(settings, 'SLOW_QUERY_MS', 200):
+            slow_query_logger.warning(
+                f"{elapsed_ms:.1f} ms [{context['connection'].alias}] from {_query_origin()}: {sql}")
+
+
+def watch_slow_queries(sender, connection, **kwargs):
+    """connection_created receiver installing the slow-query wrapper"""
+    if log_slow_queries not in connection.execute_wrappers:
+        # At the front: connections open lazily, possibly inside an
+        # execute_wrapper() block, which pops the last wrapper on exit
+        connection.execute_wrappers.insert(0, log_slow_queries)
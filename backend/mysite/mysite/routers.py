@@ -0,0 +1,127 @@
+"""
+Primary/replica database routing.
+
+Reads go to a replica only inside a safe (GET/HEAD/OPTIONS) request, and
+only until that request writes: the first write pins the rest of the
+request to the primary so it reads its own writes. Everything else,
+including management commands and background jobs, uses the primary.
+
+A write also pins the client that made it to the primary for
+DATABASE_REPLICA_PIN_SECONDS, which must be at least the replication
+lag, so its next reads (the report it just generated, the item it just
+added) don't come from a replica that hasn't caught up. The pin is a
+cookie, and for clients sending an Authorization header also a cache
+entry keyed on that header, as API clients usually don't keep cookies.
+Across processes the latter needs a shared cache (REDIS_URL).
+
+A request picks one replica and sticks to it, so all its reads come from
+the same snapshot.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_primary_pin'
+
+
+class _RoutingState:
+    __slots__ = ('replica', 'pinned')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.pinned = False
+
+
+# Holds a mutable state object rather than flags, so a write pin made in a
+# copied context (e.g. under sync_to_async) is seen by the whole request
+_routing = ContextVar('db_routing', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pin_seconds():
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+
+
+@contextmanager
+def replica_reads(replica=True):
+    """
+    Allow reads in this block to go to a replica until something writes.
+    Yields the routing state, whose `pinned` flag records that it did;
+    with replica=False reads stay on the primary but writes are recorded.
+    """
+    replicas = replica_aliases()
+    state = _RoutingState(random.choice(replicas) if replicas and replica else None)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def pin_to_primary():
+    state = _routing.get()
+    if state is not None:
+        state.pinned = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.pinned:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
+
+
+def _client_pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return 'db-pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+    return None
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        pin_key = _client_pin_key(request)
+        use_replica = (request.method in SAFE_METHODS
+                       and PIN_COOKIE not in request.COOKIES
+                       and not (pin_key and cache.get(pin_key)))
+        with replica_reads(use_replica) as state:
+            response = self.get_response(request)
+
+        if state.pinned:
+            seconds = _pin_seconds()
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+            if pin_key:
+                cache.set(pin_key, True, seconds)
+        return response
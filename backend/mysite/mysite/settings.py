@@ -14,6 +14,7 @@ from datetime import timedelta
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -58,11 +59,15 @@ AUTH_USER_MODEL = 'accounts.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Reverse proxies in front of the app whose X-Forwarded-For entries are
+    # trusted when throttles identify a client. With 0 the address is
+    # REMOTE_ADDR, so clients can't pick their own throttle bucket
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
 # JWT settings
@@ -73,6 +78,19 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# In-process cache of users resolved from access tokens (accounts/authentication.py)
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 60  # seconds
+
+# Login attempts per client IP and per email, as token buckets: up to
+# `capacity` attempts in a burst, refilled at `per_minute` (accounts/throttling.py).
+# Buckets live in the default cache, so set REDIS_URL to share them between workers
+# (check --deploy fails without a shared cache)
+LOGIN_THROTTLE_RATES = {
+    'ip': {'capacity': 20, 'per_minute': 10},
+    'email': {'capacity': 5, 'per_minute': 1},
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 CORS_ALLOW_CREDENTIALS = True
@@ -104,6 +122,9 @@ CORS_ALLOW_HEADERS = [
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.MetricsMiddleware',
+    'mysite.profiling.ProfilingMiddleware',
+    'mysite.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -114,6 +135,50 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Request profiling (mysite/profiling.py): a request is profiled when it
+# sends "X-Profile: <PROFILING_TOKEN>" or is sampled at PROFILING_SAMPLE_RATE.
+# Traces go to PROFILING_DIR, which keeps the newest PROFILING_KEEP of them
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_ENGINE = os.getenv('PROFILING_ENGINE', 'cprofile')  # or 'pyinstrument', if installed
+PROFILING_DIR = Path(os.getenv('PROFILING_DIR', BASE_DIR / 'profiles'))
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', 50))
+
+# Queries at least this slow are logged to the "slow_queries" logger
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+# Idempotency-Key handling for order and sale creation (api/idempotency.py).
+# Duplicates of a request still in progress wait up to IDEMPOTENCY_WAIT_SECONDS;
+# a claim older than IDEMPOTENCY_LOCK_SECONDS is assumed abandoned. Expired keys
+# are removed by the sweep_idempotency_keys command
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+# Orders still pending this long after being placed are cancelled, and their
+# reserved stock released, by the release_stock_reservations command
+STOCK_RESERVATION_MINUTES = int(os.getenv('STOCK_RESERVATION_MINUTES', 30))
+
+# With INVENTORY_WRITE_BEHIND on, sales append to a log instead of updating
+# their inventory item's counters (api/inventory_buffer.py). Run
+# `manage.py flush_sale_deltas --interval 5` to fold the log into the counters
+INVENTORY_WRITE_BEHIND = os.getenv('INVENTORY_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+
+# The snapshot_inventory command snapshots ledger balances as of this many
+# seconds ago, so movements still being committed are never skipped
+INVENTORY_SNAPSHOT_LAG_SECONDS = 60
+
+# Order event streams (api/events.py, served at /api/orders/events/ under ASGI).
+# The in-process broker only reaches streams in the same process; run a single
+# ASGI worker or set EVENTS_BROKER to a shared broker class
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'api.events.InProcessBroker')
+EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+EVENTS_REPLAY_BUFFER = int(os.getenv('EVENTS_REPLAY_BUFFER', 10000))
+EVENTS_QUEUE_SIZE = 100
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -136,13 +201,118 @@ WSGI_APPLICATION = 'mysite.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_PROFILE selects the configuration:
+#   sqlite       development default (rollback journal, connection per request)
+#   sqlite-prod  WAL, tuned pragmas, busy timeout and persistent connections
+#   postgres     PostgreSQL with a connection pool (needs psycopg[binary,pool])
+
+DB_PROFILE = os.getenv('DB_PROFILE', 'sqlite')
+SQLITE_PATH = os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
+
+if DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+        }
+    }
+elif DB_PROFILE == 'sqlite-prod':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': SQLITE_PATH,
+            'OPTIONS': {
+                # Seconds a connection waits on a locked database (busy_timeout)
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+                # Take the write lock when a transaction begins; a deferred
+                # transaction that reads first fails immediately with
+                # "database is locked" when it later tries to write
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+                    # Negative cache_size is in KiB
+                    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', 64 * 1024))};"
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+elif DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'byte2bite'),
+            'USER': os.getenv('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Connections are borrowed from a per-process pool instead of
+            # opened per request (CONN_MAX_AGE must stay 0 with a pool)
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+                },
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        f"Unknown DB_PROFILE {DB_PROFILE!r}; use sqlite, sqlite-prod or postgres")
+
+# Read replicas
+# DB_REPLICAS is a comma-separated list of replica database files (sqlite
+# profiles) or hosts (postgres). Safe requests read from a replica until
+# they write; see mysite/routers.py. For local testing with SQLite,
+# `python manage.py sync_replicas` copies the primary into the replicas.
+# A client that wrote reads from the primary for DB_REPLICA_PIN_SECONDS,
+# which must cover the replication lag.
+
+DATABASE_REPLICAS = []
+for index, location in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), 1):
+    replica = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DB_PROFILE == 'postgres':
+        replica['HOST'] = location.strip()
+    else:
+        options = dict(replica.get('OPTIONS', {}))
+        # Replicas only ever read; refuse writes that bypass the router
+        options.pop('transaction_mode', None)
+        options['init_command'] = options.get('init_command', '') + 'PRAGMA query_only=ON;'
+        replica.update(NAME=location.strip(), OPTIONS=options)
+    DATABASES[f'replica{index}'] = replica
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 10))
+DATABASE_ROUTERS = ['mysite.routers.PrimaryReplicaRouter']
+
+
+# Cache
+# In-process by default; set REDIS_URL to share the cache between workers
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
-}
+
+# Seconds a pre-rendered catalog response may stay cached (entries are
+# also invalidated immediately by Store/Product changes)
+CATALOG_CACHE_TIMEOUT = 3600
 
 
 # Password validation
@@ -181,7 +351,44 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Inventory report storage
+# Reports older than the retention window are deleted, and each business's
+# report files are kept under the disk quota by evicting the least recently
+# downloaded reports first.
+REPORT_RETENTION_DAYS = int(os.getenv('REPORT_RETENTION_DAYS', '365'))
+REPORT_DISK_QUOTA_BYTES = int(os.getenv('REPORT_DISK_QUOTA_BYTES', str(50 * 1024 * 1024)))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Logging
+# Slow queries go to the console, and also to SLOW_QUERY_LOG when set
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+if os.getenv('SLOW_QUERY_LOG'):
+    LOGGING['handlers']['slow_query_file'] = {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': os.getenv('SLOW_QUERY_LOG'),
+        'maxBytes': 10 * 1024 * 1024,
+        'backupCount': 5,
+    }
+    LOGGING['loggers']['slow_queries']['handlers'].append('slow_query_file')
@@ -0,0 +1,187 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import User
+
+from . import metrics
+from .routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaRoutingMiddleware
+
+router = PrimaryReplicaRouter()
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_REPLICA_PIN_SECONDS=30)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def respond(self, request, write=False):
+        """Run `request` through the middleware; returns (response, databases read from)"""
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(None))
+            if write:
+                router.db_for_write(None)
+                reads.append(router.db_for_read(None))
+            return HttpResponse()
+
+        return ReplicaRoutingMiddleware(view)(request), reads
+
+    def test_safe_requests_read_from_a_replica(self):
+        response, reads = self.respond(self.factory.get('/api/inventory/'))
+        self.assertEqual(reads, ['replica1'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_unsafe_requests_use_the_primary(self):
+        _, reads = self.respond(self.factory.post('/api/inventory/'))
+        self.assertEqual(reads, [None])
+
+    def test_write_pins_the_rest_of_the_request(self):
+        _, reads = self.respond(self.factory.get('/api/reports/1/download/'), write=True)
+        self.assertEqual(reads, ['replica1', None])
+
+    def test_write_pins_the_client_by_cookie(self):
+        response, _ = self.respond(self.factory.post('/api/reports/generate/'), write=True)
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 30)
+
+        request = self.factory.get('/api/reports/1/download/')
+        request.COOKIES[PIN_COOKIE] = cookie.value
+        self.assertEqual(self.respond(request)[1], [None])
+
+    def test_write_pins_the_client_by_credentials(self):
+        self.respond(self.factory.post('/api/inventory/', HTTP_AUTHORIZATION='Bearer one'), write=True)
+
+        _, reads = self.respond(self.factory.get('/api/inventory/', HTTP_AUTHORIZATION='Bearer one'))
+        self.assertEqual(reads, [None])
+        _, reads = self.respond(self.factory.get('/api/inventory/', HTTP_AUTHORIZATION='Bearer two'))
+        self.assertEqual(reads, ['replica1'])
+
+    def test_request_without_writes_does_not_pin(self):
+        response, _ = self.respond(self.factory.post('/api/inventory/', HTTP_AUTHORIZATION='Bearer one'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        _, reads = self.respond(self.factory.get('/api/inventory/', HTTP_AUTHORIZATION='Bearer one'))
+        self.assertEqual(reads, ['replica1'])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        response, reads = self.respond(self.factory.get('/api/inventory/'), write=True)
+        self.assertEqual(reads, [None, None])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_outside_requests_use_the_primary(self):
+        self.assertIsNone(router.db_for_read(None))
+        self.assertFalse(router.allow_migrate('replica1', 'api'))
+
+
+class MetricsTests(TestCase):
+    def observations(self, name, labels):
+        row = metrics.collect()[1].get((name, labels))
+        return sum(row[:-1]) if row else 0
+
+    def test_requests_are_recorded_by_route(self):
+        latency = ('http_request_duration_seconds',
+                   (('method', 'GET'), ('route', 'api/inventory/<int:pk>/'), ('status', 401)))
+        queries = ('http_request_db_queries', (('route', 'api/inventory/<int:pk>/'),))
+        seen = self.observations(*latency), self.observations(*queries)
+
+        # Labelled by URL pattern, not path
+        self.client.get('/api/inventory/1/')
+        self.client.get('/api/inventory/2/')
+        self.assertEqual((self.observations(*latency), self.observations(*queries)),
+                         (seen[0] + 2, seen[1] + 2))
+
+    def test_database_queries_are_counted(self):
+        user = User.objects.create_user(username='metrics@example.com', email='metrics@example.com',
+                                        password='test-pass-123', user_type='business')
+        client = APIClient()
+        client.force_authenticate(user)
+        counter = ('db_queries_total', (('route', 'api/inventory/'),))
+        counted = metrics.collect()[0].get(counter, 0)
+
+        with CaptureQueriesContext(connection) as captured:
+            client.get('/api/inventory/')
+        self.assertEqual(metrics.collect()[0][counter], counted + len(captured))
+
+    def test_unmatched_paths_share_one_label(self):
+        unmatched = ('http_request_db_queries', (('route', 'unmatched'),))
+        seen = self.observations(*unmatched)
+        self.client.get('/no-such-page/')
+        self.assertEqual(self.observations(*unmatched), seen + 1)
+
+    def test_histograms_render_cumulative_buckets(self):
+        labels = (('service', 'test-render'), ('operation', 'call'), ('outcome', 'ok'))
+        metrics.observe('upstream_request_duration_seconds', labels, 0.003)
+        metrics.observe('upstream_request_duration_seconds', labels, 0.2)
+        text = metrics.render()
+
+        prefix = 'upstream_request_duration_seconds_bucket{service="test-render",operation="call",outcome="ok",'
+        self.assertIn(prefix + 'le="0.005"} 1\n', text)
+        self.assertIn(prefix + 'le="0.25"} 2\n', text)
+        self.assertIn(prefix + 'le="+Inf"} 2\n', text)
+        self.assertIn('upstream_request_duration_seconds_count{service="test-render",operation="call",'
+                      'outcome="ok"} 2\n', text)
+
+    def test_upstream_errors_are_labelled(self):
+        failed = ('upstream_request_duration_seconds',
+                  (('service', 'test-upstream'), ('operation', 'chat'), ('outcome', 'error')))
+        with self.assertRaises(RuntimeError):
+            with metrics.time_upstream('test-upstream', 'chat'):
+                raise RuntimeError('upstream down')
+        self.assertEqual(self.observations(*failed), 1)
+
+    def test_endpoint_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+
+@override_settings(PROFILING_TOKEN='profile-me', PROFILING_SAMPLE_RATE=0, PROFILING_KEEP=2)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        user = User.objects.create_user(username='profiled@example.com', email='profiled@example.com',
+                                        password='test-pass-123', user_type='business')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def get(self, **headers):
+        with self.settings(PROFILING_DIR=self.directory):
+            return self.client.get('/api/inventory/', headers=headers)
+
+    def test_only_requests_with_the_token_are_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.get())
+        self.assertNotIn('X-Profile-Id', self.get(x_profile='wrong'))
+
+        trace_id = self.get(x_profile='profile-me')['X-Profile-Id']
+        self.assertTrue((self.directory / f'{trace_id}.prof').exists())
+        summary = json.loads((self.directory / f'{trace_id}.sql.json').read_text())
+        self.assertEqual((summary['route'], summary['status']), ('api/inventory/', 200))
+        self.assertEqual(summary['query_count'], len(summary['queries']))
+        self.assertGreater(summary['query_count'], 0)
+
+    def test_only_the_newest_traces_are_kept(self):
+        trace_ids = [self.get(x_profile='profile-me')['X-Profile-Id'] for _ in range(3)]
+        kept = {path.name.split('.', 1)[0] for path in self.directory.iterdir()}
+        self.assertEqual(kept, set(trace_ids[1:]))
+
+    def test_slow_queries_are_logged_with_their_view(self):
+        with self.settings(SLOW_QUERY_MS=0), self.assertLogs('slow_queries', 'WARNING') as logs:
+            self.get()
+        self.assertTrue(any('api/views.py' in line and 'api_inventoryitem' in line for line in logs.output))
+
+    def test_fast_queries_are_not_logged(self):
+        with self.settings(SLOW_QUERY_MS=10 ** 6), self.assertNoLogs('slow_queries'):
+            self.get()